@@ -0,0 +1,239 @@
+import asyncio
+from collections import deque
+
+try:
+    from .intcode import IntcodeComputer, HALTED, BUDGET_USED
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer, HALTED, BUDGET_USED
+
+DEFAULT_BATCH_SIZE = 10000  # instructions a machine runs before giving the other machines on the event loop a turn
+DEFAULT_CHANNEL_SIZE = 1024  # values a channel holds before writers have to wait for a reader
+STARVED = "starved"  # run_async() status of a machine that needed input its input channel will never give it
+
+
+class ChannelClosed(Exception):
+    # raised when reading from a channel that's been closed and has nothing left in it
+    pass
+
+
+class NetworkDeadlock(Exception):
+    # raised by run_network() when every machine still running is waiting on a channel no other machine will ever fill
+    # or empty
+    def __init__(self, waiting):
+        super().__init__("Every running machine is waiting on a channel, machines {} are deadlocked".format(waiting))
+        self.waiting = waiting  # indices of the deadlocked machines
+
+
+class Channel():
+    # FIFO of values connecting the output of one machine to the input of another. Writers wait when the channel is full
+    # and readers wait when it's empty, a machine closes its output channel when it halts
+    def __init__(self, maxsize=DEFAULT_CHANNEL_SIZE):
+        self._maxsize = maxsize  # 0 means the channel never fills up
+        self._values = deque()
+        self._closed = False
+        self._changed = asyncio.Event()  # set whenever a value is added or removed or the channel is closed
+        self._last_value = None  # the most recent value written to the channel
+        self._n_values = 0  # total number of values ever written to the channel
+
+    async def put(self, value):
+        while self._maxsize and len(self._values) >= self._maxsize:
+            await self._wait()
+        self.put_nowait(value)
+
+    def put_nowait(self, value):
+        if self._closed:
+            raise ChannelClosed("Tried to write to a closed channel")
+        self._values.append(value)
+        self._last_value = value
+        self._n_values += 1
+        self._notify()
+
+    async def get(self):
+        while not self._values:
+            if self._closed:
+                raise ChannelClosed("Tried to read from a closed channel")
+            await self._wait()
+        value = self._values.popleft()
+        self._notify()
+        return value
+
+    def drain(self):
+        # removes and returns every value currently in the channel without waiting
+        values = list(self._values)
+        self._values.clear()
+        self._notify()
+        return values
+
+    def close(self):
+        self._closed = True
+        self._notify()
+
+    async def _wait(self):
+        self._changed.clear()
+        await self._changed.wait()
+
+    def _notify(self):
+        self._changed.set()
+
+    # Object Properties
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def full(self):
+        # True when a writer would have to wait
+        return bool(self._maxsize) and len(self._values) >= self._maxsize
+
+    @property
+    def last_value(self):
+        return self._last_value
+
+    @property
+    def n_values(self):
+        return self._n_values
+
+    def __len__(self):
+        return len(self._values)
+
+
+class AsyncIntcodeComputer(IntcodeComputer):
+    # Intcode computer that reads its input from a channel and writes its output to a channel so networks of machines
+    # can run together on one event loop. The machine runs normally until it blocks on an input instruction, then awaits
+    # its input channel. Every batch_size instructions it hands control back to the event loop so a busy machine can't
+    # starve the others. Anything pushed with input() is read before the input channel. engine and overflow are passed
+    # on to IntcodeComputer
+    def __init__(self, software=[], verbose=False, engine="compiled", overflow="checked", input_channel=None,
+                 output_channel=None, batch_size=DEFAULT_BATCH_SIZE, close_on_halt=True):
+        self.input_channel = input_channel
+        self.output_channel = output_channel
+        self._batch_size = batch_size
+        self._close_on_halt = close_on_halt  # close the output channel when the program halts
+        super().__init__(software, verbose, engine, overflow)
+
+    async def run_async(self, network=None):
+        # runs the computer until it halts (returns HALTED) or needs input its input channel will never give it because
+        # it doesn't have one or it was closed (returns STARVED). The output channel is closed (if close_on_halt is set)
+        # however the machine stops, even on an error, so the machines after it are never left waiting on it. network is
+        # the _Network run_network() uses to spot deadlocks
+        self._running = True
+        status = STARVED
+        try:
+            while not self._program_finished:
+                status = self.run(max_cycles=self._batch_size)
+                if self.output_channel is not None:
+                    for value in self.flush_output():
+                        await self._wait_on(network, self.output_channel, value)
+                if status == HALTED:
+                    break
+                if status == BUDGET_USED:
+                    await asyncio.sleep(0)  # used up the batch, give the other machines a turn
+                else:
+                    # blocked on an input instruction, wait for a value and then take everything that's available
+                    if self.input_channel is None:
+                        return STARVED
+                    try:
+                        value = await self._wait_on(network, self.input_channel)
+                    except ChannelClosed:
+                        return STARVED
+                    self.input(value)
+                    for value in self.input_channel.drain():
+                        self.input(value)
+                    self._running = True
+            return HALTED
+        finally:
+            if network is not None:
+                network.stopped(self)
+            if self._close_on_halt and self.output_channel is not None:
+                self.output_channel.close()
+
+    async def _wait_on(self, network, channel, value=None):
+        # puts value on channel (or gets a value from it when value is None), telling the network while the machine is
+        # blocked on it
+        writing = value is not None
+        operation = channel.put(value) if writing else channel.get()
+        if network is None or not (channel.full if writing else not len(channel)):
+            return await operation
+        network.waiting(self, channel, writing)
+        try:
+            return await operation
+        finally:
+            network.resumed(self)
+
+
+class _Network():
+    # tracks which machines in a run_network() call are blocked on a channel. A machine is only counted as blocked while
+    # the channel it's waiting on is still empty (or full for a write) so values that have been written but not read yet
+    # don't look like a deadlock. Everything runs on one event loop so the check sees a consistent state
+    def __init__(self, machines):
+        self._machines = list(machines)
+        self._running = set(range(len(self._machines)))  # indices of machines that haven't stopped
+        self._waiting = {}  # index of each machine awaiting a channel -> (channel, True if it's writing to it)
+        self.deadlocked = asyncio.Event()
+
+    def waiting(self, machine, channel, writing):
+        self._waiting[self._index(machine)] = (channel, writing)
+        self._check()
+
+    def resumed(self, machine):
+        self._waiting.pop(self._index(machine), None)
+
+    def stopped(self, machine):
+        index = self._index(machine)
+        self._running.discard(index)
+        self._waiting.pop(index, None)
+        self._check()
+
+    def blocked(self):
+        # indices of the machines waiting on a channel that's still empty (or full for a write)
+        blocked = []
+        for index, (channel, writing) in self._waiting.items():
+            if not channel.closed and (channel.full if writing else not len(channel)):
+                blocked.append(index)
+        return sorted(blocked)
+
+    def _check(self):
+        if self._running and self._running == set(self.blocked()):
+            self.deadlocked.set()
+
+    def _index(self, machine):
+        return next(index for index, other in enumerate(self._machines) if other is machine)
+
+
+def connect(machines, loop=False, maxsize=DEFAULT_CHANNEL_SIZE):
+    # wires a list of machines into a chain, each machine's output feeds the next machine's input. With loop=True the
+    # last machine feeds back into the first one. Returns the list of channels, channels[j] is machine j's input
+    channels = [Channel(maxsize) for _ in machines]
+    if not loop:
+        channels.append(Channel(maxsize))  # the output of the end of the chain
+    for j, machine in enumerate(machines):
+        machine.input_channel = channels[j]
+        machine.output_channel = channels[(j + 1) % len(channels)]
+    return channels
+
+
+async def run_network(machines, detect_deadlock=True):
+    # runs a group of connected machines on the current event loop until every one of them halts or is starved of input,
+    # returns the run_async() status of each machine. If every machine still running ends up waiting on a channel that
+    # no other machine will fill or empty the network is deadlocked, the machines are cancelled and NetworkDeadlock is
+    # raised. Detection assumes only the machines write to the channels once the network is running (values put before
+    # it starts are fine), pass detect_deadlock=False when something else feeds them
+    if not detect_deadlock:
+        return await asyncio.gather(*(machine.run_async() for machine in machines))
+    network = _Network(machines)
+    tasks = [asyncio.ensure_future(machine.run_async(network)) for machine in machines]
+    deadlock = asyncio.ensure_future(network.deadlocked.wait())
+    try:
+        pending = set(tasks)
+        while pending:
+            done, _ = await asyncio.wait(pending | {deadlock}, return_when=asyncio.FIRST_COMPLETED)
+            if deadlock in done:
+                waiting = network.blocked()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise NetworkDeadlock(waiting)
+            pending -= done
+        return [task.result() for task in tasks]
+    finally:
+        deadlock.cancel()
@@ -0,0 +1,193 @@
+import numpy as np
+
+# number of parameters each opcode takes
+_n_params = {1: 3, 2: 3, 3: 1, 4: 1, 5: 2, 6: 2, 7: 3, 8: 3, 9: 1, 99: 0}
+
+
+class BatchComputer():
+    # Runs many copies (lanes) of one intcode program at once using numpy.
+    # Every lane has its own row in an N x memory matrix plus its own program counter, relative offset and input/output
+    # buffers. Each step the lanes sitting on the lowest program counter are picked and executed together as vectorized
+    # operations (lanes at the same address but with different instruction words are split up). Always advancing the
+    # lanes that are furthest behind lets lanes that took different branches line up again when the branches rejoin.
+    # Arithmetic is done in int64 and wraps on overflow
+    def __init__(self, software, n_lanes=None):
+        software = np.asarray(software, dtype=np.int64)
+        if software.ndim == 1:
+            # the same program for every lane
+            software = np.tile(software, (1 if n_lanes is None else n_lanes, 1))
+        elif n_lanes is not None and n_lanes != software.shape[0]:
+            raise ValueError("Got {} lanes of software but asked for {} lanes".format(software.shape[0], n_lanes))
+        self._software = software  # one row of starting memory per lane, lanes can be patched individually
+        self.reset()
+
+    def reset(self):
+        n_lanes = self._software.shape[0]
+        self._memory = self._software.copy()
+        self._lanes = np.arange(n_lanes)
+        self._pc = np.zeros(n_lanes, dtype=np.int64)
+        self._relative_offset = np.zeros(n_lanes, dtype=np.int64)
+        self._cycle_count = np.zeros(n_lanes, dtype=np.int64)
+        self._halted = np.zeros(n_lanes, dtype=bool)
+        self._waiting = np.zeros(n_lanes, dtype=bool)  # lanes blocked on an input instruction with nothing to read
+
+        # inputs and outputs are stored in matrices that grow as needed, with a read/write position for every lane
+        self._input_buffer = np.zeros((n_lanes, 0), dtype=np.int64)
+        self._input_count = np.zeros(n_lanes, dtype=np.int64)
+        self._input_position = np.zeros(n_lanes, dtype=np.int64)
+        self._output_buffer = np.zeros((n_lanes, 0), dtype=np.int64)
+        self._output_count = np.zeros(n_lanes, dtype=np.int64)
+
+    def input(self, values):
+        # pushes inputs onto every lane, values is either a single value for all lanes, one value per lane or a matrix
+        # with a row of values for every lane
+        values = np.asarray(values, dtype=np.int64)
+        if values.ndim == 0:
+            values = np.full((self.n_lanes, 1), values)
+        elif values.ndim == 1:
+            values = values.reshape(-1, 1)
+        if values.shape[0] != self.n_lanes:
+            raise ValueError("Expected inputs for {} lanes, got {}".format(self.n_lanes, values.shape[0]))
+        needed = int(self._input_count.max(initial=0)) + values.shape[1]
+        if needed > self._input_buffer.shape[1]:
+            self._input_buffer = _grow_columns(self._input_buffer, needed)
+        for column in range(values.shape[1]):
+            self._input_buffer[self._lanes, self._input_count + column] = values[:, column]
+        self._input_count += values.shape[1]
+        self._waiting[:] = False  # lanes that were blocked get another try at reading
+
+    def flush_output(self):
+        # returns a list with an array of the outputs from every lane and clears the output buffers
+        outputs = [self._output_buffer[lane, :self._output_count[lane]].copy() for lane in self._lanes]
+        self._output_count[:] = 0
+        return outputs
+
+    def run(self, max_steps=None):
+        # runs every lane until it halts or blocks waiting for input, returns the memory matrix
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            active = self._lanes[~(self._halted | self._waiting)]
+            if active.size == 0:
+                break
+            program_counters = self._pc[active]
+            pc = int(program_counters.min())
+            lanes = active[program_counters == pc]
+            self._ensure_size(pc + 4)  # make sure the longest instruction fits in memory
+            words = self._memory[lanes, pc]
+            for word in np.unique(words):
+                self._execute(lanes[words == word], pc, int(word))
+            steps += 1
+        return self._memory
+
+    def _ensure_size(self, size):
+        # grows the memory matrix so it holds at least size words per lane
+        if size > self._memory.shape[1]:
+            self._memory = _grow_columns(self._memory, size)
+
+    def _address(self, lanes, pc, mode, parameter):
+        # the memory address each lane's parameter refers to
+        if mode == 0:
+            addresses = self._memory[lanes, pc + 1 + parameter]
+        elif mode == 1:
+            return np.full(lanes.size, pc + 1 + parameter, dtype=np.int64)
+        elif mode == 2:
+            addresses = self._memory[lanes, pc + 1 + parameter] + self._relative_offset[lanes]
+        else:
+            raise ValueError("Loaded an Invalid parameter mode from memory address {}, got: {}".format(
+                pc + 1, self._memory[lanes[0], pc]))
+        if addresses.size and addresses.min() < 0:
+            raise ValueError("Tried to access a negative memory address: {}".format(addresses.min()))
+        if addresses.size:
+            self._ensure_size(int(addresses.max()) + 1)
+        return addresses
+
+    def _execute(self, lanes, pc, word):
+        # executes the instruction word at address pc on a group of lanes
+        opcode = word % 100
+        try:
+            n_params = _n_params[opcode]
+        except KeyError:
+            raise ValueError("Loaded an Invalid Opcode from memory address {}, got: {}".format(pc + 1, opcode))
+        modes = [(word // 10 ** (parameter + 2)) % 10 for parameter in range(n_params)]
+        addresses = [self._address(lanes, pc, modes[parameter], parameter) for parameter in range(n_params)]
+        memory = self._memory
+
+        def read(parameter):
+            return memory[lanes, addresses[parameter]]
+
+        next_pc = pc + 1 + n_params
+        if opcode == 1:
+            memory[lanes, addresses[2]] = read(0) + read(1)
+        elif opcode == 2:
+            memory[lanes, addresses[2]] = read(0) * read(1)
+        elif opcode == 7:
+            memory[lanes, addresses[2]] = read(0) < read(1)
+        elif opcode == 8:
+            memory[lanes, addresses[2]] = read(0) == read(1)
+        elif opcode == 3:
+            has_input = self._input_position[lanes] < self._input_count[lanes]
+            self._waiting[lanes[~has_input]] = True  # lanes with nothing to read stay on this instruction
+            lanes, target = lanes[has_input], addresses[0][has_input]
+            memory[lanes, target] = self._input_buffer[lanes, self._input_position[lanes]]
+            self._input_position[lanes] += 1
+        elif opcode == 4:
+            needed = int(self._output_count[lanes].max()) + 1
+            if needed > self._output_buffer.shape[1]:
+                self._output_buffer = _grow_columns(self._output_buffer, needed)
+            self._output_buffer[lanes, self._output_count[lanes]] = read(0)
+            self._output_count[lanes] += 1
+        elif opcode == 5:
+            next_pc = np.where(read(0) != 0, read(1), next_pc)
+        elif opcode == 6:
+            next_pc = np.where(read(0) == 0, read(1), next_pc)
+        elif opcode == 9:
+            self._relative_offset[lanes] += read(0)
+        elif opcode == 99:
+            self._halted[lanes] = True
+        self._pc[lanes] = next_pc
+        self._cycle_count[lanes] += 1
+
+    # Object Properties
+    @property
+    def n_lanes(self):
+        return self._software.shape[0]
+
+    @property
+    def memory(self):
+        # N x memory matrix holding every lane's memory
+        return self._memory
+
+    @property
+    def halted(self):
+        # boolean array of which lanes have run opcode 99
+        return self._halted.copy()
+
+    @property
+    def waiting_for_input(self):
+        # boolean array of which lanes are blocked on an input instruction
+        return self._waiting.copy()
+
+    @property
+    def cycle_count(self):
+        # array of how many instructions each lane has executed
+        return self._cycle_count.copy()
+
+
+def _grow_columns(matrix, size):
+    # returns a copy of a matrix with extra zeroed columns so it's at least size columns wide, at least doubling it
+    grown = np.zeros((matrix.shape[0], max(size, 2 * matrix.shape[1])), dtype=matrix.dtype)
+    grown[:, :matrix.shape[1]] = matrix
+    return grown
+
+
+def run_batch(software, inputs=None, n_lanes=None):
+    # runs a program on many lanes at once and returns a list of each lane's outputs along with the final memory matrix.
+    # software is either one program shared by every lane or a matrix with a row of starting memory per lane, inputs is
+    # an optional matrix with a row of input values per lane
+    if inputs is not None and n_lanes is None and np.ndim(software) == 1:
+        n_lanes = np.shape(inputs)[0]
+    computer = BatchComputer(software, n_lanes)
+    if inputs is not None:
+        computer.input(inputs)
+    memory = computer.run()
+    return computer.flush_output(), memory
@@ -0,0 +1,365 @@
+import copy
+import importlib
+import io
+import os
+import pickle
+import sys
+import struct
+import time
+import zlib
+import hashlib
+from array import array
+import numpy as np
+
+try:
+    from .intcode import IntcodeComputer
+    from .memory import MemorySnapshot, OverlayPage, PAGE_SIZE
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer
+    from memory import MemorySnapshot, OverlayPage, PAGE_SIZE
+
+# On disk checkpoints of a running computer so long interactive runs can be stopped and picked up again later.
+# A checkpoint file is a header followed by records, each record is a length, a crc32 and a pickled
+#   (new pages, state changes, memory)
+# The state is every attribute of the computer fork() would copy (so subclass state like a robot's position or map comes
+# along) and memory is the page table and which pages are dirty. A record only holds the attributes that changed since
+# the one before it: lists are stored item by item and written from the first item that changed, dicts key by key with
+# only the keys that were added, changed or removed, anything else is written whole when it changes. A long stack like
+# RepairDroid's backtracking history or a growing map only costs what was pushed or added since the last checkpoint.
+# Memory pages are pickled as references: pages of the program image by number and every other page by an id, the first
+# record that uses a page carries its contents (only the words written over the page under it for an overlay page).
+# Pages are never written once a checkpoint holds them (saving makes every page shared copy on write, the way a snapshot
+# does), so a checkpoint only writes the pages changed since the last one, and pages shared with snapshots held in the
+# subclass's state are stored once.
+# Loading replays every record up to the last complete one, a record cut short by a crash is ignored. Once the file
+# holds more than compact_ratio times the pages the latest checkpoint uses, or is more than compact_ratio times the size
+# a single full checkpoint would be, it's rewritten from scratch with a single full checkpoint, swapped in atomically.
+# The header names the computer class as "module:qualname" so it can be imported again by whatever loads the file, a
+# class defined in a script that was run directly is named after the script's file
+FILE_MAGIC = b"INTCKPT\0"
+FILE_VERSION = 2
+FILE_HEADER = struct.Struct("<8sI")  # magic, version
+RECORD_HEADER = struct.Struct("<QI")  # payload length, crc32 of the payload
+PAGE_REFERENCE = "page"
+IMAGE_REFERENCE = "image"
+VALUE, LIST, DICT, DELETE = "value", "list", "dict", "delete"  # kinds of state change in a record
+
+_page_types = (array, memoryview, OverlayPage)  # types that are always memory pages, wherever they turn up in the state
+
+# attributes that aren't part of a checkpoint, on top of what fork() shares: the memory is stored page by page, the
+# profiler is tied to the run that made it, and the engine and hooks are whatever the loading computer was set up with
+_excluded_attributes = IntcodeComputer._fork_shared_attributes | {"_memory", "_profiler", "_engine_name", "_hooked"}
+
+
+def class_name(computer_class):
+    # importable "module:qualname" name of a class. Classes of a script run directly live in __main__, which is a
+    # different module to every other entry point, so they're named after the module the script would be imported as
+    module = computer_class.__module__
+    if module == "__main__":
+        module = _main_module_name()
+    return "{}:{}".format(module, computer_class.__qualname__)
+
+
+def import_class(name):
+    # the class named by class_name(), its module has to be importable from wherever the checkpoint is loaded
+    module_name, qualname = name.split(":")
+    if module_name == _main_module_name():
+        target = sys.modules["__main__"]  # loaded by the script that saved it, importing it again would copy the class
+    else:
+        try:
+            target = importlib.import_module(module_name)
+        except ImportError as error:
+            raise ValueError("Checkpoint is of a {}, which can't be imported: {}".format(name, error))
+    for attribute in qualname.split("."):
+        target = getattr(target, attribute, None)
+        if target is None:
+            raise ValueError("Checkpoint is of a {}, which doesn't exist".format(name))
+    return target
+
+
+def _main_module_name():
+    # the name the script being run would have if it was imported, None in an interactive session
+    main = sys.modules.get("__main__")
+    spec = getattr(main, "__spec__", None)
+    if spec is not None and spec.name:
+        return spec.name  # run with python -m
+    if getattr(main, "__file__", None):
+        return os.path.splitext(os.path.basename(main.__file__))[0]
+    return None
+
+
+class _StatePickler(pickle.Pickler):
+    def __init__(self, file, writer):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._writer = writer
+
+    def persistent_id(self, obj):
+        return self._writer._reference(obj)
+
+
+class _StateUnpickler(pickle.Unpickler):
+    def __init__(self, file, image_pages, pages):
+        super().__init__(file)
+        self._image_pages = image_pages
+        self._pages = pages
+
+    def persistent_load(self, reference):
+        kind, number = reference
+        return self._image_pages[number] if kind == IMAGE_REFERENCE else self._pages[number]
+
+
+class CheckpointWriter():
+    # writes checkpoints of a computer to path. interval is how many seconds maybe_save() leaves between checkpoints
+    def __init__(self, computer, path, interval=5.0, compact_ratio=4):
+        self._computer = computer
+        self._path = str(path)
+        self._interval = interval
+        self._compact_ratio = compact_ratio
+        self._file = None
+        self._file_bytes = 0  # size of the checkpoints in the current file
+        self._file_checkpoints = 0  # checkpoints in the current file
+        self._last_save = time.monotonic()
+        self._n_checkpoints = 0
+        self._bytes_written = 0
+        self._start_file()
+
+    def save(self):
+        # appends a checkpoint of the computer's current state, returns the number of bytes written
+        computer = self._computer
+        memory = computer._memory
+        self._new_pages = {}
+        self._used_pages = set()
+        self._live_ids = {id(page) for page in memory._pages.values()}  # catches unbounded memory's list pages
+        state = {name: value for name, value in vars(computer).items() if name not in _excluded_attributes}
+        snapshot = memory.snapshot()  # the pages saved are shared from now on, writes copy them instead of changing them
+        self._state_bytes = 0
+        changes = self._state_changes(state)
+        memory_state = self._dumps((snapshot.pages, set(snapshot.dirty)))
+
+        payload = pickle.dumps((self._new_pages, changes, memory_state), pickle.HIGHEST_PROTOCOL)
+        written = RECORD_HEADER.size + len(payload)
+        self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._file.flush()
+        self._n_checkpoints += 1
+        self._bytes_written += written
+        self._file_bytes += written
+        self._file_checkpoints += 1
+        self._last_save = time.monotonic()
+        self._new_pages = self._live_ids = None
+        # what a file holding just this checkpoint would take, near enough
+        full_size = self._state_bytes + len(memory_state) + 8 * PAGE_SIZE * len(self._used_pages)
+        if self._file_checkpoints > 1 and (len(self._file_pages) > self._compact_ratio * max(1, len(self._used_pages)) or
+                                           self._file_bytes > self._compact_ratio * full_size):
+            self._compact()
+        return written
+
+    def maybe_save(self):
+        # saves a checkpoint if at least interval seconds have gone by since the last one, returns True if it did. Cheap
+        # enough to call every time round a driver loop
+        if time.monotonic() - self._last_save < self._interval:
+            return False
+        self.save()
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _start_file(self, path=None):
+        # opens a new checkpoint file, the program image is written once at the start of every file so it can be
+        # loaded without the original program
+        computer = self._computer
+        self._file = open(self._path if path is None else path, "wb")
+        self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION))
+        image = np.array(computer.memory.image)
+        header = pickle.dumps({"class": class_name(type(computer)), "software": image, "overflow": computer.overflow,
+                               "digest": hashlib.sha256(image.tobytes()).hexdigest()}, pickle.HIGHEST_PROTOCOL)
+        self._file.write(RECORD_HEADER.pack(len(header), zlib.crc32(header)) + header)
+        self._file_bytes = 0
+        self._file_checkpoints = 0
+        self._file_pages = {}  # page id -> page for every page written to the current file
+        self._page_ids = {}  # id() of every page written to the current file -> page id
+        self._image_ids = {id(page): number for number, page in enumerate(computer._memory._image_pages)}
+        # attribute -> what the current file holds for it: (LIST, hash of each item), (DICT, type, key -> hash of
+        # value) or (VALUE, hash)
+        self._written = {}
+
+    def _state_changes(self, state):
+        # the changes to write to bring the state the file holds up to date with state, as a list of
+        # (attribute, kind, ...) tuples. Adds up the size of the whole state in _state_bytes as it goes
+        changes = []
+        for name in self._written.keys() - state.keys():
+            changes.append((name, DELETE))
+            del self._written[name]
+        for name, value in state.items():
+            written = self._written.get(name)
+            if type(value) is list:
+                items = [self._dumps(item) for item in value]
+                hashes = [hashlib.sha1(item).digest() for item in items]
+                self._state_bytes += sum(map(len, items))
+                if written is None or written[0] != LIST:
+                    start = 0
+                else:
+                    start = next((n for n, (old, new) in enumerate(zip(written[1], hashes)) if old != new),
+                                 min(len(written[1]), len(hashes)))
+                    if start == len(hashes) == len(written[1]):
+                        continue
+                changes.append((name, LIST, start, items[start:]))
+                self._written[name] = (LIST, hashes)
+            elif isinstance(value, dict) and type(value) not in _page_types:
+                if written is None or written[0] != DICT or written[1] is not type(value):
+                    shell = copy.copy(value)  # keeps what makes up the dict other than its items, like a default factory
+                    shell.clear()
+                    changes.append((name, VALUE, self._dumps(shell)))
+                    written = self._written[name] = (DICT, type(value), {})
+                hashes = written[2]
+                updates = []
+                for key, item in value.items():
+                    item = self._dumps(item)
+                    item_hash = hashlib.sha1(item).digest()
+                    self._state_bytes += len(item)
+                    if hashes.get(key) != item_hash:
+                        updates.append((self._dumps(key), item))
+                        hashes[key] = item_hash
+                removed = [self._dumps(key) for key in hashes.keys() - value.keys()]
+                for key in hashes.keys() - value.keys():
+                    del hashes[key]
+                if updates or removed:
+                    changes.append((name, DICT, updates, removed))
+            else:
+                item = self._dumps(value)
+                item_hash = hashlib.sha1(item).digest()
+                self._state_bytes += len(item)
+                if written != (VALUE, item_hash):
+                    changes.append((name, VALUE, item))
+                    self._written[name] = (VALUE, item_hash)
+        return changes
+
+    def _dumps(self, value):
+        # pickles part of the state, memory pages in it are pickled as references
+        buffer = io.BytesIO()
+        _StatePickler(buffer, self).dump(value)
+        return buffer.getvalue()
+
+    def _compact(self):
+        # rewrites the file as a single checkpoint of the current state
+        temporary_path = "{}.{}.tmp".format(self._path, os.getpid())
+        self._file.close()
+        self._start_file(temporary_path)
+        self.save()
+        os.replace(temporary_path, self._path)
+
+    def _reference(self, obj):
+        # persistent id of a memory page, None for anything else
+        number = self._image_ids.get(id(obj))
+        if number is not None:
+            return IMAGE_REFERENCE, number
+        if type(obj) not in _page_types and id(obj) not in self._live_ids and id(obj) not in self._page_ids:
+            return None
+        page_id = self._page_ids.get(id(obj))
+        if page_id is None:
+            if type(obj) is OverlayPage:
+                # just the words written over the page under it, which is stored (once) as a page of its own
+                page = (self._reference(obj.base), obj.page_number, dict(obj))
+            else:
+                page = array('q', obj.tobytes()) if type(obj) is memoryview else obj
+            page_id = len(self._page_ids)
+            self._page_ids[id(obj)] = page_id
+            self._new_pages[page_id] = page
+            self._file_pages[page_id] = obj  # keeps the page alive so its id() can't be reused
+        self._used_pages.add(page_id)
+        return PAGE_REFERENCE, page_id
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def n_checkpoints(self):
+        # checkpoints saved by this writer
+        return self._n_checkpoints
+
+    @property
+    def bytes_written(self):
+        return self._bytes_written
+
+
+def load_checkpoint(path, computer=None):
+    # restores the last complete checkpoint in a file. The computer has to be of the class that was checkpointed and
+    # loaded with the same program, without one a computer is made by calling the class with the program. Returns the
+    # computer
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, version = FILE_HEADER.unpack_from(data)
+    if magic != FILE_MAGIC or version != FILE_VERSION:
+        raise ValueError("{} isn't a version {} checkpoint file".format(path, FILE_VERSION))
+    records = []
+    offset = FILE_HEADER.size
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            break  # the rest of the file was cut short
+        records.append(payload)
+        offset += RECORD_HEADER.size + length
+    if len(records) < 2:
+        raise ValueError("{} doesn't hold a complete checkpoint".format(path))
+
+    header = pickle.loads(records[0])
+    computer_class = import_class(header["class"])
+    if computer is None:
+        computer = computer_class(header["software"])
+        if computer.overflow != header["overflow"]:
+            computer._memory = computer.memory_class(header["software"], header["overflow"])
+            if computer._engine is not None:
+                computer._engine.clear()
+    elif computer.overflow != header["overflow"]:
+        raise ValueError("Checkpoint was taken with {} overflow, the computer uses {}".format(
+            header["overflow"], computer.overflow))
+    elif not isinstance(computer, computer_class):
+        raise ValueError("Checkpoint is of a {}, can't load it into a {}".format(
+            header["class"], class_name(type(computer))))
+    if hashlib.sha256(np.array(computer.memory.image).tobytes()).hexdigest() != header["digest"]:
+        raise ValueError("Checkpoint was taken with different software to what the computer is running")
+
+    pages = {}
+    state = {}
+
+    def loads(data):
+        return _StateUnpickler(io.BytesIO(data), computer._memory._image_pages, pages).load()
+
+    for payload in records[1:]:
+        new_pages, changes, memory_state = pickle.loads(payload)
+        for page_id, page in sorted(new_pages.items()):
+            if type(page) is tuple:  # an overlay, the page under it always has a lower id
+                (kind, number), page_number, words = page
+                base = computer._memory._image_pages[number] if kind == IMAGE_REFERENCE else pages[number]
+                page = OverlayPage(base, computer._memory, page_number, words)
+            pages[page_id] = page
+        for name, kind, *change in changes:
+            if kind == VALUE:
+                state[name] = loads(change[0])
+            elif kind == LIST:
+                start, items = change
+                state[name] = state.get(name, [])[:start] + [loads(item) for item in items]
+            elif kind == DICT:
+                updates, removed = change
+                for key in removed:
+                    del state[name][loads(key)]
+                for key, item in updates:
+                    state[name][loads(key)] = loads(item)
+            else:
+                state.pop(name, None)
+    page_table, dirty = loads(memory_state)
+    changed_pages = computer._memory.restore(MemorySnapshot(page_table, dirty))
+    if computer._engine is not None:
+        computer._engine.verify(changed_pages)
+    vars(computer).update(state)
+    return computer
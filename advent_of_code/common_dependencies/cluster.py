@@ -0,0 +1,394 @@
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+
+try:
+    from .intcode import IntcodeComputer, HALTED, NEEDS_INPUT
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer, HALTED, NEEDS_INPUT
+
+DEFAULT_RING_SIZE = 4096  # values a link holds before the machine writing to it has to wait
+DEFAULT_BATCH_SIZE = 10000  # instructions a machine runs before its worker moves on to the next machine
+MAX_BACKOFF = 1e-3  # longest sleep between polls of an idle worker or the coordinator
+
+# Ring buffer header, one int64 each. The writer only ever changes HEAD, LAST_VALUE, STALLS and CLOSED and the reader
+# only ever changes TAIL so a link needs no locks as long as it has a single writer and a single reader
+HEAD = 0  # total number of values ever written
+TAIL = 1  # total number of values ever read
+CLOSED = 2  # set once the writing machine has halted
+LAST_VALUE = 3  # the most recent value written
+STALLS = 4  # times the writer found the ring full
+RING_HEADER = 8
+
+# control block at the start of the shared memory, followed by two words per worker
+STOP = 0  # set by the coordinator to tell the workers to exit
+FAILED = 1  # set by a worker that raised an exception
+CONTROL_HEADER = 2
+BUSY = 0  # per worker: 1 while the worker has work to do
+GENERATION = 1  # per worker: counts the times the worker started doing work
+
+
+class RingBuffer():
+    # Single producer, single consumer FIFO of int64 values living in shared memory. The values are written before the
+    # head is moved past them and read before the tail is, so the other side never sees a half written value
+    def __init__(self, words):
+        self._header = words[:RING_HEADER]
+        self._data = words[RING_HEADER:]
+        self._capacity = len(self._data)
+
+    def write(self, values):
+        # writes as many of values as fit without waiting, returns how many were written
+        head, tail = int(self._header[HEAD]), int(self._header[TAIL])
+        n = min(self._capacity - (head - tail), len(values))
+        if n < len(values):
+            self._header[STALLS] += 1
+        if n > 0:
+            start = head % self._capacity
+            first = min(n, self._capacity - start)
+            self._data[start:start + first] = values[:first]
+            self._data[:n - first] = values[first:n]
+            self._header[LAST_VALUE] = values[n - 1]
+            self._header[HEAD] = head + n
+        return n
+
+    def read(self):
+        # removes and returns every value in the ring without waiting
+        head, tail = int(self._header[HEAD]), int(self._header[TAIL])
+        n = head - tail
+        if n == 0:
+            return []
+        start = tail % self._capacity
+        first = min(n, self._capacity - start)
+        values = self._data[start:start + first].tolist() + self._data[:n - first].tolist()
+        self._header[TAIL] = head
+        return values
+
+    def close(self):
+        self._header[CLOSED] = 1
+
+    # Object Properties
+    @property
+    def closed(self):
+        return bool(self._header[CLOSED])
+
+    @property
+    def n_values(self):
+        return int(self._header[HEAD])
+
+    @property
+    def last_value(self):
+        return int(self._header[LAST_VALUE]) if self._header[HEAD] else None
+
+    @property
+    def stalls(self):
+        return int(self._header[STALLS])
+
+    def __len__(self):
+        return int(self._header[HEAD] - self._header[TAIL])
+
+
+class Topology():
+    # Describes a network of machines and the links between them. Every value a machine outputs is written to all of
+    # its outgoing links and a machine reads its input from all of its incoming links. Links to a named output instead
+    # of a machine are read by the cluster and returned from Cluster.run()
+    def __init__(self):
+        self._machines = {}  # name -> (software, values pushed to its input before it starts)
+        self._links = []  # (source machine, destination machine) pairs
+        self._outputs = []  # (source machine, output name) pairs
+
+    def add_machine(self, name, software, inputs=()):
+        if name in self._machines:
+            raise ValueError("Topology already has a machine called {}".format(name))
+        self._machines[name] = (np.asarray(software, dtype=np.int64), [int(value) for value in inputs])
+
+    def connect(self, source, destination):
+        # links the output of source to the input of destination
+        for name in (source, destination):
+            if name not in self._machines:
+                raise ValueError("Topology has no machine called {}".format(name))
+        self._links.append((source, destination))
+
+    def add_output(self, source, name="output"):
+        # collects everything source outputs under name
+        if source not in self._machines:
+            raise ValueError("Topology has no machine called {}".format(source))
+        self._outputs.append((source, name))
+
+    @classmethod
+    def chain(cls, software, n_machines, inputs=None):
+        # machines 0..n-1 each feeding the next, the last machine's output is collected as "output". inputs is an
+        # optional list with the starting inputs of each machine
+        topology = cls()
+        for j in range(n_machines):
+            topology.add_machine(j, software, () if inputs is None else inputs[j])
+        for j in range(n_machines - 1):
+            topology.connect(j, j + 1)
+        topology.add_output(n_machines - 1)
+        return topology
+
+    @classmethod
+    def ring(cls, software, n_machines, inputs=None):
+        # a chain where the last machine feeds back into the first, the cluster can still read everything it outputs
+        topology = cls.chain(software, n_machines, inputs)
+        topology.connect(n_machines - 1, 0)
+        return topology
+
+    # Object Properties
+    @property
+    def machines(self):
+        return list(self._machines)
+
+    @property
+    def links(self):
+        return list(self._links)
+
+    @property
+    def outputs(self):
+        return list(self._outputs)
+
+
+class LinkStats():
+    def __init__(self, source, destination, values, seconds, stalls, last_value):
+        self.source = source  # name of the machine writing to the link
+        self.destination = destination  # name of the machine (or output) reading from it
+        self.values = values  # number of values that went through the link
+        self.values_per_second = values / seconds if seconds > 0 else 0.0
+        self.stalls = stalls  # times the writer had to wait because the link was full
+        self.last_value = last_value  # the last value written to the link, None if nothing was
+
+    def to_dict(self):
+        return {"source": self.source, "destination": self.destination, "values": self.values,
+                "values_per_second": self.values_per_second, "stalls": self.stalls, "last_value": self.last_value}
+
+
+class Cluster():
+    # Runs the machines of a topology spread over worker processes, the links between them are ring buffers in one
+    # block of shared memory. Each worker runs its machines round robin for batch_size instructions at a time.
+    # The run ends when every machine has halted or is waiting on input that can never come: every worker is idle, every
+    # link between machines is empty and no worker started doing anything while that was being checked
+    def __init__(self, topology, n_workers=None, ring_size=DEFAULT_RING_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 engine="compiled"):
+        self._topology = topology
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        self._n_workers = max(1, min(n_workers, len(topology.machines)))
+        self._ring_size = ring_size
+        self._batch_size = batch_size
+        self._engine = engine
+        self._link_stats = []
+        self._machine_stats = {}
+
+    def run(self, timeout=None):
+        # runs the network until it halts or starves, returns a dictionary of output name -> list of values collected
+        topology = self._topology
+        n_edges = len(topology.links) + len(topology.outputs)
+        n_words = CONTROL_HEADER + 2 * self._n_workers + n_edges * (RING_HEADER + self._ring_size)
+        shared = shared_memory.SharedMemory(create=True, size=8 * n_words)
+        workers = []
+        try:
+            return self._run(shared, n_words, workers, timeout)
+        finally:
+            for process in workers:
+                if process.is_alive():
+                    process.terminate()
+            shared.unlink()
+            try:
+                shared.close()
+            except BufferError:
+                pass  # a traceback is still holding views of the memory, it's unmapped once they're collected
+
+    def _run(self, shared, n_words, workers, timeout):
+        topology = self._topology
+        edges = topology.links + topology.outputs
+        words = np.ndarray(n_words, dtype=np.int64, buffer=shared.buf)
+        words[:] = 0
+        control, rings = _layout(words, self._n_workers, len(edges), self._ring_size)
+        control[CONTROL_HEADER + BUSY::2] = 1  # workers count as busy until they've started up and run out of work
+        machines = topology.machines
+        results = multiprocessing.Queue()
+        for worker in range(self._n_workers):
+            assigned = {name: topology._machines[name] for name in machines[worker::self._n_workers]}
+            process = multiprocessing.Process(
+                target=_worker_main, args=(shared.name, n_words, worker, self._n_workers, len(edges), self._ring_size,
+                                           assigned, topology.links, topology.outputs, self._engine, self._batch_size,
+                                           results), daemon=True)
+            process.start()
+            workers.append(process)
+
+        start = time.perf_counter()
+        outputs = {name: [] for source, name in topology.outputs}
+        sinks = [(rings[len(topology.links) + j], name) for j, (source, name) in enumerate(topology.outputs)]
+        links = rings[:len(topology.links)]
+        backoff = 0.0
+        while not control[FAILED] and not _quiescent(control, links, self._n_workers):
+            for ring, name in sinks:
+                outputs[name].extend(ring.read())
+            if not all(process.is_alive() for process in workers):
+                break  # a worker died without getting to report an error
+            if timeout is not None and time.perf_counter() - start > timeout:
+                raise TimeoutError("Cluster didn't finish within {} seconds".format(timeout))
+            backoff = min(MAX_BACKOFF, backoff * 2 + 1e-5)
+            time.sleep(backoff)
+        seconds = time.perf_counter() - start
+        control[STOP] = 1
+
+        self._machine_stats = {}
+        errors = []
+        reports = 0
+        while reports < len(workers):
+            try:
+                kind, payload = results.get(timeout=0.1)
+            except queue.Empty:
+                if any(process.is_alive() for process in workers):
+                    continue
+                errors.append("{} workers exited without reporting back".format(len(workers) - reports))
+                break
+            reports += 1
+            if kind == "error":
+                errors.append(payload)
+            else:
+                self._machine_stats.update(payload)
+        for process in workers:
+            process.join()
+        if errors:
+            raise RuntimeError("A cluster worker failed:\n" + "\n".join(errors))
+        for ring, name in sinks:
+            outputs[name].extend(ring.read())
+
+        self._link_stats = [LinkStats(source, destination, ring.n_values, seconds, ring.stalls, ring.last_value)
+                            for (source, destination), ring in zip(edges, rings)]
+        return outputs
+
+    # Object Properties
+    @property
+    def link_stats(self):
+        # LinkStats for every link and output of the last run, in the order they were added to the topology
+        return self._link_stats
+
+    @property
+    def machine_stats(self):
+        # machine name -> {"cycles": instructions executed, "halted": whether it halted} for the last run
+        return self._machine_stats
+
+    @property
+    def n_workers(self):
+        return self._n_workers
+
+
+def _layout(words, n_workers, n_rings, ring_size):
+    # splits the shared memory into the control block and the ring buffers
+    control = words[:CONTROL_HEADER + 2 * n_workers]
+    rings = []
+    offset = len(control)
+    for _ in range(n_rings):
+        rings.append(RingBuffer(words[offset:offset + RING_HEADER + ring_size]))
+        offset += RING_HEADER + ring_size
+    return control, rings
+
+
+def _quiescent(control, links, n_workers):
+    # True when no worker has anything left to do. A worker marks itself busy and bumps its generation before it takes
+    # anything from a link, so if the generations didn't move while everything looked idle nothing was in flight
+    generations = control[CONTROL_HEADER + GENERATION::2].copy()
+    if control[CONTROL_HEADER + BUSY::2].any():
+        return False
+    if any(len(ring) for ring in links):
+        return False
+    return np.array_equal(generations, control[CONTROL_HEADER + GENERATION::2])
+
+
+class _Machine():
+    # a computer plus the links it reads from and writes to, inside a worker
+    def __init__(self, computer, inputs, outputs):
+        self.computer = computer
+        self.inputs = inputs  # rings feeding the machine's input
+        self.outputs = outputs  # rings its output is written to
+        self.pending = [[] for _ in outputs]  # values waiting for room in each output ring
+        self.halted = False
+        self.waiting = False  # blocked on input with nothing left to read
+
+
+def _worker_main(shared_name, n_words, worker, n_workers, n_rings, ring_size, assigned, links, outputs, engine,
+                 batch_size, results):
+    shared = shared_memory.SharedMemory(name=shared_name)
+    try:
+        words = np.ndarray(n_words, dtype=np.int64, buffer=shared.buf)
+        control, rings = _layout(words, n_workers, n_rings, ring_size)
+        edges = [source for source, destination in links] + [source for source, name in outputs]
+        machines = {}
+        for name, (software, inputs) in assigned.items():
+            computer = IntcodeComputer(software, engine=engine)
+            for value in inputs:
+                computer.input(value)
+            machines[name] = _Machine(computer,
+                                      [rings[j] for j, (source, destination) in enumerate(links) if destination == name],
+                                      [rings[j] for j, source in enumerate(edges) if source == name])
+        _worker_loop(control, worker, list(machines.values()), batch_size)
+        results.put(("stats", {name: {"cycles": machine.computer.cycle_count, "halted": machine.halted}
+                               for name, machine in machines.items()}))
+        del words, control, rings, machines
+    except Exception:
+        words = np.ndarray(n_words, dtype=np.int64, buffer=shared.buf)
+        words[FAILED] = 1
+        del words
+        results.put(("error", traceback.format_exc()))
+    finally:
+        shared.close()
+
+
+def _worker_loop(control, worker, machines, batch_size):
+    busy = CONTROL_HEADER + 2 * worker + BUSY
+    generation = CONTROL_HEADER + 2 * worker + GENERATION
+    backoff = 0.0
+    while not control[STOP]:
+        if not _has_work(machines):
+            control[busy] = 0
+            backoff = min(MAX_BACKOFF, backoff * 2 + 1e-5)
+            time.sleep(backoff)
+            continue
+        control[busy] = 1
+        control[generation] += 1
+        backoff = 0.0
+        for machine in machines:
+            _step(machine, batch_size)
+
+
+def _has_work(machines):
+    for machine in machines:
+        if any(machine.pending):
+            return True
+        if any(len(ring) for ring in machine.inputs) or not (machine.halted or machine.waiting):
+            return True
+    return False
+
+
+def _step(machine, batch_size):
+    # moves one machine along: flushes its pending output, feeds it its input and runs a batch of instructions
+    for ring, pending in zip(machine.outputs, machine.pending):
+        if pending:
+            del pending[:ring.write(pending)]
+    if machine.halted:
+        for ring in machine.inputs:
+            ring.read()  # values sent to a halted machine are dropped so the machines writing them don't stall
+        return
+    if any(machine.pending):
+        return  # a machine doesn't run again until the machines downstream have made room for its output
+    computer = machine.computer
+    for ring in machine.inputs:
+        for value in ring.read():
+            computer.input(value)
+    status = computer.resume(max_cycles=batch_size)
+    machine.waiting = status == NEEDS_INPUT
+    values = computer.flush_output()
+    if values:
+        for ring, pending in zip(machine.outputs, machine.pending):
+            pending.extend(values)
+            del pending[:ring.write(pending)]
+    if status == HALTED:
+        machine.halted = True
+        for ring in machine.outputs:
+            ring.close()
@@ -0,0 +1,391 @@
+try:
+    from .memory import PAGE_BITS, PAGE_MASK
+    from . import loops
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from memory import PAGE_BITS, PAGE_MASK
+    import loops
+
+MAX_BLOCK_LENGTH = 64  # longest run of instructions that gets compiled into a single block
+COMPILE_THRESHOLD = 4  # number of times an address has to be reached before a block is compiled from it
+MAX_CACHED_BLOCKS = 100000  # the shared code cache is emptied when it grows past this many blocks
+
+# number of parameters each opcode takes, used to walk over the program while splitting it into blocks
+_n_params = {1: 3, 2: 3, 3: 1, 4: 1, 5: 2, 6: 2, 7: 3, 8: 3, 9: 1, 99: 0, 20: 6, 21: 6, 22: 6, 23: 6, 24: 3}
+_jumps = {5, 6, 20, 21, 22, 23}  # opcodes that can move the program counter somewhere else, they end a block
+
+# code objects shared by every compiler, keyed by the start address and instructions of the block they were generated
+# from so that computers running the same software only have to generate and compile the source once
+_code_cache = {}
+
+
+class BasicBlock():
+    def __init__(self, start, end, function, constant_addresses, words, instructions):
+        self.start = start  # address of the first instruction in the block
+        self.end = end  # one past the address of the last word in the block
+        self.function = function  # compiled python function that executes the block
+        self.constant_addresses = constant_addresses  # addresses whose words were compiled into the block as constants
+        self.words = words  # the words at the constant addresses when the block was compiled
+        self.modified = False  # whether any of those words had been written over since the program was loaded
+        self.pages = {address >> PAGE_BITS for address in constant_addresses}  # pages the block was compiled from
+        self.instructions = instructions  # the (address, word, parameters) instructions the block was compiled from
+        self.loop = loops.is_candidate(instructions)  # whether the block could be a loop that runs in closed form
+        self.misses = 0  # attempts in a row to run the block in closed form that didn't skip anything
+
+
+class BlockCompiler():
+    # Execution engine for the intcode computer that splits the loaded program into basic blocks and compiles each
+    # block into a python function with all the opcode and parameter mode decoding done ahead of time.
+    # Code that only runs a handful of times is cheaper to interpret, so a block is only compiled once the program counter
+    # has landed on its start address COMPILE_THRESHOLD times.
+    # Every write that lands inside a compiled block throws that block away so self modifying code gets recompiled from
+    # the new words the next time it's reached.
+    # Lots of programs patch the parameters of their own instructions, so an address that has been written over once is
+    # marked volatile and from then on compiled as a memory read instead of a constant.
+    # Blocks that are thrown away are kept aside, one per start address, and put straight back without compiling anything
+    # if the words they were compiled from turn up again. Programs that patch their own code the same way every run
+    # (day 5 writing its inputs into its instructions) then only compile those blocks once, however often the computer
+    # is reset.
+    # A block that jumps straight back to its own start is a loop, if it's a counting loop (see loops.py) the iterations
+    # it has left are run in closed form instead of one at a time
+    def __init__(self, computer):
+        self._computer = computer
+        self._blocks = {}  # compiled blocks keyed by start address
+        self._code_addresses = {}  # every constant address covered by a compiled block, mapped to those block's starts
+        self._volatile = set()  # addresses the program has written over after they were compiled
+        self._modified_blocks = set()  # blocks compiled from words that differ from the loaded software
+        self._hits = {}  # how many times the interpreter has been handed each address that isn't compiled yet
+        self._retired = {}  # start address -> the last block thrown away from there, put back if its words come back
+        self._uncompilable = set()  # addresses holding an instruction that always has to be interpreted
+        self._native_opcodes = computer._native_opcodes()  # opcodes that can be inlined, the rest are interpreted
+        self._accelerate_loops = True  # run counting loops in closed form
+        self._accelerated_loops = 0  # number of times a loop was run in closed form
+        self._skipped_cycles = 0  # instructions those loops would have executed
+        self._n_compiled = 0  # blocks compiled since the engine was made
+        self._globals = {
+            "vm": computer,
+            "C": self._code_addresses
+        }
+
+    def run(self, cycle_limit=float("inf"), output_limit=float("inf")):
+        # runs the computer until it halts, blocks waiting on input, its cycle count reaches cycle_limit or its output
+        # buffer holds output_limit values. Blocks stop right after the output that reaches the output limit (the computer
+        # holds it in _output_limit) but the cycle limit is only checked between blocks so it can be overshot by a block
+        computer = self._computer
+        blocks = self._blocks
+        memory = computer._memory
+        pages = memory._pages
+        memory.watch(self._code_addresses, self.invalidate)  # any write to compiled code, even from outside, invalidates
+        output_buffer = computer._output_buffer
+        while computer._running and not computer._program_finished and computer._cycle_count < cycle_limit and \
+                len(output_buffer) < output_limit:
+            pc = computer._pc
+            try:
+                block = blocks[pc]
+            except KeyError:
+                block = self._reinstate(pc) if pc in self._retired else None
+                if block is None:
+                    hits = self._hits.get(pc, 0) + 1
+                    self._hits[pc] = hits
+                    if hits >= COMPILE_THRESHOLD and pc not in self._uncompilable:
+                        block = self._compile(pc)
+            if block is None:
+                computer.cycle()  # the instruction can't be compiled so hand it to the interpreter
+            else:
+                next_pc = block.function(memory, pages)
+                if next_pc == pc and block.loop and self._accelerate_loops and blocks.get(pc) is block:
+                    next_pc = self._accelerate(block, next_pc, cycle_limit)
+                computer._pc = next_pc
+
+    def _accelerate(self, block, next_pc, cycle_limit):
+        # the loop block just went around, tries to run the rest of its iterations in closed form and returns the
+        # address to carry on from. Blocks that keep failing to skip anything stop being tried
+        cycles = self._computer._cycle_count
+        accelerated_pc = loops.accelerate(self._computer, block, cycle_limit)
+        if accelerated_pc is None:
+            block.misses += 1
+            if block.misses >= loops.MAX_MISSES:
+                block.loop = False
+            return next_pc
+        block.misses = 0
+        self._accelerated_loops += 1
+        self._skipped_cycles += self._computer._cycle_count - cycles
+        return accelerated_pc
+
+    def reset(self):
+        # called when the computer's memory is restored to the loaded software, only blocks compiled from words the
+        # program wrote itself have to be thrown away. They're retired so the next run can put them back if it writes the
+        # same words again
+        for start in list(self._modified_blocks):
+            self._remove(start)
+            self._hits.pop(start, None)
+
+    def clear(self):
+        # throws away every compiled block, called when new software is loaded
+        self._blocks.clear()
+        self._code_addresses.clear()
+        self._volatile.clear()
+        self._modified_blocks.clear()
+        self._hits.clear()
+        self._retired.clear()
+        self._uncompilable.clear()
+
+    def verify(self, pages):
+        # throws away blocks on the given pages that no longer match the words in memory, called after the memory on
+        # those pages was swapped out without going through the computer (e.g. restoring a snapshot)
+        memory = self._computer._memory
+        for start, block in list(self._blocks.items()):
+            if not pages.isdisjoint(block.pages) and \
+                    any(memory[address] != word for address, word in zip(block.constant_addresses, block.words)):
+                self._remove(start)
+
+    def invalidate(self, address):
+        # throws away every block that covers the given address
+        self._volatile.add(address)
+        for start in list(self._code_addresses.get(address, ())):
+            self._remove(start)
+
+    def _remove(self, start):
+        block = self._blocks.pop(start)
+        self._retired[start] = block
+        self._modified_blocks.discard(start)
+        for covered_address in block.constant_addresses:
+            owners = self._code_addresses[covered_address]
+            owners.discard(start)
+            if not owners:
+                del self._code_addresses[covered_address]
+
+    def _compile(self, start):
+        # splits off the basic block starting at the given address and compiles it, returns None if the instruction at
+        # that address has to be run by the interpreter
+        instructions = self._split(start)
+        written = self._written_parameters(instructions)
+        if written:
+            # the block writes over its own parameters (programs like day 2 keep their data there), they're marked
+            # volatile up front instead of compiling a block that throws itself away the first time it runs
+            self._volatile.update(written)
+            instructions = self._split(start)
+        if not instructions:
+            self._uncompilable.add(start)
+            return None
+        memory = self._computer._memory
+        volatile = self._volatile
+        pc, _, parameters = instructions[-1]
+        end = pc + 1 + len(parameters)
+        image_pages = memory.image_pages
+        key = (start, tuple(instructions), image_pages)
+        try:
+            code = _code_cache[key]
+        except KeyError:
+            if len(_code_cache) >= MAX_CACHED_BLOCKS:
+                _code_cache.clear()
+            code = _code_cache[key] = compile(
+                _generate_source(instructions, end, image_pages), "<intcode block {}>".format(start), "exec")
+        namespace = {}
+        exec(code, self._globals, namespace)
+        self._n_compiled += 1
+
+        # the block depends on the value of every word it was compiled from except the volatile parameters
+        constant_addresses = [address for address in range(start, end) if address not in volatile]
+        block = BasicBlock(start, end, namespace["block"], constant_addresses,
+                           [memory[address] for address in constant_addresses], instructions)
+        block.modified = any(memory.pristine(address) != word for address, word in zip(constant_addresses, block.words))
+        self._install(block)
+        return block
+
+    def _reinstate(self, start):
+        # puts the block retired from start back if memory holds the words it was compiled from again, returns it or
+        # None if it doesn't match. Blocks that baked in a word that has turned out to be volatile since are left alone,
+        # the write that retired them would only throw them away again
+        block = self._retired[start]
+        memory = self._computer._memory
+        if not self._volatile.isdisjoint(block.constant_addresses):
+            del self._retired[start]
+            return None
+        if list(map(memory.__getitem__, block.constant_addresses)) != block.words:
+            return None
+        del self._retired[start]
+        self._install(block)
+        return block
+
+    def _install(self, block):
+        # makes a compiled block the one run from its start address
+        start = block.start
+        self._blocks[start] = block
+        for address in block.constant_addresses:
+            self._code_addresses.setdefault(address, set()).add(start)
+        if block.modified:
+            self._modified_blocks.add(start)
+
+    def _split(self, start):
+        # the (address, word, parameters) instructions of the basic block starting at start, empty if the instruction at
+        # start has to be interpreted
+        memory = self._computer._memory
+        volatile = self._volatile
+        instructions = []
+        pc = start
+        while len(instructions) < MAX_BLOCK_LENGTH:
+            word = memory[pc]
+            opcode = word % 100
+            if opcode not in self._native_opcodes:
+                break  # the block stops in front of anything the interpreter has to handle
+            n_params = _n_params[opcode]
+            if any((word // 10 ** (digit + 2)) % 10 > 2 for digit in range(n_params)):
+                break  # invalid parameter modes are left for the interpreter to raise on if they're ever executed
+            # volatile parameters are stored as None so they're read from memory when the block runs, parameters that
+            # have been changed from the loaded software are treated as volatile from the start
+            parameters = []
+            for address in range(pc + 1, pc + 1 + n_params):
+                if address not in volatile and memory[address] != memory.pristine(address):
+                    volatile.add(address)
+                parameters.append(None if address in volatile else memory[address])
+            parameters = tuple(parameters)
+            instructions.append((pc, word, parameters))
+            pc += 1 + n_params
+            if opcode in _jumps or opcode == 99:
+                break  # jumps and halts end the block
+        return instructions
+
+    def _written_parameters(self, instructions):
+        # parameters of the block that one of its own instructions writes to through a constant position mode address
+        parameter_addresses = {pc + 1 + j for pc, _, parameters in instructions for j in range(len(parameters))}
+        written = set()
+        for _, word, parameters in instructions:
+            if word % 100 in (1, 2, 3, 7, 8) and parameters[-1] is not None and \
+                    (word // 10 ** (len(parameters) + 1)) % 10 == 0:
+                written.add(parameters[-1])
+        return (written & parameter_addresses) - self._volatile
+
+    @property
+    def compiled_blocks(self):
+        # sorted list of the start addresses of every compiled block
+        return sorted(self._blocks)
+
+    @property
+    def n_compiled(self):
+        # blocks compiled since the engine was made, including ones compiled again after being thrown away
+        return self._n_compiled
+
+    @property
+    def accelerate_loops(self):
+        # True while counting loops are run in closed form
+        return self._accelerate_loops
+
+    @accelerate_loops.setter
+    def accelerate_loops(self, value):
+        self._accelerate_loops = value
+
+    @property
+    def accelerated_loops(self):
+        # how many times a loop was run in closed form
+        return self._accelerated_loops
+
+    @property
+    def skipped_cycles(self):
+        # instructions the loops run in closed form would have executed one at a time
+        return self._skipped_cycles
+
+    @property
+    def volatile_addresses(self):
+        # sorted list of the addresses that are read from memory because the program writes over them
+        return sorted(self._volatile)
+
+
+def _generate_source(instructions, end, image_pages):
+    # generates the source of a python function that executes a list of (address, word, parameters) instructions
+    lines = []
+    uses_relative = any(word % 100 == 9 or 2 in ((word // 100) % 10, (word // 1000) % 10, (word // 10000) % 10)
+                        for _, word, _ in instructions)
+    if uses_relative:
+        lines.append("rb = vm._relative_offset")
+
+    def exit_block(executed, next_pc, indent=""):
+        # lines that store the state held in locals back on the computer and leave the block
+        exit_lines = ["vm._cycle_count += {}".format(executed)]
+        if uses_relative:
+            exit_lines.append("vm._relative_offset = rb")
+        exit_lines.append("return {}".format(next_pc))
+        return [indent + line for line in exit_lines]
+
+    def word_at(address):
+        # expression for the word stored at a constant address
+        if address >> PAGE_BITS < image_pages:
+            # pages holding the program image always exist so they can be indexed without going through the memory
+            return "P[{}][{}]".format(address >> PAGE_BITS, address & PAGE_MASK)
+        return "m[{}]".format(address)
+
+    def parameter_value(parameter, parameter_address):
+        # expression for the raw value of a parameter, volatile parameters are read from memory
+        return word_at(parameter_address) if parameter is None else "({})".format(parameter)
+
+    def address(mode, parameter, parameter_address):
+        # expression for the memory address a parameter refers to
+        if mode == 1:
+            return str(parameter_address)  # immediate mode parameters refer to themselves
+        value = parameter_value(parameter, parameter_address)
+        return value if mode == 0 else "rb + {}".format(value)
+
+    def read(mode, parameter, parameter_address):
+        # expression for the value a parameter refers to
+        if mode == 1:
+            return parameter_value(parameter, parameter_address)
+        if mode == 0 and parameter is not None and 0 <= parameter:
+            return word_at(parameter)
+        return "m[{}]".format(address(mode, parameter, parameter_address))
+
+    def write(mode, parameter, parameter_address, value, executed, next_pc):
+        # lines that store a value and bail out of the block if the write lands on compiled code, the memory tells the
+        # compiler to throw away the blocks covering that address when it's written to
+        write_lines = ["a = {}".format(address(mode, parameter, parameter_address)),
+                       "if a in C:", "    m[a] = {}".format(value)]
+        return write_lines + exit_block(executed, next_pc, "    ") + ["m[a] = {}".format(value)]
+
+    for index, (pc, word, parameters) in enumerate(instructions):
+        opcode = word % 100
+        modes = [(word // 10 ** (digit + 2)) % 10 for digit in range(len(parameters))]
+        arguments = [(modes[j], parameters[j], pc + 1 + j) for j in range(len(parameters))]
+        next_pc = pc + 1 + len(parameters)
+        executed = index + 1
+        if opcode == 1:
+            lines += write(*arguments[2], "{} + {}".format(read(*arguments[0]), read(*arguments[1])), executed, next_pc)
+        elif opcode == 2:
+            lines += write(*arguments[2], "{} * {}".format(read(*arguments[0]), read(*arguments[1])), executed, next_pc)
+        elif opcode == 7:
+            lines += write(*arguments[2], "1 if {} < {} else 0".format(read(*arguments[0]), read(*arguments[1])),
+                           executed, next_pc)
+        elif opcode == 8:
+            lines += write(*arguments[2], "1 if {} == {} else 0".format(read(*arguments[0]), read(*arguments[1])),
+                           executed, next_pc)
+        elif opcode == 3:
+            # suspend on the input instruction if there's nothing in the input buffer
+            lines.append("if not vm._input_buffer:")
+            lines.append("    vm._running = False")
+            lines += exit_block(index, pc, "    ")
+            lines += write(*arguments[0], "vm._input_buffer.popleft()", executed, next_pc)
+        elif opcode == 4:
+            # leave the block as soon as the caller has all the outputs it asked for
+            lines.append("if vm._output_sink is not None:")
+            lines.append("    vm._output_sink({})".format(read(*arguments[0])))
+            lines.append("else:")
+            lines.append("    vm._output_buffer.append({})".format(read(*arguments[0])))
+            lines.append("    if len(vm._output_buffer) >= vm._output_limit:")
+            lines += exit_block(executed, next_pc, "        ")
+        elif opcode == 5:
+            lines.append("if {} != 0:".format(read(*arguments[0])))
+            lines += exit_block(executed, read(*arguments[1]), "    ")
+        elif opcode == 6:
+            lines.append("if {} == 0:".format(read(*arguments[0])))
+            lines += exit_block(executed, read(*arguments[1]), "    ")
+        elif opcode == 9:
+            lines.append("rb += {}".format(read(*arguments[0])))
+        elif opcode == 99:
+            lines.append("vm._program_finished = True")
+        elif opcode in (20, 21, 22, 23):
+            # fused compare and jump, the result is stored before the jump target is read like the unfused pair does
+            comparison = "<" if opcode in (20, 21) else "=="
+            taken = "f" if opcode in (20, 22) else "not f"
+            lines.append("f = 1 if {} {} {} else 0".format(read(*arguments[0]), comparison, read(*arguments[1])))
+            lines += write(*arguments[2], "f", executed, "({} if {} else {})".format(read(*arguments[3]), taken, next_pc))
+            lines.append("if {}:".format(taken))
+            lines += exit_block(executed, read(*arguments[3]), "    ")
+    lines += exit_block(len(instructions), end)
+    return "def block(m, P):\n" + "\n".join("    " + line for line in lines) + "\n"
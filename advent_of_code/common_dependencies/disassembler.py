@@ -0,0 +1,449 @@
+import numpy as np
+
+try:
+    from .intcode import IntcodeComputer
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer
+
+# short names used in listings, the opcode table says how many parameters each one takes
+MNEMONICS = {1: "add", 2: "mul", 3: "in", 4: "out", 5: "jt", 6: "jf", 7: "lt", 8: "eq", 9: "arb", 99: "halt",
+             20: "jlt", 21: "jge", 22: "jeq", 23: "jne", 24: "skip"}
+FUSED_OPCODES = {(7, 5): 20, (7, 6): 21, (8, 5): 22, (8, 6): 23}  # (compare, jump on its result) -> fused pseudo-op
+SKIP_OPCODE = 24
+WRITTEN_PARAMETER = {1: 2, 2: 2, 3: 0, 7: 2, 8: 2, 20: 2, 21: 2, 22: 2, 23: 2}  # opcode -> parameter it writes to
+
+_jump_target = {5: 1, 6: 1, 20: 3, 21: 3, 22: 3, 23: 3}  # opcode -> which parameter holds the jump target
+_used_parameters = {20: 4, 21: 4, 22: 4, 23: 4, 24: 0}  # pseudo-ops with padding parameters that are never read
+_folds = {1: lambda a, b: a + b, 2: lambda a, b: a * b, 7: lambda a, b: int(a < b), 8: lambda a, b: int(a == b)}
+
+
+class Instruction():
+    def __init__(self, address, word, parameters):
+        self.address = address  # where the instruction starts
+        self.word = word  # the instruction word holding the opcode and parameter modes
+        self.opcode = word % 100
+        self.modes = tuple((word // 10 ** (digit + 2)) % 10 for digit in range(len(parameters)))
+        self.parameters = tuple(parameters)  # the raw parameter words
+
+    def operands(self):
+        # list of (parameter index, mode, raw value, True if it's written to) for every parameter the opcode uses
+        used = _used_parameters.get(self.opcode, len(self.parameters))
+        written = WRITTEN_PARAMETER.get(self.opcode)
+        return [(j, self.modes[j], self.parameters[j], j == written) for j in range(used)]
+
+    def parameter_address(self, j):
+        return self.address + 1 + j
+
+    @property
+    def length(self):
+        return 1 + len(self.parameters)
+
+    @property
+    def next_address(self):
+        return self.address + self.length
+
+    @property
+    def words(self):
+        return [self.word] + list(self.parameters)
+
+    def __str__(self):
+        operands = ", ".join(_operand_text(mode, value) for _, mode, value, _ in self.operands())
+        return "{:>6}: {:<6}{}".format(self.address, MNEMONICS.get(self.opcode, str(self.opcode)), operands)
+
+    def __repr__(self):
+        return "Instruction({}, {}, {})".format(self.address, self.word, self.parameters)
+
+
+class Block():
+    def __init__(self, start, instructions):
+        self.start = start  # address of the first instruction
+        self.instructions = instructions  # the instructions in the block in order
+        self.successors = []  # start addresses of the blocks control can move to after this one
+        self.indirect = False  # True if the block ends in a jump whose target is only known at run time
+
+    @property
+    def end(self):
+        # one past the last word of the block
+        return self.instructions[-1].next_address
+
+
+class Rewrite():
+    def __init__(self, address, kind, before, after):
+        self.address = address  # first word that was rewritten
+        self.kind = kind  # "fold", "dead store" or "fuse"
+        self.before = before  # the words before the rewrite
+        self.after = after  # the words that replaced them
+
+    def __repr__(self):
+        return "Rewrite({}, {}: {} -> {})".format(self.address, self.kind, self.before, self.after)
+
+
+class ControlFlowGraph():
+    # Control flow graph recovered from a program image without running it.
+    # Instructions are found by following the program from address 0: an instruction falls through to the next one
+    # unless it halts or always jumps, and jumps are followed wherever their target is constant. A word counts as
+    # constant when no instruction writes to it through a constant address, instructions that read or write through the
+    # relative base (or through a parameter the program patches) could touch anything so they're listed in dynamic_reads
+    # and dynamic_writes instead. Jumps whose target isn't constant are listed in unresolved_jumps, when there are any
+    # the immediate values in the code that point at an instruction are followed too since that's how programs push
+    # return addresses before calling a function
+    def __init__(self, software, opcodes=None):
+        self.words = [int(word) for word in np.asarray(software, dtype=np.int64)]
+        self._opcodes = IntcodeComputer.dispatch_table().opcodes if opcodes is None else opcodes
+        self.instructions = {}  # address -> Instruction for every instruction control can reach
+        self.invalid = set()  # addresses control can reach that don't hold a valid instruction
+        self.written = set()  # addresses written to through a constant address
+        self.read = set()  # addresses read as data through a constant address
+        self.dynamic_reads = []  # addresses of instructions that read through an address only known at run time
+        self.dynamic_writes = []  # addresses of instructions that write through an address only known at run time
+        self.unresolved_jumps = []  # addresses of jumps whose target is only known at run time
+        self.modified_code = []  # addresses control can reach whose instruction word the program writes over
+        self.address_taken = set()  # instruction addresses that show up as immediate values, possible jump targets
+        self._discover()
+        self.blocks = self._split_blocks()
+
+    def word(self, address):
+        # the word at an address in the image, memory past the end of the image starts out as 0
+        return self.words[address] if 0 <= address < len(self.words) else 0
+
+    def constant(self, address):
+        # the value at an address if it's part of the image and never written to, None otherwise
+        if 0 <= address < len(self.words) and address not in self.written:
+            return self.words[address]
+        return None
+
+    def operand_value(self, instruction, j):
+        # value a parameter reads if it's known before the program runs, None otherwise
+        mode, value = instruction.modes[j], instruction.parameters[j]
+        if instruction.parameter_address(j) in self.written:
+            return None  # the program patches this parameter
+        if mode == 1:
+            return value
+        if mode == 0 and self._trust_data:
+            return self.constant(value)
+        return None
+
+    def _decode(self, address):
+        # the instruction at an address, None if the word there isn't a valid instruction
+        word = self.word(address)
+        opcode = self._opcodes.get(word % 100) if word > 0 else None
+        if opcode is None:
+            return None
+        parameters = [self.word(address + 1 + j) for j in range(opcode.n_params)]
+        instruction = Instruction(address, word, parameters)
+        if any(mode > 2 for mode in instruction.modes):
+            return None
+        return instruction
+
+    def _flow(self, instruction):
+        # returns (list of constant jump targets, True if execution can fall through, True if the target is unknown)
+        opcode = instruction.opcode
+        if opcode == 99:
+            return [], False, False
+        if opcode not in _jump_target:
+            return [], True, False
+        target = self.operand_value(instruction, _jump_target[opcode])
+        always = never = False
+        if opcode in (5, 6):
+            condition = self.operand_value(instruction, 0)
+            if condition is not None:
+                always = (condition != 0) == (opcode == 5)
+                never = not always
+        if never:
+            return [], True, False
+        return ([] if target is None else [target]), not always, target is None
+
+    def _find_accesses(self):
+        # works out which addresses the discovered instructions read and write. Writes found on earlier passes are kept
+        # so the set of written addresses only ever grows
+        self.read.clear()
+        for instruction in self.instructions.values():
+            for j, mode, value, writes in instruction.operands():
+                if writes and mode != 2:
+                    self.written.add(instruction.parameter_address(j) if mode == 1 else value)
+                elif not writes and mode == 0:
+                    self.read.add(value)
+        self.dynamic_reads, self.dynamic_writes = [], []
+        for address, instruction in sorted(self.instructions.items()):
+            for j, mode, value, writes in instruction.operands():
+                if mode == 2 or (mode == 0 and instruction.parameter_address(j) in self.written):
+                    (self.dynamic_writes if writes else self.dynamic_reads).append(address)
+                    break
+
+    def _discover(self):
+        # Follows the program from address 0 to find the instructions and what they write. The first pass treats every
+        # word read through a position mode parameter as unknown so both sides of each branch are followed, after that
+        # the words that aren't written are treated as constant and the program is followed again from scratch until no
+        # new writes turn up. Stored constants that look like return addresses are only followed once the writes of the
+        # code that's certainly there are known, so they're less likely to be mistaken for code
+        self._trust_data = False
+        self._explore()
+        self._find_accesses()
+        self._trust_data = True
+        while True:
+            written = set(self.written)
+            self.instructions.clear()
+            self.invalid.clear()
+            self._explore()
+            self._find_accesses()
+            if self.written == written:
+                break
+
+    def _explore(self):
+        self.address_taken = set()
+        pending = [0]
+        while pending:
+            address = pending.pop()
+            while address not in self.instructions and address not in self.invalid:
+                instruction = self._decode(address)
+                if instruction is None:
+                    self.invalid.add(address)
+                    break
+                self.instructions[address] = instruction
+                targets, falls_through, _ = self._flow(instruction)
+                pending.extend(target for target in targets if target >= 0)
+                if not falls_through:
+                    break
+                address = instruction.next_address
+            if not pending:
+                self.unresolved_jumps = [address for address, instruction in sorted(self.instructions.items())
+                                         if self._flow(instruction)[2]]
+                self.modified_code = sorted((self.invalid | self.instructions.keys()) & self.written)
+                if self._trust_data and (self.unresolved_jumps or self.modified_code):
+                    # control can end up somewhere the flow doesn't show, follow every constant the program stores that
+                    # looks like an instruction address since that's how return addresses get pushed before a call
+                    inside = {address for instruction in self.instructions.values()
+                              for address in range(instruction.address + 1, instruction.next_address)}
+                    self.address_taken = {value for value in map(_stored_constant, self.instructions.values())
+                                          if value is not None and 0 < value < len(self.words) and value not in inside
+                                          and value not in self.written and self._decode(value) is not None}
+                    pending = [address for address in self.address_taken
+                               if address not in self.instructions and address not in self.invalid]
+
+    def _split_blocks(self):
+        leaders = {0} | self.address_taken
+        for instruction in self.instructions.values():
+            targets, falls_through, _ = self._flow(instruction)
+            leaders.update(targets)
+            if instruction.opcode in _jump_target or instruction.opcode == 99:
+                leaders.add(instruction.next_address)
+        # an instruction nothing falls through to starts a block as well
+        ends = {instruction.next_address for instruction in self.instructions.values()
+                if self._flow(instruction)[1]}
+        leaders.update(address for address in self.instructions if address not in ends)
+
+        blocks = {}
+        for start in sorted(leaders & self.instructions.keys()):
+            instructions = [self.instructions[start]]
+            while True:
+                last = instructions[-1]
+                next_address = last.next_address
+                if last.opcode in _jump_target or last.opcode == 99 or next_address in leaders or \
+                        next_address not in self.instructions:
+                    break
+                instructions.append(self.instructions[next_address])
+            block = Block(start, instructions)
+            targets, falls_through, unresolved = self._flow(instructions[-1])
+            block.successors = [target for target in targets if target in self.instructions]
+            if falls_through and block.end in self.instructions:
+                block.successors.append(block.end)
+            block.indirect = unresolved
+            blocks[start] = block
+        return blocks
+
+    def predecessors(self, start):
+        # start addresses of the blocks that can move to the block starting at start
+        return sorted(block.start for block in self.blocks.values() if start in block.successors)
+
+    def listing(self):
+        # text listing of the image, instructions under a header for each block and everything else shown as data
+        lines = []
+        address = 0
+        while address < len(self.words):
+            block = self.blocks.get(address)
+            if block is not None:
+                successors = ", ".join(str(successor) for successor in block.successors)
+                lines.append("block {}{}{}".format(block.start, " -> " + successors if successors else "",
+                                                   " -> ?" if block.indirect else ""))
+                for instruction in block.instructions:
+                    lines.append(str(instruction))
+                address = block.end
+            else:
+                data_end = address + 1
+                while data_end < len(self.words) and data_end not in self.blocks and data_end - address < 8:
+                    data_end += 1
+                lines.append("{:>6}: {:<6}{}".format(address, "data", ", ".join(
+                    str(word) for word in self.words[address:data_end])))
+                address = data_end
+        return "\n".join(lines)
+
+    def to_dot(self):
+        # the graph in graphviz dot format
+        lines = ["digraph intcode {", '    node [shape=box, fontname="monospace"];']
+        for block in self.blocks.values():
+            label = "\\l".join(str(instruction).strip() for instruction in block.instructions) + "\\l"
+            lines.append('    b{} [label="{}"];'.format(block.start, label))
+            for successor in block.successors:
+                lines.append("    b{} -> b{};".format(block.start, successor))
+            if block.indirect:
+                lines.append('    b{} -> indirect [style=dashed];'.format(block.start))
+        lines.append("}")
+        return "\n".join(lines)
+
+
+def _stored_constant(instruction):
+    # the value an add or multiply of two immediates stores, None for anything else
+    if instruction.opcode in (1, 2) and instruction.modes[:2] == (1, 1):
+        return _folds[instruction.opcode](*instruction.parameters[:2])
+    return None
+
+
+def _operand_text(mode, value):
+    if mode == 1:
+        return "#{}".format(value)
+    if mode == 2:
+        return "[rb{:+d}]".format(value)
+    return "[{}]".format(value)
+
+
+def _encode(opcode, modes):
+    return opcode + sum(mode * 10 ** (digit + 2) for digit, mode in enumerate(modes))
+
+
+def disassemble(software, opcodes=None):
+    # text listing of a program split into basic blocks
+    return ControlFlowGraph(software, opcodes).listing()
+
+
+def optimize(software, pseudo_ops=True, trust_dynamic_accesses=False, opcodes=None):
+    # Returns an optimized copy of a program image and the list of Rewrites that were made. Instructions keep their
+    # addresses and lengths so nothing else in the image has to move. Within each basic block:
+    #   - constant operands are folded: position mode reads of constants become immediates, and arithmetic and
+    #     comparisons on constants become a store of the result
+    #   - a store that's overwritten later in the block before anything could read it is replaced with a skip pseudo-op
+    #   - a compare followed by a jump on its result is fused into a single compare and jump pseudo-op
+    # The pseudo-ops only run on IntcodeComputer, with pseudo_ops=False only folding is done so the result is plain
+    # intcode. Rewriting is only safe if every access to the image is known, so programs with jumps, reads or writes
+    # through run time addresses are returned unchanged unless trust_dynamic_accesses is set, which promises that those
+    # never touch the image (true for programs that only use the relative base for a stack past the end of the image)
+    graph = ControlFlowGraph(software, opcodes)
+    words = list(graph.words)
+    rewrites = []
+    if not trust_dynamic_accesses and (graph.dynamic_reads or graph.dynamic_writes or graph.unresolved_jumps or
+                                       graph.modified_code):
+        return np.array(words, dtype=np.int64), rewrites
+
+    # words the program reads or writes as data have to keep their values
+    protected = graph.written | graph.read
+    code = {address for instruction in graph.instructions.values()
+            for address in range(instruction.address, instruction.next_address)}
+
+    def rewrite(instruction, kind, new_words):
+        address = instruction.address
+        old_words = words[address:address + len(new_words)]
+        if new_words == old_words or any(address + k in protected for k in range(len(new_words))):
+            return instruction
+        rewrites.append(Rewrite(address, kind, old_words, new_words))
+        words[address:address + len(new_words)] = new_words
+        return Instruction(address, new_words[0], new_words[1:])
+
+    for block in graph.blocks.values():
+        known = {}
+        block.instructions = [_fold(graph, instruction, known, rewrite) for instruction in block.instructions]
+        if pseudo_ops:
+            _drop_dead_stores(graph, block, code, rewrite)
+            _fuse(block, rewrite)
+    return np.array(words, dtype=np.int64), rewrites
+
+
+def _fold(graph, instruction, known, rewrite):
+    # folds the constant operands of one instruction, known holds the values stored earlier in the block at constant
+    # addresses and is updated with what the instruction stores
+    if any(address in graph.written for address in range(instruction.address, instruction.next_address)):
+        known.clear()  # the program rewrites this instruction so nothing about it is known
+        return instruction
+    values = {}
+    modes = list(instruction.modes)
+    parameters = list(instruction.parameters)
+    for j, mode, value, writes in instruction.operands():
+        if writes:
+            continue
+        values[j] = None
+        if mode == 1:
+            values[j] = value
+        elif mode == 0:
+            values[j] = known[value] if value in known else graph.constant(value)
+            if values[j] is not None:
+                modes[j], parameters[j] = 1, values[j]
+    result = None
+    if instruction.opcode in _folds and values[0] is not None and values[1] is not None:
+        result = _folds[instruction.opcode](values[0], values[1])
+        folded = rewrite(instruction, "fold", [_encode(1, (1, 1, modes[2])), result, 0, parameters[2]])
+    else:
+        folded = rewrite(instruction, "fold", [_encode(instruction.opcode, modes)] + parameters)
+
+    # update what's known about memory once the instruction has run
+    for j, mode, value, writes in folded.operands():
+        if not writes:
+            continue
+        if mode == 2:
+            known.clear()  # could have written anywhere
+        else:
+            target = folded.parameter_address(j) if mode == 1 else value
+            if result is None:
+                known.pop(target, None)
+            else:
+                known[target] = result
+    return folded
+
+
+def _reads(instruction):
+    # constant addresses an instruction reads as data, and True if it also reads through a run time address
+    addresses, dynamic = set(), False
+    for j, mode, value, writes in instruction.operands():
+        if not writes and mode == 0:
+            addresses.add(value)
+        elif mode == 2:
+            dynamic = True
+    return addresses, dynamic
+
+
+def _store_target(instruction):
+    # the constant address an arithmetic or comparison instruction stores to, None if it isn't one or isn't constant
+    if instruction.opcode not in _folds or instruction.modes[2] != 0:
+        return None
+    return instruction.parameters[2]
+
+
+def _drop_dead_stores(graph, block, code, rewrite):
+    # replaces stores that are overwritten later in the block before anything reads them with skips
+    for index, instruction in enumerate(block.instructions):
+        target = _store_target(instruction)
+        if target is None or target in code:
+            continue
+        for later in block.instructions[index + 1:]:
+            addresses, dynamic = _reads(later)
+            if target in addresses or (dynamic and target >= len(graph.words)):
+                break  # might be read before it's overwritten
+            if _store_target(later) == target or (later.opcode == 3 and later.modes[0] == 0 and
+                                                  later.parameters[0] == target):
+                block.instructions[index] = rewrite(instruction, "dead store",
+                                                    [_encode(SKIP_OPCODE, (1, 1, 1)), 0, 0, 0])
+                break
+
+
+def _fuse(block, rewrite):
+    # fuses the compare and jump on its result that end a block into a single pseudo-op
+    if len(block.instructions) < 2:
+        return
+    compare, jump = block.instructions[-2:]
+    opcode = FUSED_OPCODES.get((compare.opcode, jump.opcode))
+    if opcode is None or compare.next_address != jump.address:
+        return
+    if compare.modes[2] == 1 or (compare.modes[2], compare.parameters[2]) != (jump.modes[0], jump.parameters[0]):
+        return  # the jump isn't on the result of the compare
+    modes = (compare.modes[0], compare.modes[1], compare.modes[2], jump.modes[1], 1, 1)
+    fused = rewrite(compare, "fuse", [_encode(opcode, modes), compare.parameters[0], compare.parameters[1],
+                                      compare.parameters[2], jump.parameters[1], 0, 0])
+    if fused is not compare:
+        block.instructions[-2:] = [fused]
@@ -1,6 +1,27 @@
 import numpy as np
 import copy
-from collections import defaultdict
+from collections import deque
+from contextlib import nullcontext
+
+try:
+    from .memory import PagedMemory, OVERFLOW_POLICIES
+    from .compiler import BlockCompiler
+    from .profiler import Profiler, ProfilingTimer
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from memory import PagedMemory, OVERFLOW_POLICIES
+    from compiler import BlockCompiler
+    from profiler import Profiler, ProfilingTimer
+
+ENGINES = ("compiled", "interpreter")  # execution engines the computer can run software with
+
+# reasons run() gives for stopping
+HALTED = "halted"  # the program ran opcode 99
+NEEDS_INPUT = "needs input"  # blocked on an input instruction with nothing in the input buffer
+BUDGET_USED = "budget used"  # executed the max_cycles instructions it was given
+OUTPUTS_READY = "outputs ready"  # output the until_outputs values it was asked for
+PREDICATE_HIT = "predicate hit"  # the until predicate returned True
+
+HOOK_EVENTS = ("instruction", "memory_write", "input", "output")  # events execution hooks can be registered for
 
 
 class Opcode():
@@ -8,77 +29,267 @@ class Opcode():
         self.value = value  # the integer value of the opcode
         self.n_params = n_params  # number of parameters the opcode requires
         self.writes_to_memory = writes_to_memory  # tracks if this opcode writes the result of the operation to memory
-        self.function = function  # function to execute when the opcode is called
+        self.function = function  # function of the computer's class to execute when the opcode is called
         self.descriptor = descriptor  # human readable descriptor
 
-    def execute(self):
-        self.function()
+    def execute(self, computer):
+        self.function(computer)
+
+
+class DecodedInstruction():
+    def __init__(self, opcode, parameter_modes, parameter_functions):
+        self.opcode = opcode  # the Opcode object the instruction word refers to
+        self.parameter_modes = parameter_modes  # tuple of parameter modes, one per opcode parameter
+        self.parameter_functions = parameter_functions  # the parameter mode functions that fill each register
+
+
+class DispatchTable():
+    # the opcode table of a computer class, built once per class and shared by every computer of it. Opcodes and
+    # parameter modes hold the class's functions rather than methods bound to one computer, and since decoding only
+    # depends on the instruction word the decode cache is shared as well
+    def __init__(self, computer_class):
+        self.opcodes = {value: Opcode(value, n_params, getattr(computer_class, name), writes_to_memory, descriptor)
+                        for value, n_params, name, writes_to_memory, descriptor in computer_class.opcode_definitions}
+        # parameter mode dictionary for handling what values are passed to registers
+        self.parameter_mode = {mode: getattr(computer_class, name)
+                               for mode, name in computer_class.parameter_mode_definitions.items()}
+        self.decoded_instructions = {}  # raw instruction word -> DecodedInstruction
+
+
+class InstructionEvent():
+    # passed to on_instruction hooks just before an instruction is executed
+    def __init__(self, computer, pc, word, opcode, parameter_modes, registers):
+        self.computer = computer
+        self.pc = pc  # address of the instruction
+        self.word = word  # the instruction word, opcode and parameter modes
+        self.opcode = opcode  # the Opcode being executed
+        self.parameter_modes = parameter_modes  # one mode per parameter
+        self.registers = registers  # the address each parameter resolves to
+
+
+class MemoryWriteEvent():
+    # passed to on_memory_write hooks after an instruction writes to memory
+    def __init__(self, computer, pc, address, value):
+        self.computer = computer
+        self.pc = pc  # address of the instruction that did the write
+        self.address = address
+        self.value = value
+
+
+class InputEvent():
+    # passed to on_input hooks after an input instruction takes a value from the input buffer
+    def __init__(self, computer, pc, address, value):
+        self.computer = computer
+        self.pc = pc
+        self.address = address  # where the value was stored
+        self.value = value
+
+
+class OutputEvent():
+    # passed to on_output hooks after an output instruction puts a value on the output buffer
+    def __init__(self, computer, pc, value):
+        self.computer = computer
+        self.pc = pc
+        self.value = value
+
+
+class _AllAddresses():
+    # stands in for a set of every address so a memory watch sees every write
+    def __contains__(self, address):
+        return True
+
+
+def print_instruction(event):
+    # on_instruction hook that prints what the computer is doing, registered by verbose computers
+    computer = event.computer
+    print("relative offset {}".format(computer._relative_offset))
+    print("Pulling Instruction from memory address {}".format(event.pc))
+    print(str(event.word).zfill(5))
+    print("\t Opcode: {}:{}".format(event.opcode.value, event.opcode.descriptor) + ", Parameter modes: {}{}{}".format(
+        *((event.word // 10 ** (digit + 2)) % 10 for digit in range(3))))
+    for i, reg in enumerate(event.registers):
+        print("\t Register {}:\t{} ({})".format(i, reg, computer._memory[reg]))
+
+
+class ComputerSnapshot():
+    def __init__(self, memory, pc, relative_offset, running, program_finished, cycle_count, input_buffer,
+                 output_buffer):
+        self.memory = memory  # MemorySnapshot of the computer's memory
+        self.pc = pc
+        self.relative_offset = relative_offset
+        self.running = running
+        self.program_finished = program_finished
+        self.cycle_count = cycle_count
+        self.input_buffer = tuple(input_buffer)
+        self.output_buffer = tuple(output_buffer)
+
+    def __deepcopy__(self, memo):
+        # snapshots are never changed once they're taken so copies (fork() deep copies a subclass's attributes, which can
+        # hold snapshots) share the same one
+        return self
 
 
 class IntcodeComputer():
-    def __init__(self, software=[], verbose=False):
+    memory_class = PagedMemory  # memory the software is loaded into, subclasses can swap in their own
+    # attributes fork() doesn't deep copy, either because they're shared or because they're rebuilt for the clone
+    _fork_shared_attributes = {"_software", "_memory", "_opcodes", "_parameter_mode", "_decoded_instructions",
+                               "_engine", "_tracer", "_hooks", "_input_provider", "_output_sink"}
+
+    # This is the list of current opcodes for the computer as (value, number of parameters, method, writes to memory,
+    # descriptor). The dispatch table is built from it the first time a computer of the class is made, a subclass can
+    # change what an opcode does by overriding its method or add opcodes by extending the tuple
+    opcode_definitions = (
+        (1, 3, "_op_add", True, "Add"),
+        (2, 3, "_op_multiply", True, "Multiply"),
+        (3, 1, "_op_input", True, "Input"),
+        (4, 1, "_op_output", False, "Output"),
+        (5, 2, "_op_jmp_if_true", False, "Jump if True"),
+        (6, 2, "_op_jmp_if_false", False, "Jump if False"),
+        (7, 3, "_op_less_than", True, "Less Than operator"),
+        (8, 3, "_op_equal_to", True, "Equal To Operator"),
+        (9, 1, "_op_set_relative_offest", False, "Set Relative offset"),
+        (99, 0, "_op_terminate", False, "Terminate"),
+
+        # pseudo-ops written by the optimizer in disassembler.py, puzzle software never uses them. The fused compare and
+        # jump ops take the place of a compare followed by a jump on its result so they're 7 words long, the last two
+        # parameters are padding
+        (20, 6, "_op_jmp_if_less_than", True, "Jump if Less Than"),
+        (21, 6, "_op_jmp_if_not_less_than", True, "Jump if not Less Than"),
+        (22, 6, "_op_jmp_if_equal_to", True, "Jump if Equal To"),
+        (23, 6, "_op_jmp_if_not_equal_to", True, "Jump if not Equal To"),
+        (24, 3, "_op_skip", False, "Skip"),
+    )
+    parameter_mode_definitions = {0: "_param_position", 1: "_param_immediate", 2: "_param_relative"}
+
+    def __init__(self, software=[], verbose=False, engine="compiled", overflow="checked"):
 
         self._verbose = verbose  # Used for Debug, print computer flow to console
+        if engine not in ENGINES:
+            raise ValueError("Unknown execution engine {}, expected one of {}".format(engine, ENGINES))
+        self._engine_name = engine
+        self._engine = None  # the block compiler is created once the opcode table exists
+        self._profiler = None  # set while profiling is enabled
+        self._tracer = None  # TraceRecorder attached to the computer while it's being traced
+        self._output_limit = float("inf")  # compiled blocks are left as soon as the output buffer holds this many values
+        self._hooks = {event: [] for event in HOOK_EVENTS}  # execution hooks registered for each event
+        self._hooked = False  # True while any hook is registered, runs then go through the hooked interpreter loop
+        self._input_provider = None  # called for the next input when the computer needs one and the buffer is empty
+        self._output_sink = None  # called with every output instead of it going to the output buffer
 
         self._parameter_array = np.full(3, 0, dtype=int)  # Array that holds parameters mode settings for arguments
         self._registers = np.full(3, 0,dtype=np.int64)  # the three registers used for all operations, these registers hold memory locations that the operators act on
 
         self._software=software  # this is the software that has to be loaded into memory
+        # paged memory loaded with the program, unused addresses read as 0. All arithmetic is done on python ints, the
+        # overflow policy ("checked", "wrap" or "unbounded") decides what happens to results that don't fit in 64 bits
+        self._memory = self.memory_class(software, overflow)
         self.reset()  # reset the computer
 
-        # This is the list of current opcodes for the computer
-        self._opcodes = {code.value: code for code in (
-            Opcode(1, 3, self._op_add, True, "Add"),
-            Opcode(2, 3, self._op_multiply, True, "Multiply"),
-            Opcode(3, 1, self._op_input, True, "Input"),
-            Opcode(4, 1, self._op_output, False, "Output"),
-            Opcode(5, 2, self._op_jmp_if_true, False, "Jump if True"),
-            Opcode(6, 2, self._op_jmp_if_false, False, "Jump if False"),
-            Opcode(7, 3, self._op_less_than, True, "Less Than operator"),
-            Opcode(8, 3, self._op_equal_to, True, "Equal To Operator"),
-            Opcode(9, 1, self._op_set_relative_offest, False, "Set Relative offset"),
-            Opcode(99, 0, self._op_terminate, False, "Terminate")
-
-        )}
-
-        # parameter mode dictionary for handling what values are passed to registers
-        self._parameter_mode = {
-            0: self._param_position,
-            1: self._param_immediate,
-            2: self._param_relative
-        }
+        self._build_dispatch()  # build the opcode table and execution engine for this computer
+        if verbose:
+            self.on_instruction(print_instruction)
+
+    def _build_dispatch(self):
+        # points the computer at its class's dispatch table and builds the execution engine
+        table = type(self).dispatch_table()
+        self._opcodes = table.opcodes
+        self._parameter_mode = table.parameter_mode
+        self._decoded_instructions = table.decoded_instructions
+        self._engine = None
+        if self._engine_name == "compiled":
+            self._engine = BlockCompiler(self)  # compiles the software into python functions as it's executed
+
+    @classmethod
+    def dispatch_table(cls):
+        # the class's DispatchTable, built the first time it's asked for. Looked up in the class's own dictionary so a
+        # subclass never picks up the table of the class it inherits from
+        table = cls.__dict__.get("_dispatch_table")
+        if table is None:
+            table = DispatchTable(cls)
+            cls._dispatch_table = table
+        return table
 
     def reset(self):
         # Reset the computer by setting the pc to 0x00 and setting _running to True
-        self._memory=defaultdict(np.int64)   #memory is a dictionary with default value of 0 for nonexistant keys
+        self._memory.reset()  # only the pages written since the last reset are restored from the program image
         self._relative_offset = 0  # relative offset for referencing memory locations
-        for index,value in enumerate(self._software):
-            # restore the memory to a default state
-            self._memory[index]=np.int64(value)
-        self._input_buffer = []  # reset the input buffer
-        self._output_buffer = [] # reset the output buffer
+        self._input_buffer = deque()  # reset the input buffer
+        self._output_buffer = deque() # reset the output buffer
         self._pc = 0x00  # Program counter for traversing memory
+        self._cycle_count = 0  # number of instructions executed since the last reset
 
         self._running = True  # Boolean that states whether the code is running or blocked waiting for input
         self._program_finished = False  # Flag that gets set when opcode 99 is read
+        if self._engine is not None:
+            self._engine.reset()
 
     def input(self, input):
-        # pushes an input to the end of the input buffer
-        self._input_buffer.append(input)
+        # pushes an input to the end of the input buffer, converted to a python int so numpy values can't sneak into the
+        # arithmetic and wrap around without the overflow policy seeing them
+        self._input_buffer.append(int(input))
 
     def get_output(self):
         # pops one value from the output buffer and returns it
-        return self._output_buffer.pop(0)
+        return self._output_buffer.popleft()
 
     def flush_output(self):
         # pops items from the output buffer and prints them
-        tmp = self._output_buffer  # assign the buffer to a temporary variable
-        self._output_buffer = []  # clear the buffer
+        tmp = list(self._output_buffer)  # copy the buffer to a list
+        self._output_buffer.clear()  # clear the buffer
         return tmp  # return the buffer
 
+    def outputs(self):
+        # generator that yields the computer's outputs one at a time, running the computer only as far as it needs to
+        # for the next value. Stops when the program halts or blocks waiting for input
+        while True:
+            while self._output_buffer:
+                yield self._output_buffer.popleft()
+            if self._program_finished:
+                return
+            self._running = True
+            self._run(output_limit=1)
+            if not self._output_buffer:
+                return  # halted or waiting on input without producing anything
+
+    def snapshot(self):
+        # captures the state of the computer so it can be restored later, memory pages are shared copy on write with
+        # the running computer so a snapshot only costs the pages that get written to afterwards
+        return ComputerSnapshot(self._memory.snapshot(), self._pc, self._relative_offset, self._running,
+                                self._program_finished, self._cycle_count, self._input_buffer, self._output_buffer)
+
+    def restore(self, snapshot):
+        # returns the computer to the state captured by snapshot(), the same snapshot can be restored any number of times
+        changed_pages = self._memory.restore(snapshot.memory)
+        if self._engine is not None:
+            self._engine.verify(changed_pages)  # the restored pages may hold different code to what was compiled
+        self._pc = snapshot.pc
+        self._relative_offset = snapshot.relative_offset
+        self._running = snapshot.running
+        self._program_finished = snapshot.program_finished
+        self._cycle_count = snapshot.cycle_count
+        self._input_buffer = deque(snapshot.input_buffer)
+        self._output_buffer = deque(snapshot.output_buffer)
+
+    def fork(self):
+        # returns a new computer of the same class that carries on from the current state. Memory pages are shared copy
+        # on write between the two computers, any other state (including a subclass's) is copied
+        clone = copy.copy(self)
+        for name, value in vars(self).items():
+            if name not in self._fork_shared_attributes:
+                setattr(clone, name, copy.deepcopy(value))
+        clone._memory = self._memory.fork()
+        clone._tracer = None  # the trace belongs to this computer, the clone isn't recorded
+        clone._input_provider = clone._output_sink = None  # they drive this computer, the clone is driven separately
+        clone._hooks = {event: list(hooks) for event, hooks in self._hooks.items()}  # same hooks, registered separately
+        clone._build_dispatch()  # the compiled blocks hold this computer's state so the clone needs its own engine
+        return clone
+
     def load_software(self, software):
         # load a new array of memory into computer and reset
         self._software=software
+        self._memory = self.memory_class(software, self._memory.overflow)
+        if self._engine is not None:
+            self._engine.clear()  # blocks compiled from the old software are no longer valid
         self.reset()
 
     def load_memory(self,software):
@@ -86,23 +297,37 @@ class IntcodeComputer():
         self.load_software(software)
 
     def _pull_instruction(self):
-        # takes in a parameterized opcode from memory, returns the opcode and updates the parameter array
+        # takes in a parameterized opcode from memory, returns the decoded instruction and updates the parameter array
         instruction = self._memory[self._pc]  # pull the instruction from memory based on the program counter
         self._pc += 1  # increment the program counter
-        number_arr = np.array([int(d) for d in str(instruction).zfill(5)], dtype=int)
-
-        opcode_val = number_arr[-1] + 10 * number_arr[-2]  # the last two values are opcode
-
-        # populate parameter array
-        # load in reverse order because the furthest byte is parameter 3
-        self._parameter_array = np.flip(number_arr[0:3])
-        if self._verbose: print(number_arr)
         try:
-            return self._opcodes[opcode_val]  # return the opcode from dictionary lookup
+            decoded = self._decoded_instructions[instruction]
+        except KeyError:
+            decoded = self._decode(instruction)
+        self._parameter_array = decoded.parameter_modes
+        return decoded
+
+    def _decode(self, instruction):
+        # splits an instruction word into its opcode and parameter modes and stores the result in the decode cache
+        instruction = int(instruction)
+        opcode_val = instruction % 100  # the last two digits are the opcode
+        try:
+            opcode = self._opcodes[opcode_val]  # return the opcode from dictionary lookup
         except KeyError:
             raise ValueError(
                 "Loaded an Invalid Opcode from memory address {}, got: {}".format(self._pc, opcode_val))
 
+        # parameter modes are read from the hundreds digit upwards because the furthest digit is the last parameter
+        parameter_modes = tuple((instruction // 10 ** (digit + 2)) % 10 for digit in range(max(3, opcode.n_params)))
+        try:
+            parameter_functions = tuple(self._parameter_mode[mode] for mode in parameter_modes[:opcode.n_params])
+        except KeyError:
+            raise ValueError(
+                "Loaded an Invalid parameter mode from memory address {}, got: {}".format(self._pc, instruction))
+        decoded = DecodedInstruction(opcode, parameter_modes, parameter_functions)
+        self._decoded_instructions[instruction] = decoded
+        return decoded
+
     def _pc_pull(self):
         # pull from value memory address pointed to by the program counter and increment by one
         data = self._memory[self._pc]
@@ -110,55 +335,265 @@ class IntcodeComputer():
 
         return data
 
-    def run(self):
-        # Runs the computer until it it shutdown by an opcode and then returns the memory space
-        while self._running and not self._program_finished:
-            self.cycle()
-        return self._memory
-
-    def resume(self):
-        # resumes operation of the computer but does not reset the state, used if it hangs while waiting for user input
+    def run(self, max_cycles=None, until_outputs=None, until=None):
+        # Runs the computer until it halts (HALTED) or blocks waiting for input (NEEDS_INPUT) and returns why it stopped.
+        # max_cycles is a budget of instructions to execute (BUDGET_USED), the compiled engine checks it between blocks
+        # so it can be overshot by a block. until_outputs stops the run once that many new values are waiting in the
+        # output buffer (OUTPUTS_READY). until is a function that's called with the computer after every instruction and
+        # stops the run when it returns True (PREDICATE_HIT), runs with a predicate are always interpreted
+        cycle_limit = float("inf") if max_cycles is None else self._cycle_count + max_cycles
+        output_limit = float("inf") if until_outputs is None else len(self._output_buffer) + until_outputs
+        if self._run(cycle_limit, output_limit, until):
+            return PREDICATE_HIT
+        if self._program_finished:
+            return HALTED
+        if not self._running:
+            return NEEDS_INPUT
+        if len(self._output_buffer) >= output_limit:
+            return OUTPUTS_READY
+        return BUDGET_USED
+
+    def _run(self, cycle_limit=float("inf"), output_limit=float("inf"), until=None):
+        # runs until the computer halts, blocks on input, its cycle count reaches cycle_limit or there are output_limit
+        # values waiting in the output buffer. The compiled engine only checks the cycle limit between blocks. until is a
+        # predicate checked after every instruction, runs with one are always interpreted. Returns True if the predicate
+        # stopped the run. Every way of running goes through here so profiling, tracing and hooks see every run
+        self._output_limit = output_limit
+        while True:
+            if self._profiler is not None or self._tracer is not None or self._hooked:
+                if self._run_instrumented(cycle_limit, output_limit, until):
+                    return True
+            elif until is not None:
+                while self._running and not self._program_finished and self._cycle_count < cycle_limit and \
+                        len(self._output_buffer) < output_limit:
+                    self.cycle()
+                    if until(self):
+                        return True
+            elif self._engine is not None:
+                self._engine.run(cycle_limit, output_limit)
+            else:
+                while self._running and not self._program_finished and self._cycle_count < cycle_limit and \
+                        len(self._output_buffer) < output_limit:
+                    self.cycle()
+            if not self._pull_input():
+                return False
+
+    def _pull_input(self):
+        # called when a run loop stops, if it stopped on an input instruction with nothing to read the input provider is
+        # asked for a value. Returns True if it gave one and the computer is running again. The computer is stopped on
+        # the input instruction with everything up to date while the provider runs, so it's free to look at the computer,
+        # snapshot it or save a checkpoint
+        if self._running or self._program_finished or self._input_provider is None:
+            return False
+        if self._input_buffer:  # input was pushed while the computer was waiting, it's read before asking for more
+            self._running = True
+            return True
+        value = self._input_provider(self)
+        if value is None:
+            return False
+        self.input(value)
         self._running = True
-        self.run()
-
-    def _pull_from_memory(self, memory_address):
+        return True
+
+    def _run_instrumented(self, cycle_limit, output_limit, until=None):
+        # interpreter loop for a computer that's being profiled, traced or has hooks registered, in any combination. Every
+        # instruction is recorded in the profiler and the attached TraceRecorder and the hooks are called around it,
+        # returns True if the until predicate stopped it. Hooks are read once at the start so registering one from inside
+        # a hook takes effect next run
+        profiler, tracer = self._profiler, self._tracer
+        instruction_hooks, write_hooks, input_hooks, output_hooks = (tuple(self._hooks[event]) for event in HOOK_EVENTS)
+        memory = self._memory
+        current_pc = None
+        if write_hooks:
+            watched, on_watched_write = memory._watched, memory._on_watched_write  # the compiler's watch on its code
+
+            def on_write(address):
+                if on_watched_write is not None and address in watched:
+                    on_watched_write(address)
+                event = MemoryWriteEvent(self, current_pc, address, memory[address])
+                for hook in write_hooks:
+                    hook(event)
+
+            memory.watch(_AllAddresses(), on_write)
+        if tracer is not None:
+            tracer.begin(self)
         try:
-            # Try to access the value from normal program memory
-            return self._memory[memory_address]
-        except IndexError:
-            # If there's an index error pull the value from extended memory
-            return self._extended_memory.get(memory_address, 0)
+            with ProfilingTimer(profiler, self) if profiler is not None else nullcontext():
+                while self._running and not self._program_finished and self._cycle_count < cycle_limit and \
+                        len(self._output_buffer) < output_limit:
+                    current_pc = pc = self._pc
+                    word = memory[pc]
+                    try:
+                        decoded = self._decoded_instructions[word]
+                    except KeyError:
+                        decoded = self._decode(word)
+                    opcode = decoded.opcode
+                    if instruction_hooks:
+                        event = InstructionEvent(self, pc, word, opcode, decoded.parameter_modes[:opcode.n_params],
+                                                 self._peek_registers(pc, decoded))
+                        for hook in instruction_hooks:
+                            hook(event)
+                    waiting_input = self._input_buffer[0] if input_hooks and self._input_buffer else None
+                    n_outputs = len(self._output_buffer)
+                    self.cycle()
+                    if self._running:  # an input instruction that suspended the computer wasn't executed
+                        if profiler is not None:
+                            profiler.record(pc, word % 100, self._pc)
+                        if tracer is not None:
+                            tracer.record(self, pc, word)
+                    if input_hooks and opcode.value == 3 and self._running:
+                        event = InputEvent(self, pc, self._registers[0], waiting_input)
+                        for hook in input_hooks:
+                            hook(event)
+                    if output_hooks and len(self._output_buffer) > n_outputs:
+                        event = OutputEvent(self, pc, self._output_buffer[-1])
+                        for hook in output_hooks:
+                            hook(event)
+                    elif output_hooks and opcode.value == 4 and self._output_sink is not None:
+                        event = OutputEvent(self, pc, memory[self._registers[0]])  # the value went straight to the sink
+                        for hook in output_hooks:
+                            hook(event)
+                    if until is not None and until(self):
+                        return True
+        finally:
+            if write_hooks:
+                memory.watch(watched, on_watched_write)
+            if tracer is not None:
+                tracer.end(self)
+        return False
+
+    def _peek_registers(self, pc, decoded):
+        # the addresses the parameters of the instruction at pc resolve to, without moving the pc
+        memory = self._memory
+        registers = []
+        for address, mode in enumerate(decoded.parameter_modes[:decoded.opcode.n_params], pc + 1):
+            if mode == 0:
+                registers.append(memory[address])
+            elif mode == 1:
+                registers.append(address)
+            else:
+                registers.append(memory[address] + self._relative_offset)
+        return registers
+
+    def on_instruction(self, hook):
+        # registers hook(InstructionEvent) to be called before every instruction, returns the hook so this can be used
+        # as a decorator. While any hook is registered the computer runs on the interpreter
+        return self._add_hook("instruction", hook)
+
+    def on_memory_write(self, hook):
+        # registers hook(MemoryWriteEvent) to be called after every write an instruction makes to memory
+        return self._add_hook("memory_write", hook)
+
+    def on_input(self, hook):
+        # registers hook(InputEvent) to be called after every input instruction
+        return self._add_hook("input", hook)
+
+    def on_output(self, hook):
+        # registers hook(OutputEvent) to be called after every output instruction
+        return self._add_hook("output", hook)
+
+    def remove_hook(self, hook):
+        # unregisters a hook from every event it was registered for, once no hooks are left runs are back on the engine
+        for hooks in self._hooks.values():
+            while hook in hooks:
+                hooks.remove(hook)
+        self._hooked = any(self._hooks.values())
+
+    def set_input_provider(self, provider):
+        # provider(computer) is called whenever the program wants input and the input buffer is empty, it returns the
+        # next input or None to leave the computer waiting for input the way it would without a provider. A driver that
+        # works out each input from the state of the game lets a whole game run inside one run() call this way. Pass
+        # None to go back to only reading the buffer
+        self._input_provider = provider
+
+    def set_output_sink(self, sink):
+        # sink(value) is called with every value the program outputs, which then never goes to the output buffer (so
+        # until_outputs has nothing to count). On the compiled engine the sink is called from inside a compiled block,
+        # where the computer's program counter and cycle count aren't up to date, so it should only collect the value
+        # or push input. Pass None to go back to buffering outputs
+        self._output_sink = sink
+
+    def _add_hook(self, event, hook):
+        self._hooks[event].append(hook)
+        self._hooked = True
+        return hook
+
+    def enable_profiling(self):
+        # starts collecting an instruction level profile and returns the Profiler holding it. The computer runs on the
+        # interpreter while profiling, with profiling disabled the normal engine runs untouched
+        self._profiler = Profiler(self._opcodes)
+        return self._profiler
+
+    def disable_profiling(self):
+        # stops profiling and returns the Profiler that was collecting data
+        profiler = self._profiler
+        self._profiler = None
+        return profiler
+
+    def resume(self, max_cycles=None, until_outputs=None, until=None):
+        # resumes operation of the computer but does not reset the state, used if it hangs while waiting for user input.
+        # Takes the same limits as run() and returns why it stopped
+        self._running = True
+        return self.run(max_cycles, until_outputs, until)
 
-    def _load_registers(self, opcode):
+    def _load_registers(self, decoded):
         #load registers with the addresses where they can find the values required for operations
-        self._registers=[self._parameter_mode[parameter]() for parameter in self._parameter_array[0:opcode.n_params]]
+        self._registers=[parameter_function(self) for parameter_function in decoded.parameter_functions]
 
     def cycle(self):
         if self._running and not self._program_finished:
-            if self._verbose:
-                print("relative offset {}".format(self._relative_offset))
-                print("Pulling Instruction from memory address {}".format(self._pc))
-            opcode = self._pull_instruction()  # pull an instruction and advance the program counter
-
+            decoded = self._pull_instruction()  # pull an instruction and advance the program counter
             # fill the data registers by pulling from memory the required number of parameters
-            self._load_registers(opcode)
-            if self._verbose:
-                print("\t Opcode: {}:{}".format(opcode.value, opcode.descriptor) + ", Parameter modes: {}{}{}".format(
-                    *self._parameter_array))
-                i = 0
-                for reg in self._registers:
-                    print("\t Register {}:\t{} ({})".format(i, reg,self._memory[reg]))
-                    i += 1
-            opcode.execute()  # execute the opcode
-            # if self._verbose: print(self._memory)
+            self._load_registers(decoded)
+            decoded.opcode.execute(self)  # execute the opcode
+            if self._running:
+                self._cycle_count += 1  # an input instruction that suspends the computer doesn't count as a cycle
         else:
             raise ValueError("Tried to cycle computer but it is not running")
 
+    def _native_opcodes(self):
+        # set of opcode values whose behaviour hasn't been overridden by a subclass, the block compiler only inlines these
+        return {value for value, opcode in self._opcodes.items()
+                if opcode.function is getattr(IntcodeComputer, opcode.function.__name__, None)}
+
     # Object Properties
     @property
     def program_finished(self):
         return self._program_finished
 
+    @property
+    def hooks(self):
+        # dictionary of the hooks registered for each event in HOOK_EVENTS
+        return {event: list(hooks) for event, hooks in self._hooks.items()}
+
+    @property
+    def input_provider(self):
+        return self._input_provider
+
+    @property
+    def output_sink(self):
+        return self._output_sink
+
+    @property
+    def profiler(self):
+        # the Profiler collecting data, None when profiling is disabled
+        return self._profiler
+
+    @property
+    def tracer(self):
+        # the TraceRecorder attached to the computer, None when it isn't being traced
+        return self._tracer
+
+    @property
+    def engine(self):
+        # name of the execution engine used by run()
+        return self._engine_name
+
+    @property
+    def cycle_count(self):
+        # number of instructions executed since the last reset
+        return self._cycle_count
+
     @property
     def valid_opcodes(self):
         return [opcode.value for opcode in self._opcodes]
@@ -167,6 +602,16 @@ class IntcodeComputer():
     def memory(self):
         return self._memory
 
+    @property
+    def compiler(self):
+        # the BlockCompiler running the software, None when the computer runs on the interpreter
+        return self._engine
+
+    @property
+    def overflow(self):
+        # overflow policy of the computer's memory
+        return self._memory.overflow
+
     @property
     def output_waiting(self):
         # Outputs how many outputs are waiting on the output buffer
@@ -200,14 +645,17 @@ class IntcodeComputer():
     def _op_input(self):
         # pop a value from the input buffer in fifo format and write to the memory address in register[0]
         try:
-            self._memory[self._registers[0]]= self._input_buffer.pop(0)
+            self._memory[self._registers[0]]= self._input_buffer.popleft()
         except IndexError:  # Index error occurs because we tried to pop from an empty list, need to suspend execution until we have input
             self._pc -= 2  # decrement the program counter twice so that when the system resumes it's at the input instruction
             self._running = False
 
     def _op_output(self):
-        # take value in register[0] and puts it on the output buffer
-        self._output_buffer.append(self._memory[self._registers[0]])
+        # take value in register[0] and puts it on the output buffer, or hands it to the output sink if there is one
+        if self._output_sink is None:
+            self._output_buffer.append(self._memory[self._registers[0]])
+        else:
+            self._output_sink(self._memory[self._registers[0]])
 
     def _op_jmp_if_true(self):
         # if the value of the reg 0 is not zero, set the program counter to the value of register 1
@@ -233,6 +681,32 @@ class IntcodeComputer():
         self._memory[self._registers[2]]= result
         pass
 
+    def _op_jmp_if_less_than(self):
+        # stores whether reg 0 is less than reg 1 in the address in reg 2 and jumps to reg 3 if it is
+        if self._compare_and_store(self._memory[self._registers[0]] < self._memory[self._registers[1]]):
+            self._pc = self._memory[self._registers[3]]
+
+    def _op_jmp_if_not_less_than(self):
+        if not self._compare_and_store(self._memory[self._registers[0]] < self._memory[self._registers[1]]):
+            self._pc = self._memory[self._registers[3]]
+
+    def _op_jmp_if_equal_to(self):
+        if self._compare_and_store(self._memory[self._registers[0]] == self._memory[self._registers[1]]):
+            self._pc = self._memory[self._registers[3]]
+
+    def _op_jmp_if_not_equal_to(self):
+        if not self._compare_and_store(self._memory[self._registers[0]] == self._memory[self._registers[1]]):
+            self._pc = self._memory[self._registers[3]]
+
+    def _compare_and_store(self, result):
+        # writes the result of a fused comparison to the address in reg 2 like opcodes 7 and 8 do
+        self._memory[self._registers[2]] = 1 if result else 0
+        return result
+
+    def _op_skip(self):
+        # takes the place of an instruction the optimizer removed
+        pass
+
     def _op_set_relative_offest(self):
         self._relative_offset += self._memory[self._registers[0]]
 
@@ -1,40 +1,602 @@
-import re
+import sys
+import json
+import random
+import argparse
+import platform
+import itertools
+import os
+import gc
+import tracemalloc
 import numpy as np
 import timeit
+from pathlib import Path
+import intcode
+import memory
+import pool
+import programs
 
-def load_commented_program(file_path):
-    with open(file_path) as file:
-        int_code=re.findall("[0-9]+",",".join([line.split("#")[0] for line in file.readlines()])) #pull int code as a string
-        return np.array([int(num) for num in int_code])   #return int_code as a numpy array
+# Benchmark suite for the intcode computer.
+# Every benchmark runs one workload from a freshly reset computer, the puzzle programs are driven the same way the day
+# scripts drive them and the synthetic kernels scale with --scale. For each benchmark the suite reports the instruction
+# rate (best of --repeats runs), how long resetting the computers afterwards takes and the peak memory allocated while
+# building and running the workload. Results can be saved as JSON and compared against a stored baseline, the comparison
+# fails if a benchmark got slower or hungrier than the tolerance allows or executed a different number of instructions
+#
+#   python intcode_performance.py --save results.json
+#   python intcode_performance.py --baseline results.json --tolerance 0.25
+#   python intcode_performance.py --baseline   (compares against the committed benchmark_baseline.json)
+#   python intcode_performance.py --instances 10000
+#   python intcode_performance.py --construction
+#   python intcode_performance.py --drivers
 
-setup_code= '''
-from __main__ import load_commented_program
-import intcode
-import numpy as np
-from pathlib import Path
-import re
+PUZZLE_INPUTS = Path(__file__).resolve().parent.parent / "puzzle_inputs"
+SPEED_TEST = Path(__file__).resolve().parent / "speed_test.txt"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+RESET_NOISE_FLOOR = 5e-5  # resets faster than this (seconds) are too noisy to compare
+
+
+def load_puzzle(day):
+    return programs.load_program(PUZZLE_INPUTS / "day{}_input.txt".format(day))
+
+def writing_program(n_words, n_writes, stride=512):
+    # builds a program n_words long that writes to n_writes addresses spaced stride words apart and then halts
+    program = np.zeros(max(n_words, 4 * n_writes + 1), dtype=np.int64)
+    for j in range(n_writes):
+        program[4 * j:4 * j + 4] = (1101, 0, 1, (j + 1) * stride)  # store 0+1 at the next address
+    program[4 * n_writes] = 99
+    return program
+
+def counting_program():
+    # tight loop that counts address 20 up to the number given as input, three instructions per iteration
+    return np.array([3, 21,             # read the number of iterations into address 21
+                     1001, 20, 1, 20,   # 2: add one to the counter
+                     7, 20, 21, 22,     # 6: is the counter still below the number of iterations
+                     1005, 22, 2,       # 10: if it is go back around
+                     99,                # 13
+                     0, 0, 0, 0, 0, 0,  # padding
+                     0, 0, 0], dtype=np.int64)
+
+def counting_loop_program(rng):
+    # random program for the differential check: sets up six cells, runs a loop that counts one of them towards a limit
+    # while making random updates to the others (and sometimes moving the relative offset), then outputs the cells
+    cells = list(range(200, 206))
+    program = []
+    for cell in cells:
+        program += [1101, rng.randint(-20, 20), 0, cell]
+    program += [109, 200]  # relative mode parameters point at the cells
+    start = len(program)
+
+    def operand():
+        mode = rng.choice((0, 0, 1, 2))
+        return mode, rng.choice(cells) if mode == 0 else rng.randint(-5, 5) if mode == 1 else rng.randint(0, 5)
+
+    body = []
+    for _ in range(rng.randint(1, 4)):
+        opcode = rng.choice((1, 1, 1, 2, 7, 8, 9))
+        if opcode == 9:
+            body.append([109, rng.choice((1, 2, -1))])
+            continue
+        (mode_a, a), (mode_b, b) = operand(), operand()
+        mode_c = rng.choice((0, 0, 2))
+        c = rng.choice(cells) if mode_c == 0 else rng.randint(0, 5)
+        body.append([opcode + 100 * mode_a + 1000 * mode_b + 10000 * mode_c, a, b, c])
+    counter, flag, limit = rng.choice(cells), rng.choice(cells), rng.randint(-50, 300)
+    body.append([1001, counter, rng.choice((1, -1, 2, 3)), counter])
+    rng.shuffle(body)
+    program += [word for instruction in body for word in instruction]
+    exit_test = rng.choice(("lt", "gt", "eq", "nonzero", "fused"))
+    if exit_test == "lt":
+        program += [1007, counter, limit, flag, 1005, flag, start]
+    elif exit_test == "gt":
+        program += [107, limit, counter, flag, 1006, flag, start]
+    elif exit_test == "eq":
+        program += [1008, counter, limit, flag, 1006, flag, start]
+    elif exit_test == "nonzero":
+        program += [1005, counter, start]
+    else:
+        program += [1000 + rng.choice((20, 21, 22, 23)), counter, limit, flag, start, 0, 0]
+    for cell in cells:
+        program += [4, cell]
+    return program + [204, 0, 99]
+
+
+# Workloads, each one takes the list of computers a benchmark built, runs them from their reset state and returns the
+# number of instructions executed
+def run_day2(machines):
+    # the gravity assist program with the noun fixed at 12 and every verb, one reset per run
+    computer = machines[0]
+    instructions = 0
+    for verb in range(100):
+        computer.reset()
+        computer.memory[1] = 12
+        computer.memory[2] = verb
+        computer.run()
+        instructions += computer.cycle_count
+    return instructions
+
+def run_day5(machines):
+    # the diagnostic program for both the air conditioner (1) and the thermal radiator (5)
+    computer = machines[0]
+    instructions = 0
+    for system_id in (1, 5):
+        computer.reset()
+        computer.input(system_id)
+        computer.run()
+        instructions += computer.cycle_count
+    return instructions
+
+def run_day7(machines):
+    # every phase setting of the amplifier feedback loop
+    instructions = 0
+    for phases in itertools.permutations(range(5, 10)):
+        for amp, phase in zip(machines, phases):
+            amp.reset()
+            amp.input(phase)
+        signal = 0
+        while not machines[-1].program_finished:
+            for amp in machines:
+                amp.input(signal)
+                amp.resume()
+                signal = amp.flush_output()[-1]
+        instructions += sum(amp.cycle_count for amp in machines)
+    return instructions
+
+def run_day9(machines):
+    # the BOOST program in sensor boost mode
+    computer = machines[0]
+    computer.input(2)
+    computer.run()
+    return computer.cycle_count
+
+def run_day11(machines):
+    # the hull painting robot starting on a black panel
+    robot = machines[0]
+    panels = {}
+    position, direction = (0, 0), (0, 1)
+    while not robot.program_finished:
+        robot.input(panels.get(position, 0))
+        robot.resume()
+        color, turn = robot.flush_output()
+        panels[position] = color
+        direction = (-direction[1], direction[0]) if turn == 0 else (direction[1], -direction[0])
+        position = (position[0] + direction[0], position[1] + direction[1])
+    return robot.cycle_count
+
+def run_day13(machines):
+    # plays the arcade game to the end by keeping the paddle under the ball
+    cabinet = machines[0]
+    cabinet.memory[0] = 2  # insert quarters
+    ball, paddle = 0, 0
+    while not cabinet.program_finished:
+        cabinet.resume()
+        outputs = cabinet.flush_output()
+        for x, y, tile in zip(outputs[::3], outputs[1::3], outputs[2::3]):
+            if tile == 4 and x != -1:
+                ball = x
+            elif tile == 3 and x != -1:
+                paddle = x
+        cabinet.input((ball > paddle) - (ball < paddle))
+    return cabinet.cycle_count
+
+def run_day11_pulled(machines):
+    # run_day11 with the camera as an input provider and the paint and turn outputs going to an output sink, so the
+    # whole painting run is one run() call
+    robot = machines[0]
+    panels = {}
+    state = {"position": (0, 0), "direction": (0, 1), "color": None}
+
+    def camera(computer):
+        return panels.get(state["position"], 0)
+
+    def paint_and_turn(value):
+        if state["color"] is None:
+            state["color"] = value
+            return
+        panels[state["position"]] = state["color"]
+        state["color"] = None
+        direction = state["direction"]
+        direction = (-direction[1], direction[0]) if value == 0 else (direction[1], -direction[0])
+        state["direction"] = direction
+        state["position"] = (state["position"][0] + direction[0], state["position"][1] + direction[1])
+
+    robot.set_input_provider(camera)
+    robot.set_output_sink(paint_and_turn)
+    robot.run()
+    robot.set_input_provider(None)
+    robot.set_output_sink(None)
+    return robot.cycle_count
+
+def run_day13_pulled(machines):
+    # run_day13 with the joystick as an input provider, the game is played to the end in one run() call
+    cabinet = machines[0]
+    cabinet.memory[0] = 2  # insert quarters
+    positions = {3: 0, 4: 0}  # tile -> x position of the paddle and the ball
+
+    def joystick(computer):
+        outputs = computer.flush_output()
+        for x, y, tile in zip(outputs[::3], outputs[1::3], outputs[2::3]):
+            if tile in positions and x != -1:
+                positions[tile] = x
+        ball, paddle = positions[4], positions[3]
+        return (ball > paddle) - (ball < paddle)
+
+    cabinet.set_input_provider(joystick)
+    cabinet.run()
+    cabinet.set_input_provider(None)
+    return cabinet.cycle_count
+
+def run_day15(machines, n_moves=5000):
+    # drives the repair droid on a seeded random walk, picking a new direction whenever it hits a wall
+    droid = machines[0]
+    moves = random.Random(15)
+    direction = 1
+    for _ in range(n_moves):
+        droid.input(direction)
+        droid.resume()
+        if droid.get_output() == 0:
+            direction = moves.randint(1, 4)
+    return droid.cycle_count
+
+def run_copy_kernel(machines, n_iterations):
+    # speed_test.txt, multiplies two numbers into a new deep memory address every iteration
+    computer = machines[0]
+    computer.input(n_iterations)
+    computer.run()
+    return computer.cycle_count
+
+def run_count_kernel(machines, n_iterations):
+    computer = machines[0]
+    computer.input(n_iterations)
+    computer.run()
+    return computer.cycle_count
+
+def run_reset_kernel(machines, n_runs):
+    # a long program that writes to 100 pages and halts, dominated by resets
+    computer = machines[0]
+    instructions = 0
+    for _ in range(n_runs):
+        computer.reset()
+        computer.run()
+        instructions += computer.cycle_count
+    return instructions
+
+
+class Benchmark():
+    def __init__(self, name, software, workload, n_machines=1):
+        self.name = name
+        self.software = software  # the program every computer is built with
+        self.workload = workload  # function that runs the workload on a list of computers and counts instructions
+        self.n_machines = n_machines
+
+    def build(self, engine, overflow="checked"):
+        return [intcode.IntcodeComputer(self.software, engine=engine, overflow=overflow) for _ in range(self.n_machines)]
+
+
+def benchmarks(scale=1):
+    # the suite, synthetic kernels run scale times as much work
+    return [
+        Benchmark("day2", load_puzzle(2), run_day2),
+        Benchmark("day5", load_puzzle(5), run_day5),
+        Benchmark("day7", load_puzzle(7), run_day7, n_machines=5),
+        Benchmark("day9", load_puzzle(9), run_day9),
+        Benchmark("day11", load_puzzle(11), run_day11),
+        Benchmark("day13", load_puzzle(13), run_day13),
+        Benchmark("day15", load_puzzle(15), run_day15),
+        Benchmark("copy_kernel", programs.load_program(SPEED_TEST),
+                  lambda machines: run_copy_kernel(machines, 10000 * scale)),
+        Benchmark("count_kernel", counting_program(), lambda machines: run_count_kernel(machines, 100000 * scale)),
+        Benchmark("reset_kernel", writing_program(100000, 100), lambda machines: run_reset_kernel(machines, 100 * scale)),
+    ]
+
+
+def measure(benchmark, engine, repeats=3, overflow="checked"):
+    # runs one benchmark and returns a dictionary of its results
+    tracemalloc.start()  # memory is measured on its own run since tracing slows everything down
+    machines = benchmark.build(engine, overflow)
+    benchmark.workload(machines)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    machines = benchmark.build(engine, overflow)
+    best_time, best_reset = float("inf"), float("inf")
+    for _ in range(repeats):
+        for machine in machines:
+            machine.reset()
+        start = timeit.default_timer()
+        instructions = benchmark.workload(machines)
+        best_time = min(best_time, timeit.default_timer() - start)
+        start = timeit.default_timer()
+        for machine in machines:
+            machine.reset()
+        best_reset = min(best_reset, timeit.default_timer() - start)
+    return {
+        "instructions": instructions,
+        "seconds": best_time,
+        "instructions_per_second": instructions / best_time,
+        "reset_seconds": best_reset,
+        "peak_memory_bytes": peak_memory,
+    }
+
+def run_suite(engine="compiled", repeats=3, scale=1, only=None, overflow="checked"):
+    results = {"engine": engine, "overflow": overflow, "python": platform.python_version(), "scale": scale,
+               "repeats": repeats, "benchmarks": {}}
+    for benchmark in benchmarks(scale):
+        if only and benchmark.name not in only:
+            continue
+        results["benchmarks"][benchmark.name] = result = measure(benchmark, engine, repeats, overflow)
+        print("{:<14}{:>12}{:>16.03e}{:>14.03e}{:>12.0f}".format(
+            benchmark.name, result["instructions"], result["instructions_per_second"], result["reset_seconds"],
+            result["peak_memory_bytes"] / 1024))
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    # returns a list of the ways results regressed from the baseline, empty if nothing did
+    failures = []
+    for name, result in results["benchmarks"].items():
+        expected = baseline["benchmarks"].get(name)
+        if expected is None:
+            continue
+        if result["instructions"] != expected["instructions"]:
+            failures.append("{}: executed {} instructions, baseline executed {}".format(
+                name, result["instructions"], expected["instructions"]))
+        if result["instructions_per_second"] < expected["instructions_per_second"] * (1 - tolerance):
+            failures.append("{}: {:.03e} instructions per second, baseline was {:.03e}".format(
+                name, result["instructions_per_second"], expected["instructions_per_second"]))
+        if max(result["reset_seconds"], RESET_NOISE_FLOOR) > \
+                max(expected["reset_seconds"], RESET_NOISE_FLOOR) * (1 + tolerance):
+            failures.append("{}: reset took {:.03e} seconds, baseline was {:.03e}".format(
+                name, result["reset_seconds"], expected["reset_seconds"]))
+        if result["peak_memory_bytes"] > expected["peak_memory_bytes"] * (1 + tolerance):
+            failures.append("{}: peak memory {} bytes, baseline was {}".format(
+                name, result["peak_memory_bytes"], expected["peak_memory_bytes"]))
+    return failures
+
+
+def machine_state(computer):
+    # everything about a computer the differential check expects both engines to agree on
+    return (computer.cycle_count, computer.program_finished, computer._relative_offset,
+            computer.memory.to_array().tolist(), list(computer._output_buffer))
+
+def differential(scale=1, only=None, n_random=500, seed=0, max_cycles=20000):
+    # runs the benchmarks and n_random random counting loop programs on the interpreter and on the compiled engine
+    # (which runs counting loops in closed form) and returns a list of every difference between the two
+    failures = []
+    for benchmark in benchmarks(scale):
+        if only and benchmark.name not in only:
+            continue
+        results = []
+        for engine in ("interpreter", "compiled"):
+            machines = benchmark.build(engine)
+            instructions = benchmark.workload(machines)
+            results.append((instructions, [machine_state(machine) for machine in machines]))
+        if results[0] != results[1]:
+            failures.append("{}: the compiled engine finished in a different state".format(benchmark.name))
+    rng = random.Random(seed)
+    for _ in range(n_random):
+        program = counting_loop_program(rng)
+        overflow = rng.choice(intcode.OVERFLOW_POLICIES)
+        if overflow == "unbounded" and any(word % 100 == 2 for word in program):
+            overflow = "checked"  # repeated squaring without a bound runs out of memory
+        results = []
+        for engine in ("interpreter", "compiled"):
+            computer = intcode.IntcodeComputer(program, engine=engine, overflow=overflow)
+            try:
+                status = computer.run(max_cycles=max_cycles)
+                results.append((status, machine_state(computer) if status == intcode.HALTED else None))
+            except (ValueError, OverflowError) as error:
+                results.append((type(error).__name__, None))
+        if results[0][0] == intcode.BUDGET_USED:
+            continue  # the engines are allowed to stop at different points when they run out of budget
+        if results[0] != results[1]:
+            failures.append("{} ({} overflow): interpreter {}, compiled {}".format(
+                program, overflow, results[0][0], results[1][0]))
+    return failures
+
+
+def reset_benchmark(n_repeats=1000):
+    # times reset() after a run of software that writes to a set number of pages, since reset only restores the pages
+    # that were written the time should go up with the number of writes but not with the length of the program
+    print("reset cost after a run (seconds per reset)")
+    print("{:>12}{:>12}{:>12}{:>12}".format("words", "1 write", "10 writes", "100 writes"))
+    for n_words in (1000, 10000, 100000):
+        times = []
+        for n_writes in (1, 10, 100):
+            computer = intcode.IntcodeComputer(writing_program(n_words, n_writes))
+            total = 0
+            for _ in range(n_repeats):
+                computer.run()
+                start = timeit.default_timer()
+                computer.reset()
+                total += timeit.default_timer() - start
+            times.append(total / n_repeats)
+        print("{:>12}".format(n_words) + "".join("{:>12.03e}".format(t) for t in times))
+
+
+def resident_bytes():
+    # resident set size of this process, read from /proc so it's only available on linux
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def instance_benchmark(n_instances=10000, engine="compiled"):
+    # resident memory of many computers loaded with the same program, once built and again after each has run. They
+    # all share one program image so the memory per computer should stay well under the size of the program
+    print("resident memory of {} computers (bytes per computer)".format(n_instances))
+    print("{:<14}{:>12}{:>12}{:>12}{:>10}".format("program", "words", "built", "after run", "images"))
+    workloads = [("day7", load_puzzle(7), lambda i: (i % 5, i)), ("day9", load_puzzle(9), lambda i: (1,))]
+    for name, software, inputs in workloads:
+        gc.collect()
+        start = resident_bytes()
+        computers = [intcode.IntcodeComputer(software, engine=engine) for _ in range(n_instances)]
+        built = resident_bytes()
+        for i, computer in enumerate(computers):
+            for value in inputs(i):
+                computer.input(value)
+            computer.run()
+        after_run = resident_bytes()
+        print("{:<14}{:>12}{:>12.0f}{:>12.0f}{:>10}".format(name, len(software), (built - start) / n_instances,
+                                                            (after_run - start) / n_instances,
+                                                            memory.loaded_images()))
+        del computers, computer
+
+
+def construction_benchmark(n_runs=1000, engine="compiled"):
+    # splits short runs into the time spent getting a computer and the time spent running it, once with a new computer
+    # built for every run and once with computers taken from a ComputerPool. Pooled computers keep what the engine
+    # compiled so once they've warmed up their runs are quicker as well, but compiling the blocks costs more than a few
+    # short runs save so over too few runs pooling doesn't pay off. The blocks compiled by the pooled computers are
+    # counted and every program pooling didn't help is listed
+    print("construction against run time for {} short runs (seconds per run)".format(n_runs))
+    print("{:<14}{:>12}{:>12}{:>14}{:>12}{:>10}".format("program", "build", "run", "pool acquire", "pooled run",
+                                                        "compiles"))
+    no_gain = []
+    workloads = [("day2", load_puzzle(2), (), {1: 12, 2: 2}), ("day5", load_puzzle(5), (1,), {}),
+                 ("day7", load_puzzle(7), (3, 0), {}), ("day9", load_puzzle(9), (1,), {})]
+    for name, software, inputs, patches in workloads:
+        def run(computer):
+            for address, value in patches.items():
+                computer.memory[address] = value
+            for value in inputs:
+                computer.input(value)
+            computer.run()
+
+        build_time = run_time = 0
+        for _ in range(n_runs):
+            start = timeit.default_timer()
+            computer = intcode.IntcodeComputer(software, engine=engine)
+            built = timeit.default_timer()
+            run(computer)
+            build_time += built - start
+            run_time += timeit.default_timer() - built
+
+        computers = pool.ComputerPool(software, engine=engine)
+        acquire_time = pooled_run_time = 0
+        pooled = {}
+        for _ in range(n_runs):
+            start = timeit.default_timer()
+            computer = computers.acquire()
+            pooled[id(computer)] = computer
+            acquired = timeit.default_timer()
+            run(computer)
+            ran = timeit.default_timer()
+            computers.release(computer)
+            acquire_time += acquired - start + timeit.default_timer() - ran  # handing it back is part of the cost
+            pooled_run_time += ran - acquired
+        compiles = sum(computer.compiler.n_compiled for computer in pooled.values() if computer.compiler is not None)
+        print("{:<14}{:>12.03e}{:>12.03e}{:>14.03e}{:>12.03e}{:>10}".format(
+            name, build_time / n_runs, run_time / n_runs, acquire_time / n_runs, pooled_run_time / n_runs, compiles))
+        if acquire_time + pooled_run_time >= build_time + run_time:
+            no_gain.append(name)
+    if no_gain:
+        print("pooling was slower than building a computer per run for {} over {} runs, compiling their blocks costs "
+              "more than the runs save".format(", ".join(no_gain), n_runs))
+
+
+def driver_benchmark(repeats=3, engine="compiled"):
+    # the interactive puzzles driven the old way, a python loop that pushes an input and resumes the computer for every
+    # step, against the same drivers written as an input provider (and output sink) that the computer calls itself
+    print("interactive drivers (steps per second, a step is one input)")
+    print("{:<14}{:>12}{:>14}{:>14}{:>10}".format("program", "steps", "resume loop", "provider", "speedup"))
+    drivers = [("day11", load_puzzle(11), run_day11, run_day11_pulled),
+               ("day13", load_puzzle(13), run_day13, run_day13_pulled)]
+    for name, software, resumed, pulled in drivers:
+        rates = []
+        for workload in (resumed, pulled):
+            computer = intcode.IntcodeComputer(software, engine=engine)
+            inputs = []
+            best = float("inf")
+            for _ in range(repeats):
+                computer.reset()
+                start = timeit.default_timer()
+                workload([computer])
+                best = min(best, timeit.default_timer() - start)
+            computer.reset()
+            hook = computer.on_input(inputs.append)  # counted on a separate run, hooks put the computer on the interpreter
+            workload([computer])
+            computer.remove_hook(hook)
+            rates.append((len(inputs), len(inputs) / best))
+        print("{:<14}{:>12}{:>14.03e}{:>14.03e}{:>9.2f}x".format(name, rates[0][0], rates[0][1], rates[1][1],
+                                                                 rates[1][1] / rates[0][1]))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Intcode computer benchmark suite")
+    parser.add_argument("--engine", default="compiled", choices=intcode.ENGINES)
+    parser.add_argument("--overflow", default="checked", choices=intcode.OVERFLOW_POLICIES)
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per benchmark, the best one is kept")
+    parser.add_argument("--scale", type=int, default=1, help="multiplies the work done by the synthetic kernels")
+    parser.add_argument("--only", nargs="+", help="names of the benchmarks to run")
+    parser.add_argument("--save", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, nargs="?", const=DEFAULT_BASELINE,
+                        help="compare against a saved JSON file (default {})".format(DEFAULT_BASELINE.name))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional regression")
+    parser.add_argument("--reset-table", action="store_true", help="also print reset cost against program size")
+    parser.add_argument("--instances", type=int, nargs="?", const=10000, metavar="N_INSTANCES",
+                        help="instead of timing, report the resident memory of N_INSTANCES computers")
+    parser.add_argument("--construction", type=int, nargs="?", const=1000, metavar="N_RUNS",
+                        help="instead of timing, compare building a computer per run against using a pool")
+    parser.add_argument("--drivers", action="store_true",
+                        help="instead of timing the suite, compare resume loops against input providers")
+    parser.add_argument("--differential", type=int, nargs="?", const=500, metavar="N_RANDOM",
+                        help="instead of timing, check the compiled engine ends every benchmark and N_RANDOM random "
+                             "counting loop programs in the same state as the interpreter")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.differential is not None:
+        failures = differential(arguments.scale, arguments.only, arguments.differential)
+        for failure in failures:
+            print("MISMATCH " + failure)
+        print("{} mismatches between the interpreter and the compiled engine".format(len(failures)))
+        return 1 if failures else 0
+
+    if arguments.drivers:
+        driver_benchmark(arguments.repeats, arguments.engine)
+        return 0
+
+    if arguments.construction is not None:
+        construction_benchmark(arguments.construction, arguments.engine)
+        return 0
+
+    if arguments.instances is not None:
+        instance_benchmark(arguments.instances, arguments.engine)
+        return 0
 
-n_runs=1000
-computer = intcode.IntcodeComputer(verbose=False)
-input_path=Path("speed_test.txt")
-int_code=load_commented_program(input_path)
-computer.load_software(int_code)
-'''
+    baseline = None
+    if arguments.baseline is not None:
+        # read before the suite runs so a bad path fails straight away instead of after every benchmark has run
+        try:
+            with open(arguments.baseline) as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            parser.error("no baseline at {}, make one with --save {}".format(arguments.baseline, arguments.baseline))
+        except ValueError as error:
+            parser.error("baseline {} isn't a saved results file: {}".format(arguments.baseline, error))
+        # the compiled engine warms up over the repeats so the rates are only comparable with the same settings
+        settings = {name: baseline.get(name) for name in ("engine", "overflow", "scale", "repeats")}
+        if settings != {"engine": arguments.engine, "overflow": arguments.overflow, "scale": arguments.scale,
+                        "repeats": arguments.repeats}:
+            parser.error("baseline {} was saved with {}, run with the same settings".format(
+                arguments.baseline, ", ".join("{}={}".format(name, value) for name, value in settings.items())))
 
-evaluation_code_reset='''
-computer.reset()
-'''
+    print("{:<14}{:>12}{:>16}{:>14}{:>12}".format("benchmark", "instructions", "instructions/s", "reset (s)",
+                                                  "peak (KiB)"))
+    results = run_suite(arguments.engine, arguments.repeats, arguments.scale, arguments.only,
+                        arguments.overflow)
+    if arguments.save is not None:
+        with open(arguments.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if arguments.reset_table:
+        reset_benchmark()
+    if baseline is not None:
+        failures = compare(results, baseline, arguments.tolerance)
+        for failure in failures:
+            print("REGRESSION " + failure)
+        if failures:
+            return 1
+        print("no regressions against {}".format(arguments.baseline))
+    return 0
 
-evaluation_code_program='''
-computer.reset()
-computer.input(100)
-computer.run()
-'''
 
 if __name__=="__main__":
-    n_repeats=100000
-    eval_time=timeit.timeit(evaluation_code_reset, setup=setup_code,number=n_repeats)
-    print("resetting computer took {:.03e} seconds per iteration".format(eval_time/n_repeats))
-    n_repeats=1000
-    eval_time = timeit.timeit(evaluation_code_program, setup=setup_code, number=n_repeats)
-    print("running intcode test software took {:.03e} seconds per iteration".format(eval_time / n_repeats))
\ No newline at end of file
+    sys.exit(main())
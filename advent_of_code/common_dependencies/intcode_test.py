@@ -1,28 +1,308 @@
+import asyncio
+import async_intcode
 import intcode
+import intcode_performance
+import memory
 import numpy as np
 from pathlib import Path
-import re
+import checkpoint
+import os
+import programs
+import random
+import subprocess
+import sys
+import tempfile
 import timeit
 
+DATA_START = 100  # random programs keep their data in the six words from here
+ADVENT_OF_CODE = Path(__file__).resolve().parent.parent  # where the day scripts and puzzle inputs live
+ENGINES = ("interpreter", "compiled")
+# puzzle answers the day 5 and day 9 programs have always given, (day, input) -> outputs
+PUZZLE_ANSWERS = {(5, 1): [0, 0, 0, 0, 0, 0, 0, 0, 0, 11193703], (5, 5): [12410607], (9, 1): [2932210790], (9, 2): [73144]}
 
-def load_commented_program(file_path):
-    with open(file_path) as file:
-        int_code=re.findall("[0-9]+",",".join([line.split("#")[0] for line in file.readlines()])) #pull int code as a string
-        return np.array([int(num) for num in int_code])   #return int_code as a numpy array
 
+def random_program(rng):
+    # random program for the differential test: arithmetic, comparisons, jumps to other instructions, relative offset
+    # moves, input and output on a small block of data, ending in a halt. Relative writes can land on the program itself
+    # and jumps to addresses read from the data can land anywhere, the engines have to agree on those too
+    instructions = []
+    for _ in range(rng.randint(5, 20)):
+        opcode = rng.choice((1, 1, 2, 3, 4, 5, 6, 7, 8, 9))
+        parameters = []
+        modes = []
+        for n in range({1: 3, 2: 3, 3: 1, 4: 1, 5: 2, 6: 2, 7: 3, 8: 3, 9: 1}[opcode]):
+            writes = n == 2 or opcode == 3
+            mode = rng.choice((0, 2) if writes else (0, 1, 2))
+            if mode == 0:
+                parameters.append(rng.randrange(DATA_START, DATA_START + 6))
+            elif mode == 2:
+                parameters.append(rng.randrange(0, 6))
+            else:
+                parameters.append(rng.randint(-10, 10))
+            modes.append(mode)
+        if opcode in (5, 6) and modes[1] == 1:
+            parameters[1] = None  # filled in with the address of an instruction once they're all laid out
+        if opcode == 9:
+            modes[0] = 1
+            parameters[0] = rng.choice((-1, 1, 2))
+        instructions.append((opcode + sum(mode * 10 ** (n + 2) for n, mode in enumerate(modes)), parameters))
+    addresses = []
+    address = 2  # after the opening relative offset move
+    for _, parameters in instructions:
+        addresses.append(address)
+        address += 1 + len(parameters)
+    addresses.append(address)  # the halt
+    program = [109, DATA_START]
+    for word, parameters in instructions:
+        program += [word] + [rng.choice(addresses) if parameter is None else parameter for parameter in parameters]
+    program += [99]
+    return program + [0] * (DATA_START + 6 - len(program)) + [rng.randint(-5, 5) for _ in range(6)]
 
+def run_engine(program, engine, inputs, max_cycles):
+    # everything the differential test compares from one run of a program
+    computer = intcode.IntcodeComputer(program, engine=engine)
+    for value in inputs:
+        computer.input(value)
+    try:
+        status = computer.run(max_cycles=max_cycles)
+    except (ValueError, IndexError, OverflowError) as error:
+        return type(error).__name__
+    return (status, computer.flush_output(), computer.memory.to_array().tolist(), computer.cycle_count,
+            computer._relative_offset)
+
+def differential_test(n_programs=500, seed=2019, max_cycles=5000):
+    # runs seeded random programs on the interpreter and on the compiled engine and checks they finish with the same
+    # outputs, memory and cycle count. Runs that use up max_cycles are skipped, the engines can stop at different
+    # points inside their budget
+    rng = random.Random(seed)
+    n_compared = 0
+    for _ in range(n_programs):
+        program = random_program(rng)
+        inputs = [rng.randint(-10, 10) for _ in range(3)]
+        expected = run_engine(program, "interpreter", inputs, max_cycles)
+        if type(expected) is tuple and expected[0] == intcode.BUDGET_USED:
+            continue
+        result = run_engine(program, "compiled", inputs, max_cycles)
+        assert result == expected, "Engines disagree on {} with inputs {}: interpreter {}, compiled {}".format(
+            program, inputs, expected, result)
+        n_compared += 1
+    print("differential test passed, {} random programs compared".format(n_compared))
+
+def loop_acceleration_test(n_iterations=10**6, n_programs=300, seed=2019):
+    # the compiled engine runs counting loops in closed form instead of going round them, check that it does and that
+    # it ends up exactly where stepping through the loop would
+    program = intcode_performance.counting_program()
+    computer = intcode.IntcodeComputer(program)
+    computer.input(n_iterations)
+    computer.run()
+    assert computer.program_finished
+    assert computer.compiler.accelerated_loops == 1, "Counting loop wasn't accelerated"
+    assert computer.compiler.skipped_cycles > 0
+    assert computer.memory[20] == n_iterations
+    assert computer.cycle_count == 3 * n_iterations + 2  # the input, three instructions per iteration and the halt
+
+    for n in (1, 2, 3, 1000):
+        states = []
+        for engine in ("interpreter", "compiled"):
+            computer = intcode.IntcodeComputer(program, engine=engine)
+            computer.input(n)
+            computer.run()
+            states.append(intcode_performance.machine_state(computer))
+        assert states[0] == states[1], "Engines disagree on the counting loop run {} times".format(n)
+
+    # random loops with other updates in the body, different steps, exit tests and overflow policies
+    rng = random.Random(seed)
+    skipped_cycles = 0
+    for _ in range(n_programs):
+        loop = intcode_performance.counting_loop_program(rng)
+        overflow = rng.choice(("checked", "wrap"))
+        states = []
+        for engine in ("interpreter", "compiled"):
+            computer = intcode.IntcodeComputer(loop, engine=engine, overflow=overflow)
+            try:
+                status = computer.run(max_cycles=20000)
+            except (ValueError, OverflowError) as error:
+                states.append(type(error).__name__)
+                continue
+            states.append((status, intcode_performance.machine_state(computer) if status == intcode.HALTED else None))
+        if states[0] == (intcode.BUDGET_USED, None):
+            continue
+        assert states[0] == states[1], "Engines disagree on the counting loop {} ({} overflow)".format(loop, overflow)
+        skipped_cycles += computer.compiler.skipped_cycles
+    assert skipped_cycles > 0, "None of the random counting loops were accelerated"
+    print("loop acceleration test passed, {} cycles skipped".format(skipped_cycles))
+
+def explore(droid, n_moves):
+    # moves the droid n_moves times the way day 15 searches the maze, returns the moves made
+    moves = []
+    for _ in range(n_moves):
+        unexplored = sorted(droid.find_unexplored_adjacencies())
+        if unexplored:
+            droid.move(unexplored[0])
+            moves.append(unexplored[0])
+        elif droid._history:
+            droid.backtrack()
+            moves.append("back")
+    return moves
+
+def droid_state(droid):
+    return droid._position, dict(droid._map), [move for move, _ in droid._history], droid.cycle_count
+
+def fork_test(n_moves=30):
+    # forks a repair droid part way through exploring (its history holds snapshots) and checks that the two branches
+    # carry on without affecting each other
+    sys.path.insert(0, str(ADVENT_OF_CODE))
+    import day15
+    droid = day15.RepairDroid(programs.load_program(ADVENT_OF_CODE / "puzzle_inputs" / "day15_input.txt"))
+    explore(droid, n_moves)
+    clone = droid.fork()
+    spare = droid.fork()  # stays where the fork was made, replays what the clone does to check it
+    at_fork = droid_state(clone)
+    parent_moves = explore(droid, n_moves)
+    assert droid_state(clone) == at_fork, "Exploring with the original droid changed its fork"
+    clone.backtrack()
+    clone_moves = ["back"] + explore(clone, 2 * n_moves)
+    assert droid_state(clone) != droid_state(droid)
+    spare.backtrack()
+    explore(spare, 2 * n_moves)
+    assert droid_state(spare) == droid_state(clone), "The fork didn't explore the same way as a fresh fork"
+    while clone._history:
+        clone.backtrack()  # every snapshot in the fork's history can still be restored
+    assert clone._position == (0, 0)
+    print("fork test passed, branches made {} and {} moves after the fork".format(len(parent_moves), len(clone_moves)))
+
+def fork_read_test():
+    # a fork starts out with the overlay pages of the memory it was forked from, reading through them has to count
+    # towards the fork's own copies and never expand or change a page in the original
+    parent = memory.PagedMemory(range(memory.PAGE_SIZE))
+    parent[1] = -1  # page 0 becomes an overlay holding just this word
+    overlay = parent._pages[0]
+    clone = parent.fork()
+    for _ in range(2 * memory.OVERLAY_MISSES):
+        assert clone[2] == 2 and clone[1] == -1
+    assert parent._pages[0] is overlay and overlay.misses == 0, "Reads in a fork went through the original's overlay"
+    assert type(clone._pages[0]) is not memory.OverlayPage, "The fork never expanded its copy of the overlay"
+    clone[1] = 5
+    parent[3] = 7
+    assert (parent[1], parent[3], clone[1], clone[3]) == (-1, 7, 5, 3)
+    print("fork read test passed")
+
+def overflow_test():
+    # multiplies 2**62 + 1 by 3, which doesn't fit in 64 bits, and checks what each overflow policy makes of it. The
+    # product is written to memory and then output so both the write and the value read back are covered
+    product = ((1 << 62) + 1) * 3
+    wrapped = -(1 << 62) + 3  # the low 64 bits of the product read as a two's complement int64
+    program = [1102, (1 << 62) + 1, 3, 9, 4, 9, 99, 0, 0, 0]
+    for engine in ENGINES:
+        computer = intcode.IntcodeComputer(program, engine=engine, overflow="checked")
+        try:
+            computer.run()
+            assert False, "A product past int64 didn't raise an OverflowError on the {} engine".format(engine)
+        except OverflowError:
+            pass
+
+        computer = intcode.IntcodeComputer(program, engine=engine, overflow="wrap")
+        computer.run()
+        assert computer.flush_output() == [wrapped] and computer.memory[9] == wrapped
+
+        computer = intcode.IntcodeComputer(program, engine=engine, overflow="unbounded")
+        computer.run()
+        assert computer.flush_output() == [product] and computer.memory[9] == product
+
+        # machines on a network take the same policies
+        computer = async_intcode.AsyncIntcodeComputer(program, engine=engine, overflow="wrap")
+        assert asyncio.run(computer.run_async()) == intcode.HALTED
+        assert computer.engine == engine and computer.flush_output() == [wrapped]
+
+        # the puzzles stay within 64 bits so the default policy has to give the answers they always have
+        for (day, value), answer in PUZZLE_ANSWERS.items():
+            program_input = programs.load_program(ADVENT_OF_CODE / "puzzle_inputs" / "day{}_input.txt".format(day))
+            computer = intcode.IntcodeComputer(program_input, engine=engine, overflow="checked")
+            computer.input(value)
+            computer.run()
+            assert [int(output) for output in computer.flush_output()] == answer, \
+                "Day {} with input {} gave a different answer on the {} engine".format(day, value, engine)
+    print("overflow test passed")
+
+def memory_view_test():
+    # image stays the program as it was loaded while view() follows what the program writes
+    program = [1101, 2, 3, 9, 99, 0, 0, 0, 0, 0]
+    computer = intcode.IntcodeComputer(program)
+    before = computer.memory.view()
+    assert before.tolist()[:len(program)] == program and not before.flags.writeable
+    computer.run()
+    after = computer.memory.view()
+    assert after[9] == 5 and not after.flags.writeable
+    assert computer.memory.image.tolist() == program and before[9] == 0
+    assert after.tolist() == computer.memory.to_array().tolist()
+    print("memory view test passed")
+
+class CountingComputer(intcode.IntcodeComputer):
+    # computer with state of its own, defined here so the checkpoint test covers classes of a script that's run directly
+    def __init__(self, software=[], verbose=False, engine="compiled", overflow="checked"):
+        super().__init__(software, verbose, engine, overflow)
+        self.n_outputs = 0
+
+    def _op_output(self, *parameters):
+        self.n_outputs += 1
+        return super()._op_output(*parameters)
+
+def checkpoint_test(n_checkpoints=300):
+    # checkpoints a day 15 droid every few moves and checks a checkpoint only writes what changed since the last one,
+    # the file is compacted instead of growing with every checkpoint, and the droid loads back as it was
+    sys.path.insert(0, str(ADVENT_OF_CODE))
+    import day15
+    import common_dependencies.checkpoint as droid_checkpoint  # the droid's pages come from the package's modules
+    droid = day15.RepairDroid(programs.load_program(ADVENT_OF_CODE / "puzzle_inputs" / "day15_input.txt"))
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "droid.checkpoint")
+    writer = droid_checkpoint.CheckpointWriter(droid, path, interval=0)
+    first = writer.save()
+    for _ in range(n_checkpoints - 1):
+        explore(droid, 10)
+        writer.save()
+    writer.close()
+    # ten moves push at most ten snapshots and change a few pages, a checkpoint that wrote the whole history and map
+    # again would be far bigger than this
+    assert writer.bytes_written < n_checkpoints * 16 * 1024, \
+        "Checkpoints wrote {} bytes, they aren't incremental".format(writer.bytes_written)
+    assert os.path.getsize(path) < 8 * first, "The checkpoint file wasn't compacted"
+    loaded = droid_checkpoint.load_checkpoint(path)
+    assert droid_state(loaded) == droid_state(droid)
+    assert loaded.memory.to_array().tolist() == droid.memory.to_array().tolist()
+    assert explore(loaded, 50) == explore(droid, 50) and droid_state(loaded) == droid_state(droid)
+
+    # a class from a script run directly loads into a process that didn't run it
+    computer = CountingComputer([104, 1, 104, 2, 99])
+    computer.run()
+    path = os.path.join(directory, "counting.checkpoint")
+    with checkpoint.CheckpointWriter(computer, path) as counting_writer:
+        counting_writer.save()
+    loader = "import checkpoint; print(checkpoint.load_checkpoint({!r}).n_outputs)".format(path)
+    result = subprocess.run([sys.executable, "-c", loader], cwd=str(Path(__file__).resolve().parent),
+                            capture_output=True, text=True)
+    assert result.stdout.strip() == "2", "Checkpoint of a script's class didn't load elsewhere: " + result.stderr
+    assert checkpoint.load_checkpoint(path).n_outputs == 2
+    print("checkpoint test passed, {} checkpoints wrote {} bytes".format(n_checkpoints, writer.bytes_written))
 
 def main():
     n_runs=100
     computer = intcode.IntcodeComputer(verbose=True)
     input_path=Path("speed_test.txt")
-    int_code=load_commented_program(input_path)
+    int_code=programs.load_program(input_path)
     computer.load_memory(int_code)
     computer.input(n_runs)  #input the number of runs to execute
     computer.run()
     print(computer.memory)
     print("program executed")
     #print(computer.program_finished)
+    differential_test()
+    loop_acceleration_test()
+    fork_test()
+    fork_read_test()
+    overflow_test()
+    memory_view_test()
+    checkpoint_test()
 
 if __name__=="__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,308 @@
+# Closed form execution of counting loops for the block compiler.
+# A block that ends in a conditional jump back to its own start is a loop. When the compiler sees one go around it hands
+# it to accelerate(), which executes the loop body once symbolically with the current memory and relative offset. Every
+# value the body computes is tracked as an affine function of the values the cells it writes held at the start of the
+# iteration, anything the body only reads is a constant for the whole loop. The loop can be skipped ahead when every
+# cell it writes is either
+#   - an induction variable: it's increased by the same constant every iteration,
+#   - derived from the induction variables each iteration (t = i + 1; i = t) without being read before it's written, or
+#   - the result of a comparison that isn't read before it's written,
+# and the exit test compares affine values. The value of every cell after k iterations is then known directly, and so
+# is the iteration the exit test fails on. Loops that move the relative offset by a constant every iteration can also
+# write to relative addresses, those writes are strided stores (memory fills) and are replayed one store at a time.
+# Anything else (input, output, reads through a moving relative offset, multiplying two variables, loops that never
+# exit, writes to the loop's own code, values that don't fit the overflow policy) is left to the normal engine
+
+LOOP_OPCODES = {1, 2, 7, 8, 9}  # opcodes a loop body can be made of, besides the jump that closes it
+MIN_ITERATIONS = 4  # loops that would only skip this many iterations are cheaper to just run
+MAX_MISSES = 8  # a block stops being tried after this many attempts in a row that didn't skip anything
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+class _Reject(Exception):
+    # raised while analysing a loop that can't be run in closed form
+    pass
+
+
+class Affine():
+    # const + sum(coefficient * value of the cell at the start of the iteration)
+    def __init__(self, const, coefficients=None):
+        self.const = const
+        self.coefficients = {} if coefficients is None else coefficients  # address -> coefficient, never zero
+
+    def __add__(self, other):
+        coefficients = dict(self.coefficients)
+        for address, coefficient in other.coefficients.items():
+            total = coefficients.get(address, 0) + coefficient
+            if total:
+                coefficients[address] = total
+            else:
+                del coefficients[address]
+        return Affine(self.const + other.const, coefficients)
+
+    def scale(self, factor):
+        if not factor:
+            return Affine(0)
+        return Affine(self.const * factor, {address: coefficient * factor
+                                             for address, coefficient in self.coefficients.items()})
+
+    def at(self, start, deltas):
+        # (value in the first iteration, how much it changes by each iteration after that)
+        base = self.const + sum(coefficient * start[address] for address, coefficient in self.coefficients.items())
+        slope = sum(coefficient * deltas[address] for address, coefficient in self.coefficients.items())
+        return base, slope
+
+
+class Comparison():
+    # 1 if left < right (or left == right) else 0
+    def __init__(self, operator, left, right):
+        self.operator = operator  # "<" or "=="
+        self.left = left
+        self.right = right
+
+    def at(self, start, deltas, k):
+        # value of the comparison in iteration k
+        left_base, left_slope = self.left.at(start, deltas)
+        right_base, right_slope = self.right.at(start, deltas)
+        left, right = left_base + k * left_slope, right_base + k * right_slope
+        return int(left < right) if self.operator == "<" else int(left == right)
+
+
+def is_candidate(instructions):
+    # quick check done when a block is compiled, True if the block has the shape of a loop body that could be analysed
+    *body, (pc, word, parameters) = instructions
+    return word % 100 in (5, 6, 20, 21, 22, 23) and all(word % 100 in LOOP_OPCODES for _, word, _ in body)
+
+
+def accelerate(computer, block, cycle_limit):
+    # called with the computer sitting on the start of a loop block it just went around, runs as many iterations as the
+    # loop has left (or as the cycle limit allows) in closed form. Returns the address to carry on from, or None if the
+    # loop can't be skipped ahead this time
+    try:
+        loop = _analyse(computer, block)
+    except _Reject:
+        return None
+    start, deltas, condition, continue_when, writes, strided, step, cells = loop
+
+    # the iteration the exit test fails in
+    difference = condition.right + condition.left.scale(-1)
+    d0, dd = difference.at(start, deltas)
+    exit_iteration = _first_exit(condition.operator, continue_when, d0, dd)
+    if exit_iteration is None:
+        return None  # the loop never exits, leave the engine to spin (or overflow) the way it normally would
+    n_iterations = exit_iteration + 1
+    length = len(block.instructions)
+    if cycle_limit != float("inf"):
+        n_iterations = min(n_iterations, int(cycle_limit - computer._cycle_count) // length)
+    if n_iterations < MIN_ITERATIONS:
+        return None
+    last = n_iterations - 1
+
+    # every value stored is affine in the iteration number so it's in range the whole way if it is at both ends
+    check = computer._memory.overflow != "unbounded"
+    final = {}
+    for address, value in writes:
+        if isinstance(value, Comparison):
+            final[address] = value.at(start, deltas, last)
+            continue
+        base, slope = value.at(start, deltas)
+        if check and not (_INT64_MIN <= base <= _INT64_MAX and _INT64_MIN <= base + last * slope <= _INT64_MAX):
+            return None
+        final[address] = base + last * slope
+    for address, stride, value in strided:
+        base, slope = value.at(start, deltas)
+        if check and not (_INT64_MIN <= base <= _INT64_MAX and _INT64_MIN <= base + last * slope <= _INT64_MAX):
+            return None
+        if address < 0 or address + last * stride < 0:
+            return None  # let the engine raise on the negative address
+    for address, delta in deltas.items():
+        final[address] = start[address] + n_iterations * delta
+    ranges = [sorted((address, address + last * stride)) for address, stride, value in strided]
+    for index, (address, stride, value) in enumerate(strided):
+        # a strided store that lands on a cell the loop uses, its own code or another strided store changes what the
+        # loop does and is left to the engine
+        low, high = ranges[index]
+        for other in cells.union(range(max(low, block.start), min(high + 1, block.end))):
+            if low <= other <= high and (other - address) % stride == 0:
+                return None
+        if any(other_low <= high and low <= other_high for other_low, other_high in ranges[index + 1:]):
+            return None
+
+    memory = computer._memory
+    for address, stride, value in strided:
+        base, slope = value.at(start, deltas)
+        for k in range(n_iterations):
+            memory[address + k * stride] = base + k * slope
+    for address, value in final.items():
+        memory[address] = value
+    computer._relative_offset += n_iterations * step
+    computer._cycle_count += n_iterations * length
+    return block.start if n_iterations <= exit_iteration else block.end
+
+
+def _first_exit(operator, continue_when, d0, dd):
+    # first iteration k (counting from 0) where the exit test fails, the compared difference is d0 + k * dd. None if the
+    # test never fails
+    if operator == "<":
+        if continue_when:  # carries on while left < right, so while the difference is positive
+            if d0 <= 0:
+                return 0
+            return None if dd >= 0 else (d0 - dd - 1) // -dd
+        if d0 > 0:
+            return 0
+        return None if dd <= 0 else -d0 // dd + 1
+    if continue_when:  # carries on while left == right
+        if d0 != 0:
+            return 0
+        return None if dd == 0 else 1
+    if d0 == 0:
+        return 0
+    if dd == 0 or -d0 % dd != 0 or -d0 // dd < 0:
+        return None
+    return -d0 // dd
+
+
+def _analyse(computer, block):
+    # symbolically executes one iteration of the loop block with the computer's current state. Returns
+    # (start values of the induction variables, their step per iteration, exit comparison, the comparison result that
+    # keeps the loop going, every (address, value) store to a fixed cell in order, (address, stride, value) strided
+    # stores, how far the relative offset moves each iteration, every fixed cell the loop reads or writes)
+    memory = computer._memory
+    instructions = block.instructions
+    rb = computer._relative_offset
+
+    def parameter(address, value):
+        return memory[address] if value is None else value  # volatile parameters are read from memory
+
+    # first pass, work out which cells the loop writes to and how far it moves the relative offset
+    step = 0
+    decoded = []
+    for pc, word, parameters in instructions:
+        opcode = word % 100
+        modes = [(word // 10 ** (digit + 2)) % 10 for digit in range(len(parameters))]
+        operands = []
+        for j, (mode, value) in enumerate(zip(modes, parameters)):
+            value = parameter(pc + 1 + j, value)
+            if mode == 0:
+                operands.append(("cell", value))
+            elif mode == 1:
+                operands.append(("const", value))
+            else:
+                operands.append(("relative", rb + step + value))
+        if opcode == 9:
+            if operands[0][0] != "const":
+                raise _Reject()
+            step += operands[0][1]
+        decoded.append((opcode, operands))
+
+    written = set()
+    for opcode, operands in decoded:
+        if opcode in (1, 2, 7, 8):
+            kind, address = operands[2]
+        elif opcode in (20, 21, 22, 23):
+            kind, address = operands[2]
+        else:
+            continue
+        if kind == "const":
+            raise _Reject()  # writes to immediate parameters are written over the instruction itself
+        if kind == "cell" or step == 0:
+            if address < 0 or block.start <= address < block.end:
+                raise _Reject()
+            written.add(address)
+
+    # second pass, run the body symbolically
+    state = {}  # cell -> value written so far in this iteration
+    read_at_start = set()
+    cells = set(written)  # every fixed cell the loop touches
+    writes = []  # every store to a fixed cell, in order
+    strided = []
+
+    def read(operand):
+        kind, value = operand
+        if kind == "const":
+            return Affine(value)
+        if kind == "relative" and step != 0:
+            raise _Reject()  # reads through a moving relative offset depend on what's in memory
+        if value in state:
+            return state[value]
+        if value in written:
+            read_at_start.add(value)
+            return Affine(0, {value: 1})
+        if value < 0:
+            raise _Reject()
+        cells.add(value)
+        return Affine(memory[value])
+
+    def affine(value):
+        if not isinstance(value, Affine):
+            raise _Reject()  # comparison results only feed jumps
+        return value
+
+    def store(operand, value):
+        kind, address = operand
+        if kind == "relative" and step != 0:
+            if not isinstance(value, Affine):
+                raise _Reject()
+            strided.append((address, step, value))
+            return
+        state[address] = value
+        writes.append((address, value))
+
+    condition = None
+    for index, (opcode, operands) in enumerate(decoded):
+        if opcode == 1:
+            store(operands[2], affine(read(operands[0])) + affine(read(operands[1])))
+        elif opcode == 2:
+            left, right = affine(read(operands[0])), affine(read(operands[1]))
+            if not left.coefficients:
+                store(operands[2], right.scale(left.const))
+            elif not right.coefficients:
+                store(operands[2], left.scale(right.const))
+            else:
+                raise _Reject()
+        elif opcode in (7, 8):
+            store(operands[2], _compare("<" if opcode == 7 else "==", read(operands[0]), read(operands[1])))
+        elif opcode in (5, 6):
+            value = read(operands[0])
+            target = read(operands[1])
+            if isinstance(value, Comparison):
+                condition, continue_when = value, opcode == 5
+            else:
+                condition, continue_when = Comparison("==", value, Affine(0)), opcode == 6
+        elif opcode in (20, 21, 22, 23):
+            flag = _compare("<" if opcode in (20, 21) else "==", read(operands[0]), read(operands[1]))
+            store(operands[2], flag)
+            target = read(operands[3])
+            if isinstance(flag, Comparison):
+                condition, continue_when = flag, opcode in (20, 22)
+            else:
+                condition, continue_when = Comparison("==", flag, Affine(1)), opcode in (20, 22)
+    if not isinstance(target, Affine) or target.coefficients or target.const != block.start:
+        raise _Reject()
+
+    # every cell the loop writes has to be an induction variable or only be read after it's written in an iteration
+    deltas = {}
+    for address in written:
+        value = state[address]
+        if isinstance(value, Affine) and value.coefficients.get(address) == 1 and len(value.coefficients) == 1:
+            deltas[address] = value.const
+        elif address in read_at_start:
+            raise _Reject()
+    # anything read at the start of an iteration is now an induction variable, so every expression is in terms of them
+    start = {address: memory[address] for address in deltas}
+    return start, deltas, condition, continue_when, writes, strided, step, cells
+
+
+def _compare(operator, left, right):
+    left, right = _as_affine(left), _as_affine(right)
+    if not left.coefficients and not right.coefficients:
+        return Affine(int(left.const < right.const) if operator == "<" else int(left.const == right.const))
+    return Comparison(operator, left, right)
+
+
+def _as_affine(value):
+    if not isinstance(value, Affine):
+        raise _Reject()
+    return value
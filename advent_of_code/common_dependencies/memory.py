@@ -0,0 +1,349 @@
+from array import array
+import copy
+import weakref
+import numpy as np
+
+PAGE_BITS = 9  # number of address bits covered by a single page
+PAGE_SIZE = 1 << PAGE_BITS  # number of 64 bit words held in a page
+PAGE_MASK = PAGE_SIZE - 1  # mask that pulls the offset within a page out of an address
+OVERFLOW_POLICIES = ("checked", "wrap", "unbounded")  # what happens when a value that doesn't fit in 64 bits is written
+OVERLAY_WRITES = 32  # writes an overlay page takes before it's turned into a full private copy of the page
+OVERLAY_MISSES = 4096  # reads an overlay page passes on to the page under it before it's turned into a full copy
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def to_words(software):
+    # converts a program (list, numpy array of any dtype, array) into a contiguous array of signed 64 bit words
+    return array('q', np.asarray(software, dtype=np.int64).tobytes())
+
+
+def wrap(value):
+    # wraps an integer around to the signed 64 bit range the same way int64 arithmetic does
+    return ((value + (1 << 63)) & ((1 << 64) - 1)) - (1 << 63)
+
+
+class ProgramImage():
+    # read only image of a program, padded out to a whole number of pages and split into pages that are memoryview
+    # slices of it. Every memory loaded with the same program shares one image
+    def __init__(self, words, length):
+        self.words = words  # contiguous array of the program's words, never written to
+        self.length = length  # how many of the words came from the program
+        view = memoryview(words).toreadonly()
+        self.pages = [view[page << PAGE_BITS:(page + 1) << PAGE_BITS] for page in range(len(words) >> PAGE_BITS)]
+        self._tuple_pages = None
+
+    @property
+    def tuple_pages(self):
+        # the pages as tuples of python ints, used by unbounded memory whose writable pages are lists
+        if self._tuple_pages is None:
+            self._tuple_pages = [tuple(page) for page in self.pages]
+        return self._tuple_pages
+
+
+_images = weakref.WeakValueDictionary()  # program bytes -> the ProgramImage of every program still loaded somewhere
+
+
+def program_image(software):
+    # the shared ProgramImage of a program, made the first time the program is loaded
+    words = to_words(software)
+    key = words.tobytes()
+    image = _images.get(key)
+    if image is None:
+        length = len(words)
+        words.frombytes(bytes(8 * (-length % PAGE_SIZE)))  # pad the image with zeros
+        image = _images[key] = ProgramImage(words, length)
+    return image
+
+
+def loaded_images():
+    # number of distinct program images currently shared between memories
+    return len(_images)
+
+
+class OverlayPage(dict):
+    # copy on write page that only holds the words written to it, every other word is read from the shared page under
+    # it. Reads of words that haven't been written go through __missing__, which is slower than indexing a full page, so
+    # a page that's read through a lot is swapped for a full copy by the memory that made it
+    __slots__ = ("base", "memory", "page_number", "misses", "writes")
+
+    def __init__(self, base, memory, page_number, words=()):
+        super().__init__(words)
+        self.base = base  # the page under the overlay, never written to
+        self.memory = memory
+        self.page_number = page_number
+        self.misses = 0
+        self.writes = 0
+
+    def __missing__(self, offset):
+        self.misses += 1
+        if self.misses >= OVERLAY_MISSES:
+            self.memory._expand(self)
+        return self.base[offset]
+
+    def __reduce__(self):
+        # pickles as a full page, the overlay is only a way of sharing storage
+        page = _full_page(self)
+        return (list, (page,)) if type(page) is list else (array, ("q", page.tobytes()))
+
+
+def _full_page(overlay):
+    # a full copy of the page an overlay stands for
+    base = overlay.base
+    page = list(base) if type(base) in (list, tuple) else array('q', base.tobytes())
+    for offset, value in overlay.items():
+        page[offset] = value
+    return page
+
+
+class MemorySnapshot():
+    def __init__(self, pages, dirty):
+        self.pages = pages  # page number -> page, the pages are shared and never written to again
+        self.dirty = dirty  # page numbers that differ from the program image
+
+    def __deepcopy__(self, memo):
+        # the pages are shared copy on write and never written to, so a copy is the same snapshot
+        return self
+
+
+class PagedMemory():
+    # Memory for the intcode computer
+    # The program image is stored in one contiguous, read only array of 64 bit words which is split up into fixed size
+    # pages (memoryview slices of the array, so no data is copied). The image is shared by every memory loaded with the
+    # same program so thousands of computers running one program only store it once. Pages are copy on write: the first
+    # writes to a page that isn't owned by this memory go to an overlay page that holds just the written words, once it
+    # has taken OVERLAY_WRITES writes (or has been read through OVERLAY_MISSES times) it's swapped for a private copy of
+    # the whole page, and a page that has needed a full copy once gets one straight away after a reset. Memory used per
+    # computer grows with the words it writes, not the size of the program. Addresses past the end of the image are
+    # backed by pages that are only allocated the first time they are written to, reads from unallocated addresses
+    # return 0.
+    # Since pages are never written once they're shared, snapshots and forks only have to copy the page table (plus the
+    # written words of overlay pages, which a fork gets its own copies of).
+    # Every page that has been written to since the last reset is tracked as dirty, resetting memory back to the loaded
+    # program just points the dirty pages back at the image so it costs the number of pages written, not the program size.
+    # Values are plain python ints, the overflow policy decides what a write that doesn't fit in 64 bits does: "checked"
+    # raises an OverflowError, "wrap" stores it wrapped around like an int64 would and "unbounded" stores it as is (the
+    # pages are then python lists instead of 64 bit arrays, which are slower to copy)
+    def __init__(self, software=(), overflow="checked"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy {}, expected one of {}".format(overflow, OVERFLOW_POLICIES))
+        self._overflow = overflow
+        self._program_image = program_image(software)  # shared with every other memory loaded with the same program
+        self._image = self._program_image.words  # contiguous program image, padded out to a whole number of pages
+        self._image_length = self._program_image.length  # how many words of the image came from the program
+        if overflow == "unbounded":
+            self._image_pages = self._program_image.tuple_pages
+        else:
+            self._image_pages = self._program_image.pages
+        self._pages = dict(enumerate(self._image_pages))
+        self._owned = set()  # pages that are private to this memory and can be written in place
+        self._overlays = set()  # overlay pages that are private to this memory
+        self._hot_pages = set()  # pages that outgrew an overlay before, kept through resets so they're copied in full
+        self._dirty = set()  # pages that no longer match the program image
+        self._watched = {}  # addresses that call back to on_watched_write when they're written to
+        self._on_watched_write = None
+
+    def reset(self):
+        # returns memory to the loaded program, only the pages written to since the last reset are touched
+        for page_number in self._dirty:
+            if page_number < len(self._image_pages):
+                self._pages[page_number] = self._image_pages[page_number]
+            else:
+                del self._pages[page_number]
+        self._dirty.clear()
+        self._owned.clear()
+        self._overlays.clear()
+
+    def watch(self, addresses, on_write):
+        # calls on_write(address) whenever one of the addresses is written to, addresses can be any container and is
+        # held by reference so the caller can keep adding to it
+        self._watched = addresses
+        self._on_watched_write = on_write
+
+    def pristine(self, address):
+        # value an address had when the program was loaded
+        return self._image[address] if 0 <= address < len(self._image) else 0
+
+    def __getitem__(self, address):
+        try:
+            return self._pages[address >> PAGE_BITS][address & PAGE_MASK]
+        except KeyError:
+            if address < 0:
+                raise ValueError("Tried to read from a negative memory address: {}".format(address))
+            return 0  # unallocated memory reads as zero
+
+    def __setitem__(self, address, value):
+        page_number = address >> PAGE_BITS
+        try:
+            if page_number in self._owned:
+                self._pages[page_number][address & PAGE_MASK] = value
+            else:
+                self._write_shared(page_number, address, value)
+        except OverflowError:  # by the time it's raised the page is writable
+            if self._overflow != "wrap":
+                raise OverflowError("Value {} written to memory address {} doesn't fit in 64 bits".format(
+                    value, address))
+            self._pages[page_number][address & PAGE_MASK] = wrap(value)
+        if address in self._watched:
+            self._on_watched_write(address)
+
+    def _write_shared(self, page_number, address, value):
+        # writes to a page this memory doesn't own a full copy of. The write lands in the page's overlay, which is made
+        # if the page doesn't have one that's private to this memory yet, or in a full copy once the overlay is full.
+        # Unallocated pages have nothing to share so they're allocated in full
+        offset = address & PAGE_MASK
+        page = self._pages.get(page_number)
+        if page is None:
+            if address < 0:
+                raise ValueError("Tried to write to a negative memory address: {}".format(address))
+            page = [0] * PAGE_SIZE if self._overflow == "unbounded" else array('q', bytes(PAGE_SIZE * 8))
+            self._pages[page_number] = page
+            self._owned.add(page_number)
+            self._dirty.add(page_number)
+            page[offset] = value
+            return
+        if page_number in self._hot_pages and page_number not in self._overlays:
+            page = _full_page(page) if type(page) is OverlayPage else \
+                list(page) if self._overflow == "unbounded" else array('q', page.tobytes())
+            self._pages[page_number] = page
+            self._owned.add(page_number)
+            self._dirty.add(page_number)
+            page[offset] = value
+            return
+        if page_number not in self._overlays:
+            if type(page) is OverlayPage:  # shared with a snapshot or fork, copy the written words
+                page = OverlayPage(page.base, self, page_number, page)
+            else:
+                page = OverlayPage(page, self, page_number)
+            self._pages[page_number] = page
+            self._overlays.add(page_number)
+            self._dirty.add(page_number)
+        elif page.writes >= OVERLAY_WRITES:
+            self._expand(page)[offset] = value
+            return
+        page.writes += 1
+        if self._overflow != "unbounded":
+            value = int(value)
+            if not _INT64_MIN <= value <= _INT64_MAX:
+                raise OverflowError()
+        page[offset] = value
+
+    def _expand(self, overlay):
+        # swaps an overlay page for a full private copy of the page, returns the copy
+        page_number = overlay.page_number
+        if self._pages.get(page_number) is not overlay:
+            return None  # the overlay isn't in use here any more
+        page = _full_page(overlay)
+        self._pages[page_number] = page
+        self._overlays.discard(page_number)
+        self._owned.add(page_number)
+        self._hot_pages.add(page_number)
+        return page
+
+    def snapshot(self):
+        # captures the current contents of memory, every page becomes shared so this only copies the page table
+        self._owned.clear()
+        self._overlays.clear()
+        return MemorySnapshot(dict(self._pages), frozenset(self._dirty))
+
+    def restore(self, snapshot):
+        # returns memory to the state in a snapshot, returns the set of page numbers whose contents may have changed
+        changed_pages = {page_number for page_number in self._pages.keys() | snapshot.pages.keys()
+                         if self._pages.get(page_number) is not snapshot.pages.get(page_number)}
+        self._pages.clear()  # update the page table in place so anything holding a reference to it stays valid
+        self._pages.update(snapshot.pages)
+        self._owned.clear()
+        self._overlays.clear()
+        self._dirty = set(snapshot.dirty)
+        self._adopt_overlays()
+        return changed_pages
+
+    def fork(self):
+        # returns a new memory with the same contents, the two share pages until either of them writes to one
+        clone = copy.copy(self)
+        clone._pages = dict(self._pages)
+        clone._owned = set()
+        clone._overlays = set()
+        clone._hot_pages = set(self._hot_pages)
+        clone._dirty = set(self._dirty)
+        clone._watched = {}  # watches belong to whoever set them up on the original
+        clone._on_watched_write = None
+        clone._adopt_overlays()
+        self._owned.clear()  # full pages are shared with the clone now, the overlays it shared have been copied
+        return clone
+
+    def _adopt_overlays(self):
+        # gives this memory its own copy of every overlay page that belongs to another memory. An overlay counts the
+        # reads that go through it and has the memory it belongs to expand it, so sharing one would have reads here
+        # expand the page in the other memory and never here. The copies only hold the written words and are private
+        for page_number, page in self._pages.items():
+            if type(page) is OverlayPage and page.memory is not self:
+                self._pages[page_number] = OverlayPage(page.base, self, page_number, page)
+                self._overlays.add(page_number)
+
+    def __len__(self):
+        # the size of the address space that has been touched, one past the highest allocated address
+        return (max(self._pages) + 1) << PAGE_BITS if self._pages else 0
+
+    def __repr__(self):
+        return "PagedMemory({} image words, {} pages allocated, {} private, {} overlays, {} overflow)".format(
+            self._image_length, len(self._pages), len(self._owned), len(self._overlays), self._overflow)
+
+    def read_range(self, start, stop):
+        # returns a list of the values stored from address start up to (but not including) stop
+        return [self[address] for address in range(start, stop)]
+
+    def to_array(self):
+        # returns a copy of all allocated memory as a flat numpy array, unallocated gaps are filled with 0. Unbounded
+        # memory gives an array of python ints since the values might not fit in 64 bits
+        memory = np.zeros(len(self), dtype=object if self._overflow == "unbounded" else np.int64)
+        for page_number, page in self._pages.items():
+            memory[page_number << PAGE_BITS:(page_number + 1) << PAGE_BITS] = \
+                _full_page(page) if type(page) is OverlayPage else page
+        return memory
+
+    def view(self):
+        # read only numpy array of what memory holds right now, laid out like to_array(). Memory that hasn't been
+        # written to since the program was loaded is the program image, so that's handed back without copying,
+        # otherwise the pages are gathered into a new array. Either way writes made after the call don't show up in it
+        if self._dirty:
+            memory = self.to_array()
+        else:
+            memory = np.frombuffer(self._image, dtype=np.int64)
+        memory.flags.writeable = False
+        return memory
+
+    @property
+    def image(self):
+        # zero copy, read only numpy view of the pristine program image, the words exactly as they were loaded. It never
+        # changes: writes land in copy on write pages that aren't part of the image, so nothing the program stores shows
+        # up here. Use view() (or to_array(), or indexing) to see what memory holds now
+        view = np.frombuffer(self._image, dtype=np.int64)[:self._image_length]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def overflow(self):
+        # the overflow policy, one of OVERFLOW_POLICIES
+        return self._overflow
+
+    @property
+    def image_pages(self):
+        # number of pages taken up by the program image, these pages always exist
+        return len(self._image) >> PAGE_BITS
+
+    @property
+    def allocated_pages(self):
+        # sorted list of which page numbers are currently backed by storage
+        return sorted(self._pages)
+
+    @property
+    def dirty_pages(self):
+        # sorted list of the pages that have been written to since the last reset
+        return sorted(self._dirty)
+
+    @property
+    def private_pages(self):
+        # sorted list of the pages that have been copied or allocated by this memory since it was last shared
+        return sorted(self._owned)
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+
+try:
+    from .intcode import IntcodeComputer
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer
+
+# Pool of computers loaded with one program. Building a computer loads the program into memory and sets up an execution
+# engine that starts with nothing compiled, which can cost more than a short run of the program itself, so drivers that
+# run the same program over and over (one run per noun and verb, per phase setting, ...) take a computer from the pool
+# and hand it back when they're done instead of building a new one each time. Computers are reset when they come back,
+# resetting only restores the pages they wrote and keeps everything the engine compiled
+
+
+class PoolStats():
+    def __init__(self):
+        self.created = 0  # computers built by the pool
+        self.reused = 0  # times a computer handed back was given out again
+
+    def __repr__(self):
+        return "PoolStats({} created, {} reused)".format(self.created, self.reused)
+
+
+class ComputerPool():
+    # hands out computers of computer_class loaded with software, options are passed on to the class when a computer is
+    # built. size computers are built up front, more are built whenever every computer is in use
+    def __init__(self, software, computer_class=IntcodeComputer, size=0, **options):
+        self._software = software
+        self._computer_class = computer_class
+        self._options = options
+        self._idle = []  # reset computers ready to be handed out
+        self._own_hooks = {}  # id of every computer built -> the hooks it was built with (verbose printing)
+        self._checked_out = {}  # id -> computer for every computer acquired and not released yet
+        self._stats = PoolStats()
+        for _ in range(size):
+            self._idle.append(self._build())
+
+    def acquire(self):
+        # returns a computer that's been reset to the loaded program, it's the caller's until it's released
+        if self._idle:
+            self._stats.reused += 1
+            computer = self._idle.pop()
+        else:
+            computer = self._build()
+        self._checked_out[id(computer)] = computer
+        return computer
+
+    def release(self, computer):
+        # hands a computer back to the pool, it's reset and any hooks, input provider, output sink, profiling or trace the
+        # caller set up are removed. Each computer acquired can only be released once
+        own_hooks = self._own_hooks.get(id(computer))
+        if own_hooks is None:
+            raise ValueError("Computer wasn't built by this pool")
+        if self._checked_out.get(id(computer)) is not computer:
+            raise ValueError("Computer isn't checked out of the pool, it was already released")
+        del self._checked_out[id(computer)]
+        for event, hooks in computer.hooks.items():
+            for hook in hooks:
+                if hook not in own_hooks[event]:
+                    computer.remove_hook(hook)
+        computer.set_input_provider(None)
+        computer.set_output_sink(None)
+        computer.disable_profiling()
+        if computer.tracer is not None:
+            computer.tracer.close()  # finishes the caller's trace file and detaches the recorder
+        computer.reset()
+        self._idle.append(computer)
+
+    @contextmanager
+    def computer(self):
+        # acquires a computer for the length of a with block and releases it afterwards
+        computer = self.acquire()
+        try:
+            yield computer
+        finally:
+            self.release(computer)
+
+    def _build(self):
+        self._stats.created += 1
+        computer = self._computer_class(self._software, **self._options)
+        self._own_hooks[id(computer)] = computer.hooks
+        return computer
+
+    @property
+    def software(self):
+        return self._software
+
+    @property
+    def n_idle(self):
+        # computers waiting in the pool
+        return len(self._idle)
+
+    @property
+    def n_checked_out(self):
+        # computers acquired and not released yet
+        return len(self._checked_out)
+
+    @property
+    def stats(self):
+        return self._stats
@@ -0,0 +1,122 @@
+import json
+import time
+from collections import Counter
+
+
+class Loop():
+    def __init__(self, header, latch, iterations, instructions):
+        self.header = header  # address the loop jumps back to
+        self.latch = latch  # address of the jump instruction that closes the loop
+        self.iterations = iterations  # how many times the jump back was taken
+        self.instructions = instructions  # instructions executed between the header and the latch
+
+    def to_dict(self):
+        return {"header": self.header, "latch": self.latch, "iterations": self.iterations,
+                "instructions": self.instructions}
+
+
+class Profiler():
+    # Instruction level profiler for the intcode computer, enabled with IntcodeComputer.enable_profiling().
+    # Counts how many times each opcode and each address is executed, every jump that's taken backwards (a loop) and
+    # how long the computer ran and how many instructions it executed between each time it stopped to wait for input
+    def __init__(self, opcodes):
+        self._descriptors = {value: opcode.descriptor for value, opcode in opcodes.items()}
+        self.opcode_counts = Counter()  # opcode value -> times executed
+        self.pc_counts = Counter()  # instruction address -> times executed
+        self.back_edges = Counter()  # (jump target, jump address) -> times a backwards jump was taken
+        self.segments = []  # list of (instructions, seconds, reason stopped) between waits for input
+
+    def record(self, pc, opcode, next_pc):
+        # records one executed instruction
+        self.opcode_counts[opcode] += 1
+        self.pc_counts[pc] += 1
+        if next_pc <= pc:
+            self.back_edges[(next_pc, pc)] += 1
+
+    def end_segment(self, instructions, seconds, reason):
+        # records a stretch of execution that ended with the computer halting, waiting on input or hitting a limit
+        self.segments.append((instructions, seconds, reason))
+
+    def hottest_loops(self, n=10):
+        # the n loops that executed the most instructions, a loop is a backwards jump and the code it jumps over
+        loops = [Loop(header, latch, iterations,
+                      sum(count for pc, count in self.pc_counts.items() if header <= pc <= latch))
+                 for (header, latch), iterations in self.back_edges.items()]
+        return sorted(loops, key=lambda loop: loop.instructions, reverse=True)[:n]
+
+    def hottest_instructions(self, n=10):
+        # list of the n most executed (address, count) pairs
+        return self.pc_counts.most_common(n)
+
+    def to_dict(self):
+        return {
+            "instructions": sum(self.opcode_counts.values()),
+            "opcodes": {self._descriptors.get(opcode, str(opcode)): count
+                        for opcode, count in self.opcode_counts.most_common()},
+            "pc": {str(pc): count for pc, count in sorted(self.pc_counts.items())},
+            "loops": [loop.to_dict() for loop in self.hottest_loops(len(self.back_edges))],
+            "segments": [{"instructions": instructions, "seconds": seconds, "stopped": reason}
+                         for instructions, seconds, reason in self.segments]
+        }
+
+    def to_json(self, path=None):
+        # returns the profile as a JSON string and writes it to path if one is given
+        data = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(data)
+        return data
+
+    def to_folded(self, path=None):
+        # returns the profile as folded stacks ("frame;frame;frame count" lines) that flame graph tools read, and writes
+        # it to path if one is given. Each address is nested under every loop that contains it, outermost loop first
+        loops = sorted({(header, latch) for header, latch in self.back_edges},
+                       key=lambda loop: (loop[0], -loop[1]))
+        lines = []
+        for pc, count in sorted(self.pc_counts.items()):
+            frames = ["intcode"] + ["loop_{}-{}".format(header, latch) for header, latch in loops
+                                    if header <= pc <= latch]
+            frames.append("pc_{}".format(pc))
+            lines.append("{} {}".format(";".join(frames), count))
+        data = "\n".join(lines) + "\n"
+        if path is not None:
+            with open(path, "w") as file:
+                file.write(data)
+        return data
+
+    def report(self, n=10):
+        # human readable summary of where the program spends its time
+        lines = ["{} instructions executed".format(sum(self.opcode_counts.values()))]
+        lines.append("Opcodes:")
+        for opcode, count in self.opcode_counts.most_common():
+            lines.append("\t{:<25}{}".format(self._descriptors.get(opcode, str(opcode)), count))
+        lines.append("Hottest loops:")
+        for loop in self.hottest_loops(n):
+            lines.append("\t{}-{}: {} iterations, {} instructions".format(loop.header, loop.latch, loop.iterations,
+                                                                          loop.instructions))
+        if self.segments:
+            seconds = sum(segment[1] for segment in self.segments)
+            lines.append("{} runs between input waits, {:.03e} seconds total".format(len(self.segments), seconds))
+        return "\n".join(lines)
+
+
+class ProfilingTimer():
+    # times one stretch of execution for a profiler
+    def __init__(self, profiler, computer):
+        self._profiler = profiler
+        self._computer = computer
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._start_cycles = self._computer.cycle_count
+        return self
+
+    def __exit__(self, *exc_info):
+        computer = self._computer
+        if computer.program_finished:
+            reason = "halt"
+        elif not computer._running:
+            reason = "input"
+        else:
+            reason = "limit"
+        self._profiler.end_segment(computer.cycle_count - self._start_cycles, time.perf_counter() - self._start, reason)
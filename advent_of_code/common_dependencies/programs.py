@@ -0,0 +1,92 @@
+import hashlib
+import mmap
+import os
+import re
+import struct
+from pathlib import Path
+import numpy as np
+
+# Text programs are parsed once and cached as binary images named after the hash of the text, so editing a program
+# just makes a new cache entry. An image is a small header followed by the program as raw little endian int64 words.
+# Later loads memory map the image copy on write: nothing is parsed or copied up front and changes made to the returned
+# array stay private to it. Bump CACHE_VERSION whenever the parser or image layout changes, older images are ignored
+# from then on. Images are kept in the user's cache directory (INTCODE_CACHE_DIR overrides it), not the source tree, and
+# an image that's been truncated or corrupted is parsed again from the text and rewritten
+CACHE_VERSION = 1
+CACHE_DIR = Path(os.environ.get("INTCODE_CACHE_DIR") or
+                 Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "intcode" / "programs")
+IMAGE_HEADER = struct.Struct("<8sIIQ")  # magic, cache version, padding, number of words
+IMAGE_MAGIC = b"INTCODE\0"
+
+_number = re.compile(rb"-?[0-9]+")
+
+
+def parse_program(text):
+    # parses an intcode program, values are separated by commas and/or whitespace and anything after a # on a line is a
+    # comment. Takes str or bytes and returns an int64 array
+    if isinstance(text, str):
+        text = text.encode()
+    if b"#" in text:
+        text = b"\n".join(line.split(b"#")[0] for line in text.splitlines())
+    return np.array([int(number) for number in _number.findall(text)], dtype=np.int64)
+
+
+def cache_path(text, name="program", cache_dir=None):
+    # where the binary image of a program's text is cached
+    digest = hashlib.sha256(text).hexdigest()[:24]
+    return Path(CACHE_DIR if cache_dir is None else cache_dir) / "{}-{}.v{}.i64".format(name, digest, CACHE_VERSION)
+
+
+def save_image(program, image_path):
+    # writes a program as a binary image, the file is swapped in atomically so a concurrent load never sees it half
+    # written
+    program = np.ascontiguousarray(program, dtype="<i8")
+    image_path = Path(image_path)
+    image_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = image_path.with_name("{}.{}.tmp".format(image_path.name, os.getpid()))
+    with open(temporary_path, "wb") as file:
+        file.write(IMAGE_HEADER.pack(IMAGE_MAGIC, CACHE_VERSION, 0, len(program)))
+        file.write(program.tobytes())
+    os.replace(temporary_path, image_path)
+
+
+def load_image(image_path):
+    # memory maps a binary image copy on write and returns it as an int64 array
+    with open(image_path, "rb") as file:
+        image = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    if len(image) < IMAGE_HEADER.size:
+        raise ValueError("{} is too short to be a program image".format(image_path))
+    magic, version, _, n_words = IMAGE_HEADER.unpack_from(image)
+    if magic != IMAGE_MAGIC or version != CACHE_VERSION or len(image) != IMAGE_HEADER.size + 8 * n_words:
+        raise ValueError("{} isn't a version {} program image".format(image_path, CACHE_VERSION))
+    return np.frombuffer(image, dtype="<i8", count=n_words, offset=IMAGE_HEADER.size)
+
+
+def load_program(path, cache_dir=None, use_cache=True):
+    # loads a text program as an int64 array, going through the binary cache unless use_cache is False
+    path = Path(path)
+    text = path.read_bytes()
+    if not use_cache:
+        return parse_program(text)
+    image_path = cache_path(text, path.stem, cache_dir)
+    if image_path.exists():
+        try:
+            return load_image(image_path)
+        except ValueError:
+            pass  # truncated or corrupt (mmap refuses empty files with a ValueError too), make it again
+    program = parse_program(text)
+    try:
+        save_image(program, image_path)
+    except OSError:
+        pass  # the cache can't be written to, the program still loads, it's just parsed every time
+    return program
+
+
+def clear_cache(cache_dir=None):
+    # deletes every cached program image, returns how many were removed
+    directory = Path(CACHE_DIR if cache_dir is None else cache_dir)
+    removed = 0
+    for image_path in directory.glob("*.i64"):
+        image_path.unlink()
+        removed += 1
+    return removed
@@ -0,0 +1,243 @@
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+try:
+    from .intcode import IntcodeComputer, HALTED
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer, HALTED
+
+# Opt-in cache of whole program runs. A run that starts from the loaded program with a fixed list of inputs and goes all
+# the way to opcode 99 is a pure function of the program, the inputs, the overflow policy and the computer class that
+# ran it (a subclass can change what an opcode does), so its outputs (and if asked for, its final memory) can be kept on
+# disk and handed back the next time the same run is asked for, by this process or any later one. Each run is one small
+# binary file named after the hash of its key: a header followed by the outputs and then the memory as raw little endian
+# int64 words. The directory is kept under max_bytes by deleting the least recently used entries, a hit touches the
+# file's modification time so the order survives between processes.
+# Runs that block waiting for input or run out of max_cycles aren't pure runs to halt and are never stored, nor are runs
+# with outputs or memory that don't fit in 64 bits. The drivers only use a cache when INTCODE_RESULT_CACHE is set to
+# something other than 0, see from_environment()
+CACHE_VERSION = 2
+CACHE_ENABLE_VARIABLE = "INTCODE_RESULT_CACHE"
+CACHE_DIR = Path(os.environ.get("INTCODE_RESULT_CACHE_DIR", Path(__file__).parent / ".result_cache"))
+DEFAULT_MAX_BYTES = 64 << 20
+MAX_COMPUTERS = 8  # computers run() keeps for the programs it was asked about most recently
+ENTRY_HEADER = struct.Struct("<8sIIQQ")  # magic, cache version, 1 if memory was stored, number of outputs, memory words
+ENTRY_MAGIC = b"INTCRUN\0"
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+def from_environment(**options):
+    # a ResultCache built with options if INTCODE_RESULT_CACHE turns caching on, otherwise None so the caller runs its
+    # computers directly
+    if os.environ.get(CACHE_ENABLE_VARIABLE, "0").strip().lower() in ("", "0", "false", "no", "off"):
+        return None
+    return ResultCache(**options)
+
+
+class CachedRun():
+    def __init__(self, outputs, memory, program_finished, hit):
+        self.outputs = outputs  # list of everything the program output
+        self.memory = memory  # array of memory at the end of the run, None unless keep_memory was asked for
+        self.program_finished = program_finished  # False if the run stopped before halting, those are never cached
+        self.hit = hit  # True if the run came out of the cache
+
+
+class CacheStats():
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0  # runs written to the cache
+        self.evictions = 0  # entries deleted to keep the cache under its size limit
+        self.uncacheable = 0  # runs that didn't halt or didn't fit in 64 bits so couldn't be stored
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self):
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions,
+                "uncacheable": self.uncacheable, "hit_rate": self.hit_rate}
+
+    def __repr__(self):
+        return "CacheStats({} hits, {} misses, {:.1%} hit rate, {} stores, {} evictions, {} uncacheable)".format(
+            self.hits, self.misses, self.hit_rate, self.stores, self.evictions, self.uncacheable)
+
+
+class ResultCache():
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, engine="compiled", overflow="checked",
+                 max_cycles=None):
+        self._directory = Path(CACHE_DIR if directory is None else directory)
+        self._max_bytes = max_bytes
+        self._engine = engine
+        self._overflow = overflow
+        self._max_cycles = max_cycles  # runs that take longer than this are given up on and not cached
+        self._stats = CacheStats()
+        self._index = None  # OrderedDict of entry name -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self._computers = OrderedDict()  # program digest -> computer used to run it on a miss, least recently used first
+
+    def run(self, software, inputs=(), keep_memory=False):
+        # returns the CachedRun of the software given the inputs, running it only if the cache doesn't have it. With
+        # keep_memory an entry stored without memory is a miss and gets replaced by one with it
+        program = np.ascontiguousarray(software, dtype="<i8")
+        digest = hashlib.sha256(program.tobytes()).hexdigest()
+        computer = self._computers.get(digest)
+        if computer is None:
+            computer = IntcodeComputer(program, engine=self._engine, overflow=self._overflow)
+            self._computers[digest] = computer
+            if len(self._computers) > MAX_COMPUTERS:
+                self._computers.popitem(last=False)
+        else:
+            self._computers.move_to_end(digest)
+        return self.run_computer(computer, inputs, keep_memory, digest)
+
+    def run_computer(self, computer, inputs=(), keep_memory=False, digest=None):
+        # same as run() but on a miss it's the caller's computer that's reset to its loaded program and run, so a driver
+        # keeps running its own computers and the cache only stands in for runs it has already seen. The entry is keyed
+        # on the program the computer was loaded with, its overflow policy, its class and its opcode table
+        inputs = [int(value) for value in inputs]
+        if digest is None:
+            digest = hashlib.sha256(np.ascontiguousarray(computer.memory.image, dtype="<i8").tobytes()).hexdigest()
+        path = self._entry_path(digest, computer, inputs)
+        entry = self._load(path, keep_memory)
+        if entry is not None:
+            self._stats.hits += 1
+            self._touch(path)
+            outputs, memory = entry
+            return CachedRun(outputs, memory, True, True)
+        self._stats.misses += 1
+
+        computer.reset()
+        for value in inputs:
+            computer.input(value)
+        status = computer.run(self._max_cycles)
+        outputs = [int(value) for value in computer.flush_output()]
+        memory = computer.memory.to_array() if keep_memory else None
+        if status != HALTED or not _fits_int64(outputs, memory):
+            self._stats.uncacheable += 1
+            return CachedRun(outputs, memory, status == HALTED, False)
+        self._store(path, outputs, memory)
+        return CachedRun(outputs, memory, True, False)
+
+    def outputs(self, software, inputs=()):
+        # just the outputs of a run
+        return self.run(software, inputs).outputs
+
+    def clear(self):
+        # deletes every entry, returns how many were removed
+        removed = 0
+        for path in self._directory.glob("*.run"):
+            path.unlink()
+            removed += 1
+        self._index = None
+        return removed
+
+    def _entry_path(self, digest, computer, inputs):
+        computer_class = type(computer)
+        key = "{}|{}|{}.{}|{}|{}".format(digest, computer.overflow, computer_class.__module__,
+                                         computer_class.__qualname__, _opcode_table_digest(computer_class),
+                                         ",".join(map(str, inputs)))
+        return self._directory / "{}.v{}.run".format(hashlib.sha256(key.encode()).hexdigest()[:32], CACHE_VERSION)
+
+    def _load(self, path, keep_memory):
+        # (outputs, memory) from an entry, None if there isn't a usable one
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        if len(data) < ENTRY_HEADER.size:
+            return None
+        magic, version, has_memory, n_outputs, n_memory = ENTRY_HEADER.unpack_from(data)
+        if magic != ENTRY_MAGIC or version != CACHE_VERSION or len(data) != ENTRY_HEADER.size + 8 * (
+                n_outputs + n_memory) or keep_memory and not has_memory:
+            return None
+        words = np.frombuffer(data, dtype="<i8", offset=ENTRY_HEADER.size)
+        memory = words[n_outputs:].astype(np.int64) if keep_memory else None
+        return words[:n_outputs].tolist(), memory
+
+    def _store(self, path, outputs, memory):
+        # writes an entry, swapped in atomically so a concurrent reader never sees half of it, then evicts old entries
+        has_memory = memory is not None
+        memory = np.zeros(0, dtype="<i8") if memory is None else np.ascontiguousarray(memory, dtype="<i8")
+        data = ENTRY_HEADER.pack(ENTRY_MAGIC, CACHE_VERSION, has_memory, len(outputs), len(memory)) + \
+            np.array(outputs, dtype="<i8").tobytes() + memory.tobytes()
+        self._directory.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name("{}.{}.tmp".format(path.name, os.getpid()))
+        temporary_path.write_bytes(data)
+        os.replace(temporary_path, path)
+        self._stats.stores += 1
+
+        index = self._load_index()
+        self._total_bytes += len(data) - index.pop(path.name, 0)
+        index[path.name] = len(data)
+        while self._total_bytes > self._max_bytes and len(index) > 1:
+            name, size = index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                (self._directory / name).unlink()
+            except FileNotFoundError:
+                pass  # another process got to it first
+            self._stats.evictions += 1
+
+    def _touch(self, path):
+        # marks an entry as the most recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+        index = self._load_index()
+        if path.name in index:
+            index.move_to_end(path.name)
+
+    def _load_index(self):
+        # entries already on disk in least recently used order, read the first time the cache is written to
+        if self._index is None:
+            entries = []
+            for path in self._directory.glob("*.run"):
+                try:
+                    status = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime_ns, path.name, status.st_size))
+            self._index = OrderedDict((name, size) for _, name, size in sorted(entries))
+            self._total_bytes = sum(self._index.values())
+        return self._index
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def total_bytes(self):
+        # size of every entry this cache knows about
+        self._load_index()
+        return self._total_bytes
+
+
+def _opcode_table_digest(computer_class):
+    # hash of the opcodes and parameter modes a computer class defines
+    definitions = repr((computer_class.opcode_definitions, computer_class.parameter_mode_definitions))
+    return hashlib.sha256(definitions.encode()).hexdigest()[:16]
+
+
+def _fits_int64(outputs, memory):
+    # True if every output and memory word can be stored as an int64, unbounded runs can go past that
+    if any(value < INT64_MIN or value > INT64_MAX for value in outputs):
+        return False
+    if memory is not None and memory.dtype == object:
+        return all(INT64_MIN <= value <= INT64_MAX for value in memory)
+    return True
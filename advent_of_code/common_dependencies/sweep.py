@@ -0,0 +1,85 @@
+import multiprocessing
+import numpy as np
+
+try:
+    from .intcode import IntcodeComputer
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer
+
+# state held by each worker process, set up once by the pool initializer so the program is only shipped once per worker
+_worker_computer = None
+_worker_read_memory = ()
+
+
+class RunResult():
+    def __init__(self, index, inputs, outputs, memory, program_finished):
+        self.index = index  # position of the run in the list of input sets
+        self.inputs = inputs  # the inputs the run was given
+        self.outputs = outputs  # list of everything the program output
+        self.memory = memory  # dictionary of the requested memory addresses and their values at the end of the run
+        self.program_finished = program_finished  # False if the program stopped waiting for more input
+
+
+def _init_worker(software, read_memory, engine):
+    global _worker_computer, _worker_read_memory
+    _worker_computer = IntcodeComputer(software, engine=engine)
+    _worker_read_memory = read_memory
+
+
+def _run_chunk(chunk):
+    # runs a list of (index, inputs, memory patches) jobs on the worker's computer
+    computer = _worker_computer
+    results = []
+    for index, inputs, patches in chunk:
+        computer.reset()
+        for address, value in patches.items():
+            computer.memory[address] = value
+        for value in inputs:
+            computer.input(value)
+        computer.run()
+        results.append(RunResult(index, inputs, [int(value) for value in computer.flush_output()],
+                                 {address: computer.memory[address] for address in _worker_read_memory},
+                                 computer.program_finished))
+    return results
+
+
+def iter_runs(software, input_sets, memory_patches=None, read_memory=(), processes=None, chunk_size=None,
+              engine="compiled"):
+    # runs the software once per input set across a pool of worker processes and yields a RunResult for each run in
+    # the order they finish. memory_patches is an optional list (one per input set) of {address: value} dictionaries
+    # written into memory before the run starts, read_memory is a list of addresses to return the final values of.
+    # Closing the generator early terminates the pool and throws away any runs that haven't finished
+    input_sets = [tuple(inputs) for inputs in input_sets]
+    if memory_patches is None:
+        memory_patches = [{}] * len(input_sets)
+    elif len(memory_patches) != len(input_sets):
+        raise ValueError("Got {} memory patches for {} input sets".format(len(memory_patches), len(input_sets)))
+    processes = processes or multiprocessing.cpu_count()
+    if chunk_size is None:
+        chunk_size = max(1, len(input_sets) // (4 * processes))  # a few chunks per worker to balance the load
+    jobs = list(zip(range(len(input_sets)), input_sets, memory_patches))
+    chunks = [jobs[start:start + chunk_size] for start in range(0, len(jobs), chunk_size)]
+
+    software = np.asarray(software, dtype=np.int64)
+    with multiprocessing.Pool(processes, _init_worker, (software, tuple(read_memory), engine)) as pool:
+        for results in pool.imap_unordered(_run_chunk, chunks):
+            yield from results
+
+
+def run_many(software, input_sets, reducer=None, memory_patches=None, read_memory=(), processes=None,
+             chunk_size=None, engine="compiled"):
+    # runs the software once per input set across a pool of worker processes.
+    # Without a reducer this returns the list of RunResults in the same order as the input sets. With a reducer, every
+    # result is passed to reducer(result) as soon as it comes back; the first time the reducer returns something other
+    # than None the remaining work is cancelled and that value is returned
+    runs = iter_runs(software, input_sets, memory_patches, read_memory, processes, chunk_size, engine)
+    if reducer is None:
+        return sorted(runs, key=lambda result: result.index)
+    try:
+        for result in runs:
+            answer = reducer(result)
+            if answer is not None:
+                return answer
+    finally:
+        runs.close()  # shuts down the pool, dropping any runs still in flight
+    return None
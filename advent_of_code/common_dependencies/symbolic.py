@@ -0,0 +1,274 @@
+import itertools
+
+try:
+    from .intcode import IntcodeComputer
+    from .memory import PagedMemory
+    from . import sweep
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer
+    from memory import PagedMemory
+    import sweep
+
+# Symbolic execution of intcode. Memory cells and inputs can hold symbols instead of numbers, adding and multiplying
+# them builds polynomials so a straight line program like day 2 finishes with its answer as a polynomial in the
+# symbols. Reading memory through a symbolic address gives a new opaque symbol standing for whatever is there, which is
+# fine as long as the value is never used (day 2 reads through its noun and verb before overwriting the result).
+# Anything else that needs a symbol as a concrete number (a jump or comparison on it, writing through it, using it as a
+# relative offset or running it as an instruction) raises SymbolicBranch with the computer left on that instruction.
+# Symbolic memory is unbounded, the overflow policy isn't applied to anything computed symbolically
+
+
+class SymbolicBranch(Exception):
+    # raised when the program needs the concrete value of a symbolic expression
+    def __init__(self, pc, value):
+        super().__init__("Instruction at address {} needs a concrete value for {}".format(pc, value))
+        self.pc = pc  # address of the instruction that needed the value
+        self.value = value  # the polynomial it needed
+
+
+class Polynomial():
+    # sum of integer coefficient * monomial, a monomial is a tuple of (symbol, power) pairs sorted by symbol and the
+    # empty tuple is the constant term. Arithmetic that cancels out every symbol returns a plain int, so a Polynomial
+    # always depends on at least one symbol
+    def __init__(self, terms):
+        self._terms = terms  # monomial -> coefficient, never zero
+
+    @property
+    def terms(self):
+        return dict(self._terms)
+
+    @property
+    def symbols(self):
+        return sorted({name for monomial in self._terms for name, _ in monomial})
+
+    def degree(self, name=None):
+        # total degree of the polynomial, or its degree in one symbol
+        if name is None:
+            return max(sum(power for _, power in monomial) for monomial in self._terms)
+        return max(dict(monomial).get(name, 0) for monomial in self._terms)
+
+    def evaluate(self, values):
+        # value of the polynomial with every symbol replaced by values[symbol]
+        value = self.substitute(values)
+        if isinstance(value, Polynomial):
+            raise ValueError("No value given for {}".format(", ".join(value.symbols)))
+        return value
+
+    def substitute(self, values):
+        # replaces the symbols in values with numbers, returns an int if no symbols are left
+        terms = {}
+        for monomial, coefficient in self._terms.items():
+            remaining = []
+            for name, power in monomial:
+                if name in values:
+                    coefficient *= values[name] ** power
+                else:
+                    remaining.append((name, power))
+            _accumulate(terms, tuple(remaining), coefficient)
+        return _simplify(terms)
+
+    def __add__(self, other):
+        terms = dict(self._terms)
+        for monomial, coefficient in _terms_of(other).items():
+            _accumulate(terms, monomial, coefficient)
+        return _simplify(terms)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return Polynomial({monomial: -coefficient for monomial, coefficient in self._terms.items()})
+
+    def __sub__(self, other):
+        return self + -other
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __mul__(self, other):
+        terms = {}
+        for (left, left_coefficient), (right, right_coefficient) in itertools.product(self._terms.items(),
+                                                                                        _terms_of(other).items()):
+            powers = dict(left)
+            for name, power in right:
+                powers[name] = powers.get(name, 0) + power
+            _accumulate(terms, tuple(sorted(powers.items())), left_coefficient * right_coefficient)
+        return _simplify(terms)
+
+    __rmul__ = __mul__
+
+    # whether a polynomial is zero, or how it compares to anything, depends on what the symbols are
+    def _branch(self, *args):
+        raise SymbolicBranch(None, self)
+
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = __bool__ = __int__ = __index__ = _branch
+    __hash__ = None
+
+    def __repr__(self):
+        text = []
+        for monomial, coefficient in sorted(self._terms.items(), key=lambda term: (-len(term[0]), term[0])):
+            factors = ["{}^{}".format(name, power) if power > 1 else name for name, power in monomial]
+            if abs(coefficient) != 1 or not factors:
+                factors.insert(0, str(abs(coefficient)))
+            sign = "-" if coefficient < 0 else "+"
+            text.append("{} {}".format(sign, "*".join(factors)) if text else sign.strip("+") + "*".join(factors))
+        return " ".join(text)
+
+
+def symbol(name):
+    # a polynomial that's just the symbol
+    return Polynomial({((name, 1),): 1})
+
+
+def is_symbolic(value):
+    return isinstance(value, Polynomial)
+
+
+def _terms_of(value):
+    if isinstance(value, Polynomial):
+        return value._terms
+    return {(): int(value)} if value else {}
+
+
+def _accumulate(terms, monomial, coefficient):
+    total = terms.get(monomial, 0) + coefficient
+    if total:
+        terms[monomial] = total
+    else:
+        terms.pop(monomial, None)
+
+
+def _simplify(terms):
+    # a plain int for constant terms, a Polynomial otherwise
+    if not terms:
+        return 0
+    if len(terms) == 1 and () in terms:
+        return terms[()]
+    return Polynomial(terms)
+
+
+class SymbolicMemory(PagedMemory):
+    # paged memory that can be indexed with symbolic addresses, every read through one is a new opaque symbol
+    def __init__(self, software=(), overflow="unbounded"):
+        super().__init__(software, overflow)
+        self._n_opaque = 0
+
+    def __getitem__(self, address):
+        if isinstance(address, Polynomial):
+            self._n_opaque += 1
+            return symbol("memory[{}]#{}".format(address, self._n_opaque))
+        return super().__getitem__(address)
+
+    def __setitem__(self, address, value):
+        if isinstance(address, Polynomial):
+            raise SymbolicBranch(None, address)
+        super().__setitem__(address, value)
+
+
+def is_opaque(name):
+    # True for the symbols that stand in for reads through symbolic addresses
+    return name.startswith("memory[")
+
+
+class SymbolicComputer(IntcodeComputer):
+    # Intcode computer whose memory and inputs can hold symbolic values. symbols is a dictionary of {address: name}, the
+    # symbols are written into memory every time the computer is reset, and input() takes symbols as well as numbers.
+    # Always runs on the interpreter with unbounded memory. run() raises SymbolicBranch when the program needs to know
+    # the value of a symbol, with the computer left on the instruction that raised it
+    memory_class = SymbolicMemory
+
+    def __init__(self, software=[], symbols=None, verbose=False):
+        self._symbols = dict(symbols or {})
+        super().__init__(software, verbose, engine="interpreter", overflow="unbounded")
+
+    def reset(self):
+        super().reset()
+        for address, name in self._symbols.items():
+            self._memory[address] = symbol(name)
+
+    def input(self, input):
+        self._input_buffer.append(input if isinstance(input, Polynomial) else int(input))
+
+    def cycle(self):
+        pc = self._pc
+        try:
+            super().cycle()
+        except SymbolicBranch as branch:
+            # nothing is written before the symbolic value is found so the instruction can be run again once it's known
+            self._pc = pc
+            raise SymbolicBranch(pc, branch.value) from None
+
+    def _pull_instruction(self):
+        self._concrete(self._memory[self._pc])  # an instruction built from a symbol could be any opcode
+        return super()._pull_instruction()
+
+    def _op_input(self):
+        self._concrete(self._registers[0])  # check before the input is taken off the buffer
+        super()._op_input()
+
+    def _op_set_relative_offest(self):
+        self._relative_offset += self._concrete(self._memory[self._registers[0]])
+
+    def _concrete(self, value):
+        if isinstance(value, Polynomial):
+            raise SymbolicBranch(self._pc, value)
+        return value
+
+    @property
+    def symbols(self):
+        return dict(self._symbols)
+
+
+def solve(polynomial, target, domains):
+    # yields every assignment {symbol: value} with each value taken from domains[symbol] that makes the polynomial equal
+    # target. Every symbol but one is enumerated, the last one is solved for directly when the polynomial is linear in it
+    names = list(domains)
+    difference = polynomial - target
+    linear = [name for name in names if is_symbolic(difference) and difference.degree(name) == 1]
+    solved = max(linear, key=lambda name: len(domains[name]), default=None)
+    enumerated = [name for name in names if name != solved]
+    for values in itertools.product(*(domains[name] for name in enumerated)):
+        assignment = dict(zip(enumerated, values))
+        residual = difference.substitute(assignment) if is_symbolic(difference) else difference
+        if solved is None:
+            if residual == 0:
+                yield assignment
+        elif not is_symbolic(residual):
+            if residual == 0:
+                for value in domains[solved]:
+                    yield {**assignment, solved: value}
+        else:
+            # what's left is slope * solved + intercept
+            terms = residual.terms
+            slope, intercept = terms[((solved, 1),)], terms.get((), 0)
+            if -intercept % slope == 0 and -intercept // slope in domains[solved]:
+                yield {**assignment, solved: -intercept // slope}
+
+
+def solve_memory(software, symbols, address, target, processes=None):
+    # finds values for the memory cells in symbols ({address: (name, possible values)}) that leave target in memory[address]
+    # once the software halts, returns {name: value} or None if no combination works. The software is run once
+    # symbolically, if its control flow depends on one of the symbols every combination is run concretely instead
+    computer = SymbolicComputer(software, {cell: name for cell, (name, _) in symbols.items()})
+    domains = {name: values for name, values in symbols.values()}
+    try:
+        computer.run()
+    except SymbolicBranch:
+        return _search(software, symbols, address, target, processes)
+    result = computer.memory[address]
+    if not computer.program_finished or is_symbolic(result) and any(map(is_opaque, result.symbols)):
+        return _search(software, symbols, address, target, processes)
+    return next(solve(result, target, domains), None)
+
+
+def _search(software, symbols, address, target, processes):
+    # concrete fallback, runs every combination of values across a pool of processes
+    names = [name for name, _ in symbols.values()]
+    combinations = list(itertools.product(*(values for _, values in symbols.values())))
+
+    def check_result(result):
+        if result.program_finished and result.memory[address] == target:
+            return dict(zip(names, combinations[result.index]))
+
+    return sweep.run_many(software, [()] * len(combinations), check_result,
+                          memory_patches=[dict(zip(symbols, values)) for values in combinations],
+                          read_memory=[address], processes=processes)
@@ -0,0 +1,267 @@
+import mmap
+import pickle
+import struct
+import numpy as np
+
+try:
+    from .intcode import IntcodeComputer, ComputerSnapshot
+    from .memory import MemorySnapshot
+    from .disassembler import WRITTEN_PARAMETER
+except ImportError:  # allow the module to be imported directly from within common_dependencies
+    from intcode import IntcodeComputer, ComputerSnapshot
+    from memory import MemorySnapshot
+    from disassembler import WRITTEN_PARAMETER
+
+# A trace is two files. The trace file itself is a fixed size header followed by one fixed size record for every
+# instruction executed, it's written through a memory map that's grown as the trace gets longer. The checkpoint file
+# next to it (same path with ".checkpoints" added) holds pickled copies of the computer's state taken every
+# checkpoint_interval instructions and whenever the state was changed outside of a traced run (a restore(), a write to
+# memory, a reset), followed by an index of those checkpoints that's written when the recorder is closed.
+# Replaying to any step loads the closest checkpoint before it and applies the writes recorded since, the program
+# itself is never executed.
+MAGIC = b"INTTRACE"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")  # magic, version, record size, number of records, offset of the checkpoint index
+RECORD = struct.Struct("<qqqBB")  # pc, address, value, opcode, flags
+RECORD_DTYPE = np.dtype([("pc", "<i8"), ("address", "<i8"), ("value", "<i8"), ("opcode", "u1"), ("flags", "u1")])
+
+# record flags
+WROTE = 1  # the instruction wrote value to address
+INPUT = 2  # the value written was read from the input buffer
+OUTPUT = 4  # the instruction output value
+OFFSET = 8  # the instruction set the relative offset to value
+
+INITIAL_RECORDS = 1 << 16  # how many records the trace file has room for before it's first grown
+
+
+class TraceRecord():
+    def __init__(self, pc, address, value, opcode, flags):
+        self.pc = pc  # address of the instruction
+        self.address = address  # address written to, only meaningful if wrote is set
+        self.value = value  # value written, output or the new relative offset depending on the flags
+        self.opcode = opcode
+        self.flags = flags
+
+    @property
+    def wrote(self):
+        return bool(self.flags & WROTE)
+
+    @property
+    def input(self):
+        return bool(self.flags & INPUT)
+
+    @property
+    def output(self):
+        return bool(self.flags & OUTPUT)
+
+    def __repr__(self):
+        return "TraceRecord(pc={}, opcode={}, address={}, value={}, flags={})".format(self.pc, self.opcode,
+                                                                                     self.address, self.value,
+                                                                                     self.flags)
+
+
+class TraceRecorder():
+    # Records every instruction a computer executes into a binary trace file. Creating the recorder attaches it to the
+    # computer, which runs on the interpreter until close() is called. Values have to fit in 64 bits, so computers
+    # using the "unbounded" overflow policy can only be traced while their values stay in range
+    def __init__(self, computer, path, checkpoint_interval=10000):
+        self._computer = computer
+        self._path = path
+        self._checkpoint_interval = checkpoint_interval
+        self._file = open(path, "w+b")
+        self._file.truncate(HEADER.size + INITIAL_RECORDS * RECORD.size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._capacity = INITIAL_RECORDS  # records that fit in the file before it has to grow
+        self._n_records = 0
+        self._checkpoint_file = open(path + ".checkpoints", "wb")
+        self._checkpoints = []  # (step, offset in the checkpoint file) of every checkpoint written
+        self._next_checkpoint = 0  # step the next periodic checkpoint is due at
+        self._expected = None  # (pc, relative offset, cycle count, memory snapshot) when the last traced run ended
+        computer._tracer = self
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def n_records(self):
+        return self._n_records
+
+    @property
+    def checkpoints(self):
+        # steps the replayer can start from
+        return [step for step, offset in self._checkpoints]
+
+    def begin(self, computer):
+        # called when a traced run starts, checkpoints the computer if its state was changed since the last run ended
+        expected = self._expected
+        if expected is None or expected[:3] != (computer._pc, computer._relative_offset, computer._cycle_count):
+            self._checkpoint(computer)
+            return
+        pages, expected_pages = computer._memory._pages, expected[3].pages
+        if len(pages) != len(expected_pages) or \
+                any(pages.get(page_number) is not page for page_number, page in expected_pages.items()):
+            self._checkpoint(computer)
+
+    def end(self, computer):
+        # called when a traced run stops. Snapshotting memory makes every page copy on write again, so anything that
+        # writes to memory before the next run replaces the page and shows up as a changed page table in begin()
+        self._expected = (computer._pc, computer._relative_offset, computer._cycle_count, computer._memory.snapshot())
+
+    def record(self, computer, pc, word):
+        # records the instruction word at pc that the computer just executed
+        opcode = word % 100
+        address = value = flags = 0
+        written = WRITTEN_PARAMETER.get(opcode)
+        if written is not None:
+            address = int(computer._registers[written])
+            value = computer._memory[address]
+            flags = WROTE | INPUT if opcode == 3 else WROTE
+        elif opcode == 4:
+            if computer._output_sink is None:
+                value = computer._output_buffer[-1]
+            else:
+                value = computer._memory[int(computer._registers[0])]  # the value went straight to the sink
+            flags = OUTPUT
+        elif opcode == 9:
+            value = computer._relative_offset
+            flags = OFFSET
+        if self._n_records == self._capacity:
+            self._grow()
+        RECORD.pack_into(self._map, HEADER.size + self._n_records * RECORD.size, pc, address, value, opcode, flags)
+        self._n_records += 1
+        if self._n_records >= self._next_checkpoint:
+            self._checkpoint(computer)
+
+    def _grow(self):
+        # doubles the room in the trace file
+        self._capacity *= 2
+        self._map.resize(HEADER.size + self._capacity * RECORD.size)
+
+    def _checkpoint(self, computer):
+        # writes the state of the computer before the next record is executed to the checkpoint file, only the pages
+        # that differ from the program image are stored
+        memory = computer._memory
+        pages = {page_number: memory._pages[page_number] for page_number in memory._dirty}
+        self._checkpoints.append((self._n_records, self._checkpoint_file.tell()))
+        pickle.dump((computer._pc, computer._relative_offset, computer._cycle_count, computer._program_finished, pages),
+                    self._checkpoint_file, pickle.HIGHEST_PROTOCOL)
+        self._next_checkpoint = self._n_records + self._checkpoint_interval
+
+    def close(self):
+        # detaches from the computer, writes the checkpoint index and trims the trace file to the records written
+        computer = self._computer
+        if computer._tracer is self:
+            computer._tracer = None
+        self.begin(computer)  # the state the trace ends in has to be reachable even if it was changed after the last run
+        index_offset = self._checkpoint_file.tell()
+        pickle.dump({"software": np.array(computer.memory.image), "overflow": computer.overflow,
+                     "checkpoints": self._checkpoints,
+                     "final": (computer._pc, computer._program_finished)},
+                    self._checkpoint_file, pickle.HIGHEST_PROTOCOL)
+        self._checkpoint_file.close()
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size, self._n_records, index_offset)
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(HEADER.size + self._n_records * RECORD.size)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TraceReplayer():
+    # Reads a trace written by TraceRecorder. A step is the position of a record in the trace, it's the same as the
+    # computer's cycle count unless the computer was reset or restored to an earlier snapshot while it was traced
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self._n_records, index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError("{} is not a version {} intcode trace".format(path, VERSION))
+        self._records = np.frombuffer(self._map, dtype=RECORD_DTYPE, count=self._n_records, offset=HEADER.size)
+        self._checkpoint_file = open(path + ".checkpoints", "rb")
+        self._checkpoint_file.seek(index_offset)
+        index = pickle.load(self._checkpoint_file)
+        self._software = index["software"]
+        self._overflow = index["overflow"]
+        self._checkpoints = index["checkpoints"]
+        self._checkpoint_steps = np.array([step for step, offset in self._checkpoints], dtype=np.int64)
+        self._final = index["final"]
+
+    def __len__(self):
+        return self._n_records
+
+    def __getitem__(self, step):
+        pc, address, value, opcode, flags = self._records[step].tolist()
+        return TraceRecord(pc, address, value, opcode, flags)
+
+    @property
+    def records(self):
+        # numpy structured array of every record, it's a read only view of the trace file
+        return self._records
+
+    @property
+    def checkpoints(self):
+        return self._checkpoint_steps.tolist()
+
+    def outputs(self, start=0, stop=None):
+        # values output between two steps
+        records = self._records[start:stop]
+        return records["value"][records["flags"] & OUTPUT != 0].tolist()
+
+    def inputs(self, start=0, stop=None):
+        # values read from the input buffer between two steps
+        records = self._records[start:stop]
+        return records["value"][records["flags"] & INPUT != 0].tolist()
+
+    def seek(self, step, computer=None):
+        # returns a computer in the state it was in just before the instruction at step was executed (step can be
+        # len(trace) for the state the trace ended in). The state is rebuilt from the closest checkpoint at or before
+        # step by applying the memory writes and relative offset changes recorded since then. A computer that was
+        # created for the traced software can be passed in to have the state loaded into it instead of a new one
+        if not 0 <= step <= self._n_records:
+            raise IndexError("step {} is outside of the trace, which has {} records".format(step, self._n_records))
+        if computer is None:
+            computer = IntcodeComputer(self._software, engine="interpreter", overflow=self._overflow)
+        checkpoint = int(np.searchsorted(self._checkpoint_steps, step, side="right")) - 1
+        start, offset = self._checkpoints[checkpoint]
+        self._checkpoint_file.seek(offset)
+        pc, relative_offset, cycle_count, program_finished, pages = pickle.load(self._checkpoint_file)
+
+        computer.reset()
+        memory_snapshot = computer.memory.snapshot()
+        memory_snapshot.pages.update(pages)
+        computer.restore(ComputerSnapshot(MemorySnapshot(memory_snapshot.pages, frozenset(pages)), pc,
+                                          relative_offset, True, program_finished, cycle_count, (), ()))
+
+        memory = computer.memory
+        for address, value, flags in self._records[start:step][["address", "value", "flags"]].tolist():
+            if flags & WROTE:
+                memory[address] = value
+            elif flags & OFFSET:
+                relative_offset = value
+        if step > start:
+            computer._relative_offset = relative_offset
+            computer._cycle_count = cycle_count + step - start
+            if step < self._n_records:
+                computer._pc = int(self._records[step]["pc"])
+                computer._program_finished = False
+            else:
+                computer._pc, computer._program_finished = self._final
+        return computer
+
+    def close(self):
+        self._records = None  # the view has to be released before the map can be closed
+        self._map.close()
+        self._file.close()
+        self._checkpoint_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,4 +1,5 @@
 import common_dependencies.intcode as intcode
+import common_dependencies.programs as programs
 import numpy as np
 from pathlib import Path
 import math
@@ -27,6 +28,38 @@ class PaintBot(intcode.IntcodeComputer):
             #turn left by applying a -90 degree rotation matrix
             self._direction=self._m_rotn90.dot(self._direction)
 
+    def paint(self,paint_history):
+        # runs the painting program to the end in a single run() call. The camera is an input provider that reads the
+        # color under the bot from paint_history, and each color and turn the program outputs go to an output sink that
+        # paints the tile and moves the bot. Returns the number of times the camera looked at an unpainted tile
+        unpainted_reads=[0]
+        pending_outputs=[]
+
+        def camera(computer):
+            try:
+                return paint_history[self.encoded_position]  #get the color of the current tile
+            except KeyError:
+                unpainted_reads[0]+=1  #this is an unpainted tile, which reads as black
+                return 0
+
+        def paint_and_move(value):
+            pending_outputs.append(value)
+            if len(pending_outputs)==2:  #the program outputs the new color and then which way to turn
+                new_color,turn_direction=pending_outputs
+                pending_outputs.clear()
+                paint_history[self.encoded_position]=new_color
+                self.turn(turn_direction)
+                self.move()
+
+        self.set_input_provider(camera)
+        self.set_output_sink(paint_and_move)
+        try:
+            self.run()
+        finally:
+            self.set_input_provider(None)
+            self.set_output_sink(None)
+        return unpainted_reads[0]
+
     @property
     def position(self):
         return self._position
@@ -40,21 +73,7 @@ class PaintBot(intcode.IntcodeComputer):
 
 def puzzle_part_a(bot):
     paint_history = {}  # empty dictionary object that keeps track of the bots coordinates, the keys are 6 digits where the first 3 are x val and second 3 are y val
-    tiles_painted=0
-    while not bot.program_finished: #while the programs not finished
-        camera_input=0
-        try:
-            camera_input=paint_history[bot.encoded_position]  #get the color of the current tile, default to white
-        except KeyError:
-            # if there's a key error this is an unpainted tile and we need to increment the counter
-            tiles_painted += 1
-        bot.input(camera_input) #provide input to the software
-        bot.resume() #resume the software
-        new_color,turn_direction=bot.flush_output()
-        #print("tile {} was painted {}".format(bot.position,new_color))
-        paint_history[bot.encoded_position]=new_color
-        bot.turn(turn_direction)
-        bot.move()
+    tiles_painted=bot.paint(paint_history)  # every tile the camera saw unpainted gets painted
     print("{} tiles in total were painted".format(tiles_painted))
 
 def decode_coordinate(coordinate):
@@ -66,21 +85,7 @@ def decode_coordinate(coordinate):
 def puzzle_part_b(bot):
     bot.reset()
     paint_history = {"000000":1}  # empty dictionary object that keeps track of the bots coordinates, the keys are 6 digits where the first 3 are x val and second 3 are y val
-    tiles_painted = 1
-    while not bot.program_finished:  # while the programs not finished
-        camera_input = 0
-        try:
-            camera_input = paint_history[bot.encoded_position]  # get the color of the current tile, default to white
-        except KeyError:
-            # if there's a key error this is an unpainted tile and we need to increment the counter
-            tiles_painted += 1
-        bot.input(camera_input)  # provide input to the software
-        bot.resume()  # resume the software
-        new_color, turn_direction = bot.flush_output()
-        # print("tile {} was painted {}".format(bot.position,new_color))
-        paint_history[bot.encoded_position] = new_color
-        bot.turn(turn_direction)
-        bot.move()
+    tiles_painted = 1+bot.paint(paint_history)
     coords=[]
     values=[]
     for coordinate in list(paint_history.keys()):
@@ -95,7 +100,7 @@ def puzzle_part_b(bot):
 def main():
     bot=PaintBot()  #initialize teh paint bot
     input_path = Path("puzzle_inputs") / "day11_input.txt"
-    program = np.loadtxt(input_path, delimiter=",", dtype=np.int64)
+    program = programs.load_program(input_path)
     bot.load_memory(program)
     puzzle_part_a(bot)
     puzzle_part_b(bot)
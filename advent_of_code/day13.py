@@ -1,6 +1,7 @@
 import numpy as np
 from pathlib import Path
 import common_dependencies.intcode as intcode
+import common_dependencies.programs as programs
 from enum import Enum
 
 class Vector():
@@ -61,9 +62,34 @@ class ArcadeCabinet(intcode.IntcodeComputer):
         super().__init__(memory,verbose)  # initialize the computer core
 
     def update(self):
-        self.resume()  # advance the computer until it's done running
+        self._draw(self.outputs())  # advance the computer lazily, it runs until it's done or waiting for the joystick
+
+    def play(self, joystick, checkpointer=None):
+        # plays the game to the end in a single run() call. The joystick is an input provider: whenever the game waits
+        # for it the screen is drawn from what the game output since the last move and joystick(cabinet) gives the next
+        # position. An optional CheckpointWriter saves the game while it's waiting on the joystick. Returns the number
+        # of times the screen was drawn
+        screen_updates = [0]
+
+        def read_joystick(computer):
+            if checkpointer is not None:
+                checkpointer.maybe_save()  # saved before the outputs are taken so a loaded game redraws them
+            self._draw(self.flush_output())
+            screen_updates[0] += 1
+            return joystick(self)
+
+        self.set_input_provider(read_joystick)
+        try:
+            self.run()
+        finally:
+            self.set_input_provider(None)
+        self._draw(self.flush_output())  # the last frame, drawn once the game is over
+        return screen_updates[0] + 1
+
+    def _draw(self, outputs):
         self._screen_buffer = []
-        for packet in np.array(self.flush_output()).reshape((-1, 3)):  # load the screen buffer with the computer output
+        outputs = iter(outputs)
+        for packet in zip(outputs, outputs, outputs):  # load the screen buffer with the computer output, 3 at a time
             if packet[0] == -1:  # if we got the score output
                 self._score = packet[2]
             else:
@@ -128,31 +154,32 @@ def puzzle_part_a(cabinet):
     print("There are {} blocks in the screen buffer".format(n_blocks))
 
 
-def puzzle_part_b(cabinet):
+def joystick_position(cabinet):
+    paddle_distance=(cabinet.ball_position-cabinet.paddle_position).x
+    ball_direction=cabinet.ball_velocity.x
+    joystick_input=0
+    if paddle_distance!=0 and ball_direction!=0:  #if we are not directly under the paddle and the ball is moving, move towards it
+        joystick_input=np.sign(paddle_distance)
+    else:
+        #if we're under the ball move in the same direction as it
+        joystick_input=ball_direction
+    return joystick_input
+
+
+def puzzle_part_b(cabinet, checkpointer=None, resume=False):
+    # an optional CheckpointWriter saves the game every few seconds, pass resume=True to carry on a game loaded from a
+    # checkpoint instead of starting a new one
     print("Running Part B")
-    cabinet.reset()  # reset the computer
-    total_steps=0
-    while not cabinet.program_finished:
-        cabinet.update()
-        total_steps+=1
-        paddle_distance=(cabinet.ball_position-cabinet.paddle_position).x
-        ball_direction=cabinet.ball_velocity.x
-        joystick_input=0
-        if paddle_distance!=0 and ball_direction!=0:  #if we are not directly under the paddle and the ball is moving, move towards it
-            joystick_input=np.sign(paddle_distance)
-        else:
-            #if we're under the ball move in the same direction as it
-            joystick_input=ball_direction
-        cabinet.input(joystick_input)  # don't do anything with the joystick
-        #cabinet.print_summary()
-        #cabinet.draw_screen()
+    if not resume:
+        cabinet.reset()  # reset the computer
+    total_steps=cabinet.play(joystick_position, checkpointer)
     print(total_steps)
     cabinet.draw_screen()
 
 
 def main():
     puzzle_input_path = Path("puzzle_inputs") / "day13_input.txt"
-    int_code = np.loadtxt(puzzle_input_path, delimiter=",")
+    int_code = programs.load_program(puzzle_input_path)
     int_code[0] = 2  # put in two quarters to play the game
     cabinet = ArcadeCabinet(int_code, verbose=False)
     puzzle_part_a(cabinet)
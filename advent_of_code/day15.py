@@ -1,4 +1,5 @@
 import common_dependencies.intcode as intcode
+import common_dependencies.programs as programs
 import numpy as np
 from collections import defaultdict
 from pathlib import Path
@@ -67,7 +68,7 @@ class RepairDroid(intcode.IntcodeComputer):
 
     def reset(self):
         self._canister_position = None
-        self._history = []  # history is a list of all the choices sent to the droid
+        self._history = []  # history is a list of all the choices sent to the droid and the computer state before each
         self._map = defaultdict(int)  # initialize the droids map which records all explored areas
         self._map[(0, 0)] = 1  # the value of the map at the origin must be 0 because the robot is there
         self._v_map = [[" "] * (2 * self._map_bounds + 1) for _ in
@@ -79,6 +80,7 @@ class RepairDroid(intcode.IntcodeComputer):
 
     def move(self, move_direction):
         input = direction[move_direction][0]
+        snapshot = self.snapshot()  # save the state of the droid's computer so the move can be undone when backtracking
         self.input(input)  # input the direction to move
         self.resume()  # run the software
         droid_response = int(self.flush_output()[0])  # need to typecast to int
@@ -87,7 +89,7 @@ class RepairDroid(intcode.IntcodeComputer):
         self._update_visual_map(new_position, map_visualization[droid_response])
         if droid_response != 0:
             self._position = new_position  # update the position if we didn't hit a wall
-            self._history.append(move_direction)  # update the position onto the move direction stack
+            self._history.append((move_direction, snapshot))  # push the move and the state before it onto the stack
         if self._c_verbose:
             print("Attempting to move {}({}) received response {}. new position={}".format(move_direction, input,
                                                                                            droid_response,
@@ -95,16 +97,12 @@ class RepairDroid(intcode.IntcodeComputer):
 
     def backtrack(self):
         # back track the droid to a previous cell, don't need to update map or process response
-        backtrack_direction = reverse_direction[self._history.pop(-1)]  # pop a value off the stack
-        input = direction[backtrack_direction][0]
-        self.input(input)  # input the direction to move
-        self.resume()  # run the software
+        # instead of sending the reverse move to the droid, restore the computer to the state it was in before the move
+        move_direction, snapshot = self._history.pop(-1)  # pop a value off the stack
+        backtrack_direction = reverse_direction[move_direction]
+        self.restore(snapshot)
         new_position = add_tuple(self._position, direction[backtrack_direction][1])
         self._position = new_position  # update the droids position
-        response = self.flush_output()[0]
-        if response == 0:
-            # if we didn't backtrack into open space raise an error
-            raise ValueError("Droid Backtracked into a wall")
         if self._c_verbose:
             print("No valid options to explore, backtracking {}".format(backtrack_direction))
 
@@ -122,9 +120,12 @@ class RepairDroid(intcode.IntcodeComputer):
             for coord in unexplored_coordinates]
         return unexplored_directions
 
-    def explore(self):
-        # explore the map and return when the droid has found the O2 canister
+    def explore(self, checkpointer=None):
+        # explore the map and return when the droid has found the O2 canister. An optional CheckpointWriter saves the
+        # droid every few seconds so a long exploration can be picked up again with checkpoint.load_checkpoint()
         while True:  # loop until we throw an error trying to backtrack
+            if checkpointer is not None:
+                checkpointer.maybe_save()
             if self._map[self._position] == 2:  # if we found the canister record it
                 self._canister_position = self._position
             unexplored_directions = self.find_unexplored_adjacencies()
@@ -164,7 +165,7 @@ class RepairDroid(intcode.IntcodeComputer):
 def generate_map():
     # generate the map and put it into a json file
     puzzle_input_path = Path("puzzle_inputs") / "day15_input.txt"
-    int_code = np.loadtxt(puzzle_input_path, delimiter=",")
+    int_code = programs.load_program(puzzle_input_path)
     droid = RepairDroid(int_code, verbose=False)
     droid.explore()
     droid.draw_map()
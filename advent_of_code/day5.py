@@ -1,31 +1,41 @@
-import numpy as np
 from pathlib import Path
 import common_dependencies.intcode as intcode
+import common_dependencies.programs as programs
+import common_dependencies.result_cache as result_cache
 
-def display_output(computer):
+def display_output(outputs):
     print("Output:")
-    [print(output) for output in computer.flush_output()]
+    [print(output) for output in outputs]
 
-def puzzle_part_a(computer):
+def puzzle_part_a(computer, cache=None):
     # Part A of the puzzle
+    if cache is not None:
+        display_output(cache.run_computer(computer,[1]).outputs)    # the diagnostic is a pure run of the program
+        return
     computer.input(1)
     computer.run()
-    display_output(computer)
+    display_output(computer.flush_output())
 
-def puzzle_part_b(computer):
+def puzzle_part_b(computer, cache=None):
+    if cache is not None:
+        display_output(cache.run_computer(computer,[5]).outputs)
+        return
     computer.input(5)   #input 5 this time
     computer.run()
-    display_output(computer)
+    display_output(computer.flush_output())
 
 def main():
     #load int code from file
     puzzle_input_path=Path("puzzle_inputs") / "day5_input.txt"
-    int_code=np.loadtxt(puzzle_input_path, delimiter=",",dtype=int)
+    int_code=programs.load_program(puzzle_input_path)
     computer=intcode.IntcodeComputer(int_code,verbose=False)
+    cache=result_cache.from_environment()   # with INTCODE_RESULT_CACHE=1 repeated runs of the diagnostics come from disk
 
-    puzzle_part_a(computer) #run the first part of the puzzle
+    puzzle_part_a(computer,cache) #run the first part of the puzzle
     computer.load_memory(int_code)  # reload memory
-    puzzle_part_b(computer) #run the second part of the puzzle
+    puzzle_part_b(computer,cache) #run the second part of the puzzle
+    if cache is not None:
+        print("Result cache: {}".format(cache.stats))
 
 
 
@@ -1,24 +1,36 @@
-import common_dependencies.intcode as intcode
-import numpy as np
+import common_dependencies.async_intcode as async_intcode
+import common_dependencies.programs as programs
+import common_dependencies.result_cache as result_cache
 from pathlib import Path
 import itertools
+import asyncio
 
 
 class Amplifier_array():
-    def __init__(self, n_amps, program=[]):
-        self._amps = [intcode.IntcodeComputer(program) for _ in range(n_amps)]
+    def __init__(self, n_amps, program=[], cache=None):
+        self._amps = [async_intcode.AsyncIntcodeComputer(program) for _ in range(n_amps)]
+        self._program = program
+        self._phases = []
+        self._cache = cache  # optional ResultCache, without feedback each amp is a pure run of (phase, signal)
 
     def load_software(self, program):
+        self._program = program
         [self._amps[j].load_memory(program) for j in range(len(self._amps))]
 
     def reset(self):
         [self._amps[j].reset() for j in range(len(self._amps))]
 
     def set_phases(self, phase_array):
+        self._phases = list(phase_array)
         [self._amps[j].input(phase_array[j]) for j in range(len(self._amps))]
 
     def run(self):
         amplifier_input=0
+        if self._cache is not None:
+            # the amps only run on a cache miss, run_computer() resets them and feeds in the phase as well
+            for amp,phase in zip(self._amps,self._phases):
+                amplifier_input=self._cache.run_computer(amp,(phase,amplifier_input)).outputs[-1]
+            return amplifier_input
         for amp in self._amps:
             amp.input(amplifier_input)  #provide input to the amp
             amp.run()   # run until the program terminates
@@ -26,17 +38,14 @@ class Amplifier_array():
         return amplifier_input  #the input going to the thruster is the output of the final amplifer
 
     def run_with_feedback(self):
-        amplifier_input = 0
-        thruster_input = 0
-        try:
-            while True:
-                for amp in self._amps:
-                    amp.input(amplifier_input)  # provide input to the amp
-                    amp.resume()  # run until the program stops
-                    amplifier_input = amp.flush_output()[-1]  # the input for the next amp is the output of the previous amp
-                thruster_input=amplifier_input  #the thruster input is the value coming from the final amp
-        except IndexError: # Continue to loop until an amplifier stops providing output
-            return thruster_input
+        # connect the amps in a ring and run them together until they halt
+        return asyncio.run(self._run_feedback_loop())
+
+    async def _run_feedback_loop(self):
+        channels = async_intcode.connect(self._amps, loop=True)  # channels[0] carries the final amp's output to the first
+        channels[0].put_nowait(0)  # the first amp starts with a signal of 0
+        await async_intcode.run_network(self._amps)
+        return channels[0].last_value  # the thruster input is the last value from the final amplifier
 
 
 
@@ -66,10 +75,13 @@ def puzzle_part_b(amps):
 
 def main():
     input_path = Path("puzzle_inputs") / "day7_input.txt"
-    amp_software = np.loadtxt(input_path, delimiter=",", dtype=int)
-    amps = Amplifier_array(5,amp_software)
+    amp_software = programs.load_program(input_path)
+    cache = result_cache.from_environment()  # only with INTCODE_RESULT_CACHE=1
+    amps = Amplifier_array(5,amp_software,cache)
     puzzle_part_a(amps)
     puzzle_part_b(amps)
+    if cache is not None:
+        print("Result cache: {}".format(cache.stats))
 
 
 if __name__ == "__main__":
@@ -1,17 +1,25 @@
-import numpy as np
 from pathlib import Path
 import common_dependencies.intcode as intcode
+import common_dependencies.programs as programs
+import common_dependencies.result_cache as result_cache
 
 
 def main():
     input_path = Path("puzzle_inputs") / "day9_input.txt"
-    program = np.loadtxt(input_path, delimiter=",", dtype=np.int64)
-    computer=intcode.IntcodeComputer(program,verbose=False)
-    computer.input(2)
+    program = programs.load_program(input_path)
+    computer = intcode.IntcodeComputer(program, verbose=False)
+    cache = result_cache.from_environment()  # with INTCODE_RESULT_CACHE=1 the BOOST run can come from disk
     print("Running Program")
-    computer.run()
+    if cache is not None:
+        outputs = cache.run_computer(computer, [2]).outputs
+    else:
+        computer.input(2)
+        computer.run()
+        outputs = computer.flush_output()
     print("Complete!")
-    print(computer.flush_output())
+    print(outputs)
+    if cache is not None:
+        print("Result cache: {}".format(cache.stats))
 
 
 